@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+Standalone Telegram bot runner
+Runs the bot and the singleton background jobs (watch alerts, cache
+pre-warming, query log archiving) without the HTTP API, on the same lookup
+core as server.py. Start as many as you like: they elect one active runner
+through the BOT_LEASE_NAME lease in Mongo and the rest wait as hot standbys.
+
+Run the API tier with BOT_RUNNER=external so its workers leave the bot alone:
+
+    BOT_RUNNER=external uvicorn server:app --workers 4
+    python bot_worker.py
+
+In webhook mode Telegram still posts to the API tier, whose workers process
+updates; the runner only registers the webhook and runs the background jobs.
+"""
+
+import asyncio
+import signal
+
+import server
+
+
+async def main():
+    await server.start_core()
+    server.bot_lease.start(server.start_leader_duties, server.stop_leader_duties)
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+    await stopping.wait()
+
+    # Releasing the lease lets a standby take over without waiting for expiry
+    await server.bot_lease.stop()
+    await server.stop_telegram_bot()
+    await server.stop_core()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
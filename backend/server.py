@@ -1,30 +1,321 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Request, BackgroundTasks
+from fastapi import FastAPI, APIRouter, HTTPException, Request, BackgroundTasks, Depends, Header, Query
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from fastapi.encoders import jsonable_encoder
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
+import re
+import json
+import base64
+import math
+import hashlib
+import hmac
+import heapq
+import random
+import itertools
 import logging
 from pathlib import Path
+from abc import ABC, abstractmethod
 from pydantic import BaseModel, Field, ConfigDict
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Set
 import uuid
-from datetime import datetime, timezone
+import time
+import bisect
+import threading
+import socket
+import ipaddress
+from collections import OrderedDict, deque, Counter
+from contextlib import asynccontextmanager, nullcontext
+from functools import lru_cache, wraps
+import idna
+from pymongo import UpdateOne, ReturnDocument, monitoring
+from pymongo.errors import OperationFailure, DuplicateKeyError
+from bson import ObjectId
+from datetime import datetime, timezone, timedelta
 import httpx
 from telegram import Update, Bot, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, CallbackQueryHandler, ContextTypes
+from telegram.ext import Application, CommandHandler, MessageHandler, filters, CallbackQueryHandler, ContextTypes, TypeHandler
+from telegram.request import HTTPXRequest
 import asyncio
+import csv
+import io
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# Metrics: a minimal Prometheus registry. Instruments update plain lists and
+# dicts in place under a per-metric lock, since Mongo driver events arrive on
+# Motor's worker threads; the text exposition is only built when /api/metrics
+# is scraped.
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+METRIC_LABEL_ESCAPES = str.maketrans({'\\': '\\\\', '"': '\\"', '\n': '\\n'})
+
+def metric_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{str(value).translate(METRIC_LABEL_ESCAPES)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class CounterMetric:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values: Dict[tuple, float] = {}
+        # Also updated off the event loop, from Mongo driver events on Motor's worker threads
+        self.lock = threading.Lock()
+
+    def inc(self, *labels: Any, value: float = 1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + value
+
+    def set(self, value: float, *labels: Any):
+        """Mirror a count another component already keeps"""
+        with self.lock:
+            self.values[labels] = value
+
+    def render(self) -> List[str]:
+        with self.lock:
+            values = list(self.values.items())
+        return [f"{self.name}{metric_labels(self.labels, key)} {value}" for key, value in values]
+
+class GaugeMetric(CounterMetric):
+    kind = "gauge"
+
+    def dec(self, *labels: Any, value: float = 1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) - value
+
+class HistogramMetric:
+    """Fixed-bucket histogram; each series is [per-bucket counts..., +Inf count, sum]"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.series: Dict[tuple, List[float]] = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, *labels: Any):
+        bucket = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [0] * (len(self.buckets) + 2)
+            series[bucket] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        with self.lock:
+            snapshot = [(key, list(series)) for key, series in self.series.items()]
+        lines = []
+        for key, series in snapshot:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{metric_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{metric_labels(self.labels, key)} {series[-1]}")
+            lines.append(f"{self.name}_count{metric_labels(self.labels, key)} {cumulative}")
+        return lines
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: List[Any] = []
+        self.collectors: List[Any] = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str, labels: tuple = ()) -> CounterMetric:
+        return self.register(CounterMetric(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: tuple = ()) -> GaugeMetric:
+        return self.register(GaugeMetric(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: tuple = ()) -> HistogramMetric:
+        return self.register(HistogramMetric(name, help, labels))
+
+    def collector(self, func):
+        """Run `func` before each scrape to copy counters other components keep"""
+        self.collectors.append(func)
+        return func
+
+    def render(self) -> str:
+        for collect in self.collectors:
+            collect()
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
+upstream_latency = metrics.histogram("whoisbot_upstream_seconds", "WHOIS provider lookup latency", ("provider", "outcome"))
+mongo_latency = metrics.histogram("whoisbot_mongo_command_seconds", "MongoDB command latency", ("command",))
+command_latency = metrics.histogram("whoisbot_bot_command_seconds", "Bot command handler latency", ("command",))
+telegram_latency = metrics.histogram("whoisbot_telegram_api_seconds", "Telegram Bot API call latency", ("method",))
+http_latency = metrics.histogram("whoisbot_http_request_seconds", "HTTP API request latency", ("route",))
+errors_total = metrics.counter("whoisbot_errors_total", "Errors by component", ("component", "kind"))
+cache_events = metrics.counter("whoisbot_cache_events_total", "Cache lookups by outcome", ("cache", "outcome"))
+in_flight = metrics.gauge("whoisbot_in_flight", "Work currently in progress", ("scope",))
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Driver command events into the Mongo latency histogram.
+
+    Motor runs the driver on worker threads; the metrics lock their own updates.
+    """
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        mongo_latency.observe(event.duration_micros / 1e6, event.command_name)
+
+    def failed(self, event):
+        mongo_latency.observe(event.duration_micros / 1e6, event.command_name)
+        errors_total.inc("mongo", event.command_name)
+
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, tz_aware=True, event_listeners=[MongoCommandMetrics()])
 db = client[os.environ['DB_NAME']]
 
 # Telegram Bot Token
 TELEGRAM_BOT_TOKEN = os.environ.get('TELEGRAM_BOT_TOKEN')
 WHOISFREAKS_API_KEY = os.environ.get('WHOISFREAKS_API_KEY')
+# Optional key pool: "key1:3,key2:1,key3" (weight defaults to 1)
+WHOISFREAKS_API_KEYS = os.environ.get('WHOISFREAKS_API_KEYS', '')
+WHOISFREAKS_KEY_STRATEGY = os.environ.get('WHOISFREAKS_KEY_STRATEGY', 'weighted')  # 'weighted' or 'least_used'
+WHOISFREAKS_KEY_BENCH_SECONDS = int(os.environ.get('WHOISFREAKS_KEY_BENCH_SECONDS', '60'))
+WHOISFREAKS_KEY_EXHAUSTED_BENCH_SECONDS = int(os.environ.get('WHOISFREAKS_KEY_EXHAUSTED_BENCH_SECONDS', '3600'))
+# Upstream base URLs, overridable so benchmarks can point at local stand-ins
+WHOISFREAKS_BASE_URL = os.environ.get('WHOISFREAKS_BASE_URL', 'https://api.whoisfreaks.com').rstrip('/')
+TELEGRAM_API_BASE_URL = os.environ.get('TELEGRAM_API_BASE_URL')  # e.g. http://127.0.0.1:8081/bot
+
+# Telegram update delivery: 'polling' for development, 'webhook' for production
+TELEGRAM_MODE = os.environ.get('TELEGRAM_MODE', 'polling')
+TELEGRAM_WEBHOOK_URL = os.environ.get('TELEGRAM_WEBHOOK_URL')  # public base URL, e.g. https://bot.example.com
+TELEGRAM_WEBHOOK_SECRET = os.environ.get('TELEGRAM_WEBHOOK_SECRET') or (
+    hashlib.sha256(TELEGRAM_BOT_TOKEN.encode()).hexdigest()[:32] if TELEGRAM_BOT_TOKEN else None
+)
+TELEGRAM_CONCURRENT_UPDATES = int(os.environ.get('TELEGRAM_CONCURRENT_UPDATES', '64'))
+
+# Where the bot runs: 'embedded' in this process (single worker only), 'elected'
+# by every API worker competing for a Mongo lease, or 'external' in bot_worker.py.
+# Only the lease holder delivers updates and runs the singleton background jobs.
+BOT_RUNNER = os.environ.get('BOT_RUNNER', 'embedded')
+BOT_LEASE_NAME = os.environ.get('BOT_LEASE_NAME', 'telegram-bot')
+BOT_LEASE_TTL = int(os.environ.get('BOT_LEASE_TTL', '30'))
+
+# User preference cache size (entries)
+PREFS_CACHE_MAX_ENTRIES = int(os.environ.get('PREFS_CACHE_MAX_ENTRIES', '10000'))
+
+# Rendered bot response cache size (entries)
+RENDER_CACHE_MAX_ENTRIES = int(os.environ.get('RENDER_CACHE_MAX_ENTRIES', '4096'))
+
+# WHOIS result cache settings (TTLs in seconds)
+WHOIS_CACHE_MAX_ENTRIES = int(os.environ.get('WHOIS_CACHE_MAX_ENTRIES', '2048'))
+WHOIS_CACHE_TTL_REGISTERED = int(os.environ.get('WHOIS_CACHE_TTL_REGISTERED', '21600'))
+WHOIS_CACHE_TTL_AVAILABLE = int(os.environ.get('WHOIS_CACHE_TTL_AVAILABLE', '600'))
+WHOIS_CACHE_MONGO = os.environ.get('WHOIS_CACHE_MONGO', 'true').lower() == 'true'
+# Past its TTL an entry is still served for this long while it is refreshed in the background
+WHOIS_CACHE_STALE_SECONDS = int(os.environ.get('WHOIS_CACHE_STALE_SECONDS', '86400'))
+CACHE_REFRESH_RATE = float(os.environ.get('CACHE_REFRESH_RATE', '1'))
+CACHE_REFRESH_BURST = float(os.environ.get('CACHE_REFRESH_BURST', '5'))
+PREWARM_TOP_N = int(os.environ.get('PREWARM_TOP_N', '100'))
+PREWARM_INTERVAL = int(os.environ.get('PREWARM_INTERVAL', '300'))
+PREWARM_LEAD_SECONDS = int(os.environ.get('PREWARM_LEAD_SECONDS', '900'))
+
+# Expiry watchlist
+WATCH_THRESHOLDS = sorted({int(d) for d in os.environ.get('WATCH_THRESHOLDS', '30,7,1').split(',') if d.strip()}, reverse=True)
+WATCH_MAX_PER_USER = int(os.environ.get('WATCH_MAX_PER_USER', '50'))
+WATCH_TICK_SECONDS = int(os.environ.get('WATCH_TICK_SECONDS', '60'))
+WATCH_MAX_PER_TICK = int(os.environ.get('WATCH_MAX_PER_TICK', '100'))
+WATCH_HORIZON_SECONDS = int(os.environ.get('WATCH_HORIZON_SECONDS', '3600'))
+# Expired domains are checked daily for this many days (renewals land in the registrar's grace period), then weekly
+WATCH_EXPIRED_GRACE_DAYS = int(os.environ.get('WATCH_EXPIRED_GRACE_DAYS', '45'))
+
+# Upstream HTTP client settings (timeouts in seconds)
+WHOIS_HTTP_MAX_CONNECTIONS = int(os.environ.get('WHOIS_HTTP_MAX_CONNECTIONS', '100'))
+WHOIS_HTTP_MAX_KEEPALIVE = int(os.environ.get('WHOIS_HTTP_MAX_KEEPALIVE', '20'))
+WHOIS_HTTP_KEEPALIVE_EXPIRY = float(os.environ.get('WHOIS_HTTP_KEEPALIVE_EXPIRY', '30'))
+WHOIS_HTTP_CONNECT_TIMEOUT = float(os.environ.get('WHOIS_HTTP_CONNECT_TIMEOUT', '5'))
+WHOIS_HTTP_READ_TIMEOUT = float(os.environ.get('WHOIS_HTTP_READ_TIMEOUT', '30'))
+WHOIS_HTTP_POOL_TIMEOUT = float(os.environ.get('WHOIS_HTTP_POOL_TIMEOUT', '10'))
+WHOIS_HTTP2 = os.environ.get('WHOIS_HTTP2', 'false').lower() == 'true'
+
+# Upstream quota: token bucket rates are requests/second, 0 disables a limit
+QUOTA_USER_RATE = float(os.environ.get('QUOTA_USER_RATE', '0.5'))
+QUOTA_USER_BURST = float(os.environ.get('QUOTA_USER_BURST', '5'))
+QUOTA_GLOBAL_RATE = float(os.environ.get('QUOTA_GLOBAL_RATE', '20'))
+QUOTA_GLOBAL_BURST = float(os.environ.get('QUOTA_GLOBAL_BURST', '40'))
+QUOTA_MAX_CONCURRENT = int(os.environ.get('QUOTA_MAX_CONCURRENT', '32'))
+QUOTA_DAILY_CREDITS = int(os.environ.get('QUOTA_DAILY_CREDITS', '0'))
+
+# WHOIS providers, tried in order ('whoisfreaks', 'rdap', 'port43')
+WHOIS_PROVIDERS = os.environ.get('WHOIS_PROVIDERS', 'whoisfreaks,rdap,port43')
+WHOIS_HEDGE_ENABLED = os.environ.get('WHOIS_HEDGE_ENABLED', 'false').lower() == 'true'
+WHOIS_HEDGE_PERCENTILE = float(os.environ.get('WHOIS_HEDGE_PERCENTILE', '0.95'))
+WHOIS_HEDGE_DELAY = float(os.environ.get('WHOIS_HEDGE_DELAY', '3'))
+
+# Upstream resilience: circuit breaker, adaptive timeouts (seconds), negative cache
+CIRCUIT_WINDOW = int(os.environ.get('CIRCUIT_WINDOW', '20'))
+CIRCUIT_MIN_CALLS = int(os.environ.get('CIRCUIT_MIN_CALLS', '10'))
+CIRCUIT_ERROR_RATE = float(os.environ.get('CIRCUIT_ERROR_RATE', '0.5'))
+CIRCUIT_OPEN_SECONDS = float(os.environ.get('CIRCUIT_OPEN_SECONDS', '30'))
+ADAPTIVE_TIMEOUT_MULTIPLIER = float(os.environ.get('ADAPTIVE_TIMEOUT_MULTIPLIER', '2'))
+ADAPTIVE_TIMEOUT_MIN = float(os.environ.get('ADAPTIVE_TIMEOUT_MIN', '2'))
+NEGATIVE_CACHE_TTL = int(os.environ.get('NEGATIVE_CACHE_TTL', '300'))
+RDAP_BOOTSTRAP_URL = os.environ.get('RDAP_BOOTSTRAP_URL', 'https://data.iana.org/rdap/dns.json')
+RDAP_SERVERS = os.environ.get('RDAP_SERVERS', '')  # "tld=https://rdap.example/,..."
+WHOIS_IANA_SERVER = os.environ.get('WHOIS_IANA_SERVER', 'whois.iana.org:43')
+WHOIS_PORT43_SERVERS = os.environ.get('WHOIS_PORT43_SERVERS', '')  # "tld=host[:port],..."
+PROVIDER_CACHE_DIR = Path(os.environ.get('PROVIDER_CACHE_DIR', str(ROOT_DIR / '.cache')))
+PROVIDER_BOOTSTRAP_MAX_AGE = int(os.environ.get('PROVIDER_BOOTSTRAP_MAX_AGE', '86400'))
+PUBLIC_SUFFIX_LIST_URL = os.environ.get('PUBLIC_SUFFIX_LIST_URL', 'https://publicsuffix.org/list/public_suffix_list.dat')
+PUBLIC_SUFFIX_LIST_PATH = os.environ.get('PUBLIC_SUFFIX_LIST_PATH')
+
+# Batch lookup settings
+WHOIS_BATCH_MAX_DOMAINS = int(os.environ.get('WHOIS_BATCH_MAX_DOMAINS', '5000'))
+WHOIS_BATCH_CONCURRENCY = int(os.environ.get('WHOIS_BATCH_CONCURRENCY', '8'))
+WHOIS_BULK_ENABLED = os.environ.get('WHOIS_BULK_ENABLED', 'true').lower() == 'true'
+WHOIS_BULK_CHUNK_SIZE = int(os.environ.get('WHOIS_BULK_CHUNK_SIZE', '100'))
+
+# Write-behind query logging (interval in seconds)
+LOG_QUEUE_MAX = int(os.environ.get('LOG_QUEUE_MAX', '20000'))
+LOG_FLUSH_SIZE = int(os.environ.get('LOG_FLUSH_SIZE', '500'))
+LOG_FLUSH_INTERVAL = float(os.environ.get('LOG_FLUSH_INTERVAL', '1.0'))
+LOG_DROP_POLICY = os.environ.get('LOG_DROP_POLICY', 'newest')  # 'newest' or 'oldest'
+
+# Query log retention (0 days keeps everything)
+QUERY_LOG_RETENTION_DAYS = int(os.environ.get('QUERY_LOG_RETENTION_DAYS', '0'))
+QUERY_LOG_RETENTION_MODE = os.environ.get('QUERY_LOG_RETENTION_MODE', 'ttl')  # 'ttl' or 'archive'
+QUERY_LOG_ARCHIVE_INTERVAL = int(os.environ.get('QUERY_LOG_ARCHIVE_INTERVAL', '3600'))
+QUERY_EXPORT_BATCH = int(os.environ.get('QUERY_EXPORT_BATCH', '1000'))
+
+# Approximate analytics: HLL precision p gives ~1.04/sqrt(2^p) relative error,
+# top-K counts overestimate by at most N/capacity
+STATS_MODE = os.environ.get('STATS_MODE', 'approx')  # 'approx' or 'exact'
+SKETCH_BUCKET_SECONDS = int(os.environ.get('SKETCH_BUCKET_SECONDS', '3600'))
+SKETCH_HLL_PRECISION = int(os.environ.get('SKETCH_HLL_PRECISION', '12'))
+SKETCH_TOPK_CAPACITY = int(os.environ.get('SKETCH_TOPK_CAPACITY', '200'))
+SKETCH_FLUSH_INTERVAL = float(os.environ.get('SKETCH_FLUSH_INTERVAL', '10'))
+SKETCH_RETENTION_DAYS = int(os.environ.get('SKETCH_RETENTION_DAYS', '90'))
+
+# Live dashboard stream: one poller per process, fanned out to every open dashboard
+STATS_STREAM_INTERVAL = float(os.environ.get('STATS_STREAM_INTERVAL', '2'))
+STATS_STREAM_KEEPALIVE = float(os.environ.get('STATS_STREAM_KEEPALIVE', '15'))
+STATS_STREAM_QUEUE = int(os.environ.get('STATS_STREAM_QUEUE', '64'))
 
 # Create the main app without a prefix
 app = FastAPI()
@@ -39,8 +330,58 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# User language preferences (in-memory cache)
-user_languages: Dict[int, str] = {}
+# User preferences: Mongo-backed with a bounded LRU in front
+DEFAULT_LANGUAGE = 'fa'
+
+class UserPreferences:
+    """Read-through / write-through preference store shared by all replicas"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self.counters = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def remember(self, user_id: int, prefs: Dict[str, Any]):
+        self.entries[user_id] = prefs
+        self.entries.move_to_end(user_id)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.counters["evictions"] += 1
+
+    async def load(self, user_id: int) -> Dict[str, Any]:
+        prefs = self.entries.get(user_id)
+        if prefs is not None:
+            self.entries.move_to_end(user_id)
+            self.counters["hits"] += 1
+            return prefs
+        self.counters["misses"] += 1
+        try:
+            doc = await db.user_prefs.find_one({"_id": user_id}, {"_id": 0})
+        except Exception as e:
+            logger.error(f"Failed to load preferences for {user_id}: {e}")
+            return {}
+        prefs = doc or {}
+        self.remember(user_id, prefs)
+        return prefs
+
+    async def set(self, user_id: int, **values):
+        prefs = {**(self.entries.get(user_id) or {}), **values}
+        self.remember(user_id, prefs)
+        await db.user_prefs.update_one(
+            {"_id": user_id},
+            {"$set": {**values, "updated_at": datetime.now(timezone.utc)}},
+            upsert=True
+        )
+
+    def language(self, user_id: int) -> str:
+        """Cached language for sync callers; handlers preload it per update"""
+        prefs = self.entries.get(user_id)
+        return (prefs or {}).get('language', DEFAULT_LANGUAGE)
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.counters, "size": len(self.entries), "max_entries": self.max_entries}
+
+user_prefs = UserPreferences(PREFS_CACHE_MAX_ENTRIES)
 
 # Messages in both languages
 MESSAGES = {
@@ -53,6 +394,8 @@ MESSAGES = {
 • `/whois domain.com` - اطلاعات کامل دامنه
 • `/check domain.com` - بررسی وضعیت دامنه
 • `/expiry domain.com` - تاریخ انقضا
+• `/watch domain.com` - یادآوری انقضای دامنه
+• `/watchlist` - دامنه‌های تحت نظر
 • `/lang` - تغییر زبان
 • `/help` - راهنما
 
@@ -72,6 +415,10 @@ MESSAGES = {
 🔹 `/expiry domain.com`
 فقط تاریخ انقضای دامنه
 
+🔹 `/watch domain.com`
+قبل از انقضای دامنه به شما خبر می‌دهیم
+`/unwatch domain.com` برای لغو و `/watchlist` برای مشاهده لیست
+
 🔹 `/lang`
 تغییر زبان ربات (فارسی/English)
 
@@ -99,6 +446,14 @@ MESSAGES = {
         'check_title': "🔎 *بررسی وضعیت دامنه*",
         'expiry_title': "⏳ *تاریخ انقضای دامنه*",
         'domain_name': "🌐 دامنه",
+        'watch_added': "👁️ دامنه *{domain}* به لیست نظارت اضافه شد. قبل از انقضا به شما خبر می‌دهیم.",
+        'watch_exists': "ℹ️ دامنه *{domain}* از قبل در لیست نظارت شماست.",
+        'watch_removed': "🗑️ دامنه *{domain}* از لیست نظارت حذف شد.",
+        'watch_not_found': "⚠️ دامنه *{domain}* در لیست نظارت شما نیست.",
+        'watch_limit': "⚠️ حداکثر {limit} دامنه را می‌توانید زیر نظر داشته باشید.",
+        'watchlist_empty': "📭 لیست نظارت شما خالی است.\n\n*مثال:* `/watch google.com`",
+        'watchlist_title': "👁️ *دامنه‌های تحت نظر*",
+        'watch_alert': "🔔 *یادآوری انقضا*\n\nدامنه `{domain}` در تاریخ `{expiry}` منقضی می‌شود ({days} روز مانده).",
     },
     'en': {
         'welcome': """🌐 *Welcome to Whois Bot!*
@@ -109,6 +464,8 @@ This bot can find domain registration information for you.
 • `/whois domain.com` - Full domain info
 • `/check domain.com` - Check domain status
 • `/expiry domain.com` - Expiry date
+• `/watch domain.com` - Expiry reminders
+• `/watchlist` - Watched domains
 • `/lang` - Change language
 • `/help` - Help
 
@@ -128,6 +485,10 @@ Quick check if domain is available or registered
 🔹 `/expiry domain.com`
 Only domain expiry date
 
+🔹 `/watch domain.com`
+Get notified before the domain expires
+`/unwatch domain.com` to stop, `/watchlist` to see your list
+
 🔹 `/lang`
 Change bot language (فارسی/English)
 
@@ -155,235 +516,2441 @@ Change bot language (فارسی/English)
         'check_title': "🔎 *Domain Status Check*",
         'expiry_title': "⏳ *Domain Expiry Date*",
         'domain_name': "🌐 Domain",
+        'watch_added': "👁️ *{domain}* added to your watchlist. You'll be notified before it expires.",
+        'watch_exists': "ℹ️ *{domain}* is already on your watchlist.",
+        'watch_removed': "🗑️ *{domain}* removed from your watchlist.",
+        'watch_not_found': "⚠️ *{domain}* is not on your watchlist.",
+        'watch_limit': "⚠️ You can watch at most {limit} domains.",
+        'watchlist_empty': "📭 Your watchlist is empty.\n\n*Example:* `/watch google.com`",
+        'watchlist_title': "👁️ *Watched Domains*",
+        'watch_alert': "🔔 *Expiry Reminder*\n\nDomain `{domain}` expires on `{expiry}` ({days} days left).",
     }
 }
 
-def get_msg(user_id: int, key: str) -> str:
-    lang = user_languages.get(user_id, 'fa')
-    return MESSAGES[lang].get(key, MESSAGES['en'].get(key, key))
+def get_msg(user_id: int, key: str) -> str:
+    """Plain-text message, for replies sent without a parse mode"""
+    lang = user_prefs.language(user_id)
+    return MESSAGES[lang].get(key, MESSAGES['en'].get(key, key))
+
+# Message rendering: MESSAGES are compiled once into MarkdownV2 templates
+PARSE_MODE = 'MarkdownV2'
+MARKDOWN_ESCAPES = str.maketrans({c: '\\' + c for c in '\\_*[]()~`>#+-=|{}.!'})
+MARKDOWN_CODE_ESCAPES = str.maketrans({'\\': '\\\\', '`': '\\`'})
+TEMPLATE_TOKEN_RE = re.compile(r'(`[^`]*`|\*|\{\w+\})')
+PLACEHOLDER_RE = re.compile(r'(\{\w+\})')
+
+def escape_markdown(text: Any) -> str:
+    """Escape text for Telegram MarkdownV2 in a single pass"""
+    if text is None or text == "":
+        return ""
+    return str(text).translate(MARKDOWN_ESCAPES)
+
+def escape_code(text: Any) -> str:
+    """Escape text for use inside a MarkdownV2 code span"""
+    return str(text).translate(MARKDOWN_CODE_ESCAPES)
+
+class MessageTemplate:
+    """A MESSAGES entry compiled to MarkdownV2.
+
+    `*bold*` and `code` spans are kept as markup, everything else is escaped
+    at compile time. Placeholders are escaped for the context they sit in
+    when rendered.
+    """
+
+    __slots__ = ("parts", "text")
+
+    def __init__(self, source: str):
+        parts: List[Any] = []
+        for token in TEMPLATE_TOKEN_RE.split(source):
+            if not token:
+                continue
+            if token == '*':
+                parts.append('*')
+            elif token.startswith('`'):
+                parts.append('`')
+                parts.extend(self.compile_span(token[1:-1], escape_code))
+                parts.append('`')
+            else:
+                parts.extend(self.compile_span(token, escape_markdown))
+        # Fold adjacent literals so rendering joins as few pieces as possible
+        merged: List[Any] = []
+        for part in parts:
+            if isinstance(part, str) and merged and isinstance(merged[-1], str):
+                merged[-1] += part
+            else:
+                merged.append(part)
+        self.parts = tuple(merged)
+        self.text = merged[0] if len(merged) == 1 and isinstance(merged[0], str) else None
+
+    @staticmethod
+    def compile_span(text: str, escape) -> List[Any]:
+        return [(piece[1:-1], escape) if PLACEHOLDER_RE.fullmatch(piece) else escape(piece)
+                for piece in PLACEHOLDER_RE.split(text) if piece]
+
+    def render(self, **values: Any) -> str:
+        if self.text is not None:
+            return self.text
+        return ''.join(part if isinstance(part, str) else part[1](values[part[0]]) for part in self.parts)
+
+TEMPLATES = {
+    lang: {key: MessageTemplate(text) for key, text in messages.items()}
+    for lang, messages in MESSAGES.items()
+}
+
+# Escaped static entries, for composing the WHOIS responses
+LABELS = {
+    lang: {key: compiled.text for key, compiled in templates.items() if compiled.text is not None}
+    for lang, templates in TEMPLATES.items()
+}
+
+def template(lang: str, key: str) -> MessageTemplate:
+    return TEMPLATES[lang].get(key) or TEMPLATES['en'][key]
+
+def render_msg(user_id: int, key: str, **values: Any) -> str:
+    """MESSAGES entry rendered as MarkdownV2 in the user's language"""
+    return template(user_prefs.language(user_id), key).render(**values)
+
+# Domain normalization: one compiled pass from raw user input to the registrable domain
+class PublicSuffixTrie:
+    """Public suffix rules stored as a reversed-label trie (ICANN section only)"""
+
+    TERMINAL = '$rule'
+    EXCEPTION = '$exception'
+
+    # Used until the full list is loaded, or if it can't be fetched
+    BUILTIN_RULES = (
+        'co.uk', 'org.uk', 'ac.uk', 'gov.uk', 'me.uk', 'net.uk', 'ltd.uk', 'plc.uk',
+        'com.au', 'net.au', 'org.au', 'edu.au', 'gov.au', 'co.nz', 'org.nz', 'co.jp', 'ne.jp', 'or.jp',
+        'com.br', 'com.cn', 'net.cn', 'org.cn', 'com.tr', 'co.in', 'co.za', 'com.mx', 'co.kr', 'com.sg',
+        'co.ir', 'ac.ir', 'org.ir', 'gov.ir', 'id.ir', 'net.ir', 'sch.ir',
+    )
+
+    def __init__(self, builtin: bool = True):
+        self.root: Dict[str, Any] = {}
+        self.rules = 0
+        self.source = 'builtin'
+        if builtin:
+            for rule in self.BUILTIN_RULES:
+                self.add(rule)
+
+    def add(self, rule: str):
+        exception = rule.startswith('!')
+        node = self.root
+        for label in reversed(rule.lstrip('!').split('.')):
+            node = node.setdefault(label, {})
+        node[self.EXCEPTION if exception else self.TERMINAL] = True
+        self.rules += 1
+
+    @classmethod
+    def parse(cls, text: str, source: str) -> "PublicSuffixTrie":
+        trie = cls(builtin=False)
+        for line in text.splitlines():
+            line = line.strip()
+            if line.startswith('// ===BEGIN PRIVATE DOMAINS==='):
+                break
+            if line and not line.startswith('//'):
+                rule = line.split()[0].lower()
+                if not rule.isascii():
+                    body = rule.lstrip('!*.')
+                    try:
+                        rule = rule[:len(rule) - len(body)] + idna.encode(body, uts46=True).decode()
+                    except idna.IDNAError:
+                        continue
+                trie.add(rule)
+        trie.source = source
+        return trie
+
+    def suffix_labels(self, labels: List[str]) -> int:
+        """Number of trailing labels that form the public suffix (default rule "*")"""
+        node = self.root
+        matched = 1
+        for depth, label in enumerate(reversed(labels), start=1):
+            child = node.get(label)
+            if child is None:
+                child = node.get('*')
+            if child is None:
+                break
+            if child.get(self.EXCEPTION):
+                return depth - 1
+            if child.get(self.TERMINAL):
+                matched = depth
+            node = child
+        return matched
+
+    def registrable(self, labels: List[str]) -> Optional[str]:
+        suffix = self.suffix_labels(labels)
+        if len(labels) <= suffix:
+            return None
+        return '.'.join(labels[-suffix - 1:])
+
+public_suffixes = PublicSuffixTrie()
+
+DOMAIN_INPUT_RE = re.compile(
+    r'^\s*(?:[a-z][a-z0-9+.\-]*://)?(?:[^@/?#\s]*@)?(?P<host>[^/?#:\s]+)', re.IGNORECASE
+)
+DOMAIN_LABEL_RE = re.compile(r'^(?!-)[a-z0-9-]{1,63}(?<!-)$')
+
+@lru_cache(maxsize=65536)
+def normalize_domain(raw: str) -> Optional[str]:
+    """Reduce raw input (URL, host, IDN, subdomain) to its punycode registrable domain, or None"""
+    if not raw:
+        return None
+    match = DOMAIN_INPUT_RE.match(raw)
+    if not match:
+        return None
+    host = match.group('host').rstrip('.')
+    if host.isascii():
+        host = host.lower()
+    else:
+        try:
+            host = idna.encode(host, uts46=True).decode()
+        except idna.IDNAError:
+            return None
+    if len(host) > 253:
+        return None
+    labels = host.split('.')
+    if len(labels) < 2 or not all(DOMAIN_LABEL_RE.match(label) for label in labels):
+        return None
+    # An IP literal like 1.2.3.4 would otherwise reduce to the "domain" 3.4
+    if labels[-1].isdigit() or is_ip_address(host):
+        return None
+    return public_suffixes.registrable(labels)
+
+def is_ip_address(host: str) -> bool:
+    try:
+        ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return True
+
+def normalize_domains(raws: List[str]) -> List[Optional[str]]:
+    """Batch form of normalize_domain, preserving input order"""
+    normalize = normalize_domain
+    return [normalize(raw) for raw in raws]
+
+async def load_public_suffixes():
+    """Load the public suffix list once: local path, then cached copy, then download"""
+    global public_suffixes
+    cache_path = PROVIDER_CACHE_DIR / 'public_suffix_list.dat'
+    text, source = None, None
+    if PUBLIC_SUFFIX_LIST_PATH:
+        text, source = Path(PUBLIC_SUFFIX_LIST_PATH).read_text(encoding='utf-8'), PUBLIC_SUFFIX_LIST_PATH
+    elif cache_path.exists() and time.time() - cache_path.stat().st_mtime < PROVIDER_BOOTSTRAP_MAX_AGE * 7:
+        text, source = cache_path.read_text(encoding='utf-8'), str(cache_path)
+    else:
+        response = await upstream_http.get(PUBLIC_SUFFIX_LIST_URL)
+        response.raise_for_status()
+        text, source = response.text, PUBLIC_SUFFIX_LIST_URL
+        try:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            cache_path.write_text(text, encoding='utf-8')
+        except OSError as e:
+            logger.warning(f"Could not cache public suffix list: {e}")
+    public_suffixes = PublicSuffixTrie.parse(text, source)
+    normalize_domain.cache_clear()
+    logger.info(f"Loaded {public_suffixes.rules} public suffix rules from {source}")
+
+def is_valid_domain(domain: str) -> bool:
+    """Check if domain format is valid"""
+    return normalize_domain(domain) is not None
+
+def clean_domain(domain: str) -> str:
+    """Clean domain name down to its registrable domain"""
+    return normalize_domain(domain) or domain.lower().strip().rstrip('/')
+
+def as_utc(value: datetime) -> datetime:
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+# Parsed WHOIS records
+def parse_whois_date(value: Any) -> Optional[datetime]:
+    """Parse the date formats WHOIS sources return into an aware UTC datetime"""
+    if not value:
+        return None
+    text = str(value).strip().replace('Z', '+00:00')
+    try:
+        parsed = datetime.fromisoformat(text)
+    except ValueError:
+        try:
+            parsed = datetime.strptime(text.split('T')[0].split(' ')[0], '%Y-%m-%d')
+        except ValueError:
+            return None
+    return as_utc(parsed).astimezone(timezone.utc)
+
+def days_until(expiry: Any) -> Optional[int]:
+    """Whole calendar days from today (UTC) until an expiry date, or None if it can't be parsed"""
+    expiry_at = parse_whois_date(expiry)
+    if expiry_at is None:
+        return None
+    return expiry_at.toordinal() - datetime.now(timezone.utc).toordinal()
+
+def registrar_name(data: Dict) -> Optional[str]:
+    registrar = data.get('domain_registrar') or data.get('registrar', {})
+    if isinstance(registrar, dict):
+        return registrar.get('registrar_name') or registrar.get('name')
+    return str(registrar) if registrar else None
+
+def contact_name(data: Dict) -> Optional[str]:
+    registrant = data.get('registrant_contact') or data.get('registrant')
+    if isinstance(registrant, dict):
+        return registrant.get('name') or registrant.get('organization')
+    return None
+
+record_versions = itertools.count(1)
+
+class WhoisRecord:
+    """Compact WHOIS record, parsed once per fetch from whatever shape the provider returned.
+
+    Formatters, the cache and the API all read this instead of the vendor
+    JSON, so the field fallbacks and date parsing live in one place.
+    """
+
+    __slots__ = ("domain", "registered", "registrar", "registrant", "create_date", "update_date",
+                 "expiry_date", "created_at", "updated_at", "expiry_at", "expiry_day",
+                 "whois_server", "name_servers", "statuses", "provider", "version")
+    # Constructor arguments; the parsed dates are derived from these
+    STORED = ("domain", "registered", "registrar", "registrant", "create_date", "update_date",
+              "expiry_date", "whois_server", "name_servers", "statuses", "provider")
+
+    def __init__(self, domain: str, registered: bool = False, registrar: Optional[str] = None,
+                 registrant: Optional[str] = None, create_date: Optional[str] = None,
+                 update_date: Optional[str] = None, expiry_date: Optional[str] = None,
+                 whois_server: Optional[str] = None, name_servers: tuple = (),
+                 statuses: tuple = (), provider: Optional[str] = None):
+        self.domain = domain
+        self.registered = registered
+        self.registrar = registrar
+        self.registrant = registrant
+        self.create_date = create_date
+        self.update_date = update_date
+        self.expiry_date = expiry_date
+        self.created_at = parse_whois_date(create_date)
+        self.updated_at = parse_whois_date(update_date)
+        self.expiry_at = parse_whois_date(expiry_date)
+        # Day ordinal rather than a count, so a long-cached record never goes out of date
+        self.expiry_day = self.expiry_at.toordinal() if self.expiry_at else None
+        self.whois_server = whois_server
+        self.name_servers = tuple(name_servers)
+        self.statuses = tuple(statuses)
+        self.provider = provider
+        # Process-unique, so anything derived from a record can be cached against it
+        self.version = next(record_versions)
+
+    @classmethod
+    def from_raw(cls, data: Dict[str, Any], domain: Optional[str] = None) -> "WhoisRecord":
+        """Parse a WhoisFreaks, RDAP or port-43 response"""
+        name_servers = data.get('name_servers') or data.get('nameservers') or []
+        statuses = data.get('domain_status') or data.get('status') or []
+        if isinstance(statuses, str):
+            statuses = [statuses]
+        elif not isinstance(statuses, list):
+            # WhoisFreaks uses a boolean `status` as its success flag
+            statuses = []
+        return cls(
+            domain=str(data.get('domain_name') or domain or '').lower(),
+            registered=data.get('domain_registered') == 'yes',
+            registrar=registrar_name(data),
+            registrant=contact_name(data),
+            create_date=data.get('create_date') or data.get('creation_date'),
+            update_date=data.get('update_date'),
+            expiry_date=data.get('expiry_date'),
+            whois_server=data.get('whois_server'),
+            name_servers=[str(ns) for ns in name_servers] if isinstance(name_servers, list) else [],
+            statuses=[str(st) for st in statuses],
+            provider=data.get('provider', 'whoisfreaks'),
+        )
+
+    @classmethod
+    def from_doc(cls, doc: Dict[str, Any]) -> "WhoisRecord":
+        """Rebuild a record stored with to_doc()"""
+        return cls(**{key: doc[key] for key in doc if key in cls.STORED})
+
+    def to_doc(self) -> Dict[str, Any]:
+        """Minimal document for the shared cache; parsed dates are rebuilt on load"""
+        doc = {}
+        for key in self.STORED:
+            value = getattr(self, key)
+            if value not in (None, (), False):
+                doc[key] = list(value) if isinstance(value, tuple) else value
+        return doc
+
+    @property
+    def days_left(self) -> Optional[int]:
+        if self.expiry_day is None:
+            return None
+        return self.expiry_day - datetime.now(timezone.utc).toordinal()
+
+    def to_api(self) -> Dict[str, Any]:
+        """WhoisFreaks-shaped view, so API clients keep the field names they already use"""
+        data: Dict[str, Any] = {
+            "domain_name": self.domain,
+            "domain_registered": "yes" if self.registered else "no",
+            "create_date": self.create_date,
+            "update_date": self.update_date,
+            "expiry_date": self.expiry_date,
+            "days_left": self.days_left,
+            "whois_server": self.whois_server,
+            "name_servers": list(self.name_servers),
+            "domain_status": list(self.statuses),
+            "provider": self.provider,
+        }
+        if self.registrar:
+            data["domain_registrar"] = {"registrar_name": self.registrar}
+        if self.registrant:
+            data["registrant_contact"] = {"name": self.registrant}
+        return {k: v for k, v in data.items() if v not in (None, [], '')}
+
+class WhoisCache:
+    """Two-tier WHOIS cache: in-process LRU in front of a shared Mongo collection.
+
+    Entries are parsed WhoisRecords, fresh for their TTL, then stale (still
+    served) for `stale_seconds` so callers can revalidate in the background.
+    """
+
+    def __init__(self, max_entries: int, ttl_registered: int, ttl_available: int,
+                 use_mongo: bool = True, stale_seconds: int = 0):
+        self.max_entries = max_entries
+        self.ttl_registered = ttl_registered
+        self.ttl_available = ttl_available
+        self.use_mongo = use_mongo
+        self.stale_seconds = stale_seconds
+        self.entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.negative: "OrderedDict[str, float]" = OrderedDict()
+        self.counters = {"memory_hits": 0, "mongo_hits": 0, "stale_hits": 0, "misses": 0, "stores": 0,
+                         "evictions": 0, "negative_hits": 0, "negative_stores": 0}
+
+    def ttl_for(self, record: WhoisRecord) -> int:
+        if record.registered:
+            return self.ttl_registered
+        return self.ttl_available
+
+    def remember(self, domain: str, record: WhoisRecord, fresh_until: float, expires_at: float):
+        self.entries[domain] = (fresh_until, expires_at, record)
+        self.entries.move_to_end(domain)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.counters["evictions"] += 1
+
+    async def get_entry(self, domain: str) -> Optional[tuple]:
+        """Return (record, stale) or None; stale entries are past their TTL but still servable"""
+        now = time.monotonic()
+        entry = self.entries.get(domain)
+        if entry:
+            fresh_until, expires_at, record = entry
+            if expires_at > now:
+                self.entries.move_to_end(domain)
+                self.counters["memory_hits"] += 1
+                return self.served(record, fresh_until <= now)
+            del self.entries[domain]
+
+        if self.use_mongo:
+            try:
+                doc = await db.whois_cache.find_one({"_id": domain})
+            except Exception as e:
+                logger.error(f"WHOIS cache read error: {e}")
+                doc = None
+            if doc:
+                utc_now = datetime.now(timezone.utc)
+                remaining = (as_utc(doc["expires_at"]) - utc_now).total_seconds()
+                if remaining > 0:
+                    fresh = (as_utc(doc.get("fresh_until") or doc["expires_at"]) - utc_now).total_seconds()
+                    # Documents written before records were introduced still hold the raw response
+                    if "record" in doc:
+                        record = WhoisRecord.from_doc(doc["record"])
+                    else:
+                        record = WhoisRecord.from_raw(doc["data"], domain)
+                    self.remember(domain, record, now + fresh, now + remaining)
+                    self.counters["mongo_hits"] += 1
+                    return self.served(record, fresh <= 0)
+
+        self.counters["misses"] += 1
+        return None
+
+    def served(self, record: WhoisRecord, stale: bool) -> tuple:
+        if stale:
+            self.counters["stale_hits"] += 1
+        return record, stale
+
+    async def get(self, domain: str) -> Optional[WhoisRecord]:
+        entry = await self.get_entry(domain)
+        return entry[0] if entry else None
+
+    async def set(self, domain: str, record: WhoisRecord):
+        ttl = self.ttl_for(record)
+        now = time.monotonic()
+        self.remember(domain, record, now + ttl, now + ttl + self.stale_seconds)
+        self.counters["stores"] += 1
+        if self.use_mongo:
+            utc_now = datetime.now(timezone.utc)
+            try:
+                await db.whois_cache.replace_one(
+                    {"_id": domain},
+                    {
+                        "_id": domain,
+                        "record": record.to_doc(),
+                        "fresh_until": utc_now + timedelta(seconds=ttl),
+                        "expires_at": utc_now + timedelta(seconds=ttl + self.stale_seconds),
+                    },
+                    upsert=True
+                )
+            except Exception as e:
+                logger.error(f"WHOIS cache write error: {e}")
+
+    async def fresh_remaining(self, domains: List[str]) -> Dict[str, float]:
+        """Seconds until each cached domain goes stale, without counting as a lookup"""
+        now = time.monotonic()
+        remaining = {}
+        for domain in domains:
+            entry = self.entries.get(domain)
+            if entry and entry[1] > now:
+                remaining[domain] = entry[0] - now
+        missing = [d for d in domains if d not in remaining]
+        if missing and self.use_mongo:
+            utc_now = datetime.now(timezone.utc)
+            async for doc in db.whois_cache.find({"_id": {"$in": missing}}, {"fresh_until": 1, "expires_at": 1}):
+                fresh_until = as_utc(doc.get("fresh_until") or doc["expires_at"])
+                remaining[doc["_id"]] = (fresh_until - utc_now).total_seconds()
+        return remaining
+
+    def is_negative(self, domain: str) -> bool:
+        expires_at = self.negative.get(domain)
+        if expires_at is None:
+            return False
+        if expires_at <= time.monotonic():
+            del self.negative[domain]
+            return False
+        self.counters["negative_hits"] += 1
+        return True
+
+    def set_negative(self, domain: str):
+        """Remember a rejected domain briefly so repeats don't reach the network"""
+        self.negative[domain] = time.monotonic() + NEGATIVE_CACHE_TTL
+        self.negative.move_to_end(domain)
+        while len(self.negative) > self.max_entries:
+            self.negative.popitem(last=False)
+        self.counters["negative_stores"] += 1
+
+    async def ensure_indexes(self):
+        """Let Mongo drop expired cache documents on its own"""
+        if self.use_mongo:
+            await db.whois_cache.create_index("expires_at", expireAfterSeconds=0)
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self.counters["memory_hits"] + self.counters["mongo_hits"]
+        lookups = hits + self.counters["misses"]
+        return {
+            **self.counters,
+            "size": len(self.entries),
+            "negative_size": len(self.negative),
+            "max_entries": self.max_entries,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+        }
+
+whois_cache = WhoisCache(
+    WHOIS_CACHE_MAX_ENTRIES,
+    WHOIS_CACHE_TTL_REGISTERED,
+    WHOIS_CACHE_TTL_AVAILABLE,
+    use_mongo=WHOIS_CACHE_MONGO,
+    stale_seconds=WHOIS_CACHE_STALE_SECONDS
+)
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key into one shared task"""
+
+    def __init__(self):
+        self.inflight: Dict[str, asyncio.Task] = {}
+        self.counters = {"leaders": 0, "coalesced": 0}
+
+    def release(self, key: str, task: asyncio.Task):
+        if self.inflight.get(key) is task:
+            del self.inflight[key]
+        # Mark the result as retrieved even if every caller was cancelled
+        if not task.cancelled():
+            task.exception()
+
+    async def do(self, key: str, func):
+        task = self.inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(func())
+            self.inflight[key] = task
+            task.add_done_callback(lambda t: self.release(key, t))
+            self.counters["leaders"] += 1
+        else:
+            self.counters["coalesced"] += 1
+        # Shield so one caller's cancellation doesn't cancel the lookup for everyone else
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.counters, "inflight": len(self.inflight)}
+
+whois_flight = SingleFlight()
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_API = 1
+PRIORITY_BATCH = 2
+PRIORITY_BACKGROUND = 3
+
+class QuotaExceeded(Exception):
+    """Daily upstream credit budget is used up"""
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def ready(self) -> bool:
+        self.refill()
+        return self.tokens >= 1
+
+    def take(self):
+        self.tokens -= 1
+
+    def idle(self) -> bool:
+        self.refill()
+        return self.tokens >= self.burst
+
+    def wait_time(self) -> float:
+        self.refill()
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+class QuotaManager:
+    """Per-user and global token buckets with a priority queue for upstream calls.
+
+    Callers over budget wait in (priority, arrival) order instead of failing,
+    so interactive bot users are served ahead of API and batch traffic. Only
+    the daily credit budget rejects outright.
+    """
+
+    def __init__(self, user_rate: float, user_burst: float, global_rate: float, global_burst: float,
+                 max_concurrent: int, daily_credits: int):
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.global_bucket = TokenBucket(global_rate, global_burst) if global_rate > 0 else None
+        self.max_concurrent = max_concurrent
+        self.daily_credits = daily_credits
+        self.user_buckets: Dict[int, TokenBucket] = {}
+        self.waiters: List[tuple] = []
+        self.seq = itertools.count()
+        self.in_flight = 0
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.counters = {"granted": 0, "queued": 0, "rejected_daily": 0}
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def user_bucket(self, user_id: Optional[int]) -> Optional[TokenBucket]:
+        if user_id is None or self.user_rate <= 0:
+            return None
+        bucket = self.user_buckets.get(user_id)
+        if bucket is None:
+            if len(self.user_buckets) >= 50000:
+                # Full buckets carry no state worth keeping
+                self.user_buckets = {k: b for k, b in self.user_buckets.items() if not b.idle()}
+            bucket = TokenBucket(self.user_rate, self.user_burst)
+            self.user_buckets[user_id] = bucket
+        return bucket
+
+    def grant(self, user_id: Optional[int]):
+        if self.global_bucket:
+            self.global_bucket.take()
+        bucket = self.user_bucket(user_id)
+        if bucket:
+            bucket.take()
+        self.in_flight += 1
+        self.counters["granted"] += 1
+
+    def release(self):
+        self.in_flight -= 1
+        self.wakeup.set()
+
+    def saturated(self) -> bool:
+        return bool(self.max_concurrent) and self.in_flight >= self.max_concurrent
+
+    async def dispatch(self):
+        while True:
+            self.wakeup.clear()
+            deferred = []
+            delay = None
+            while self.waiters:
+                if self.saturated():
+                    break
+                if self.global_bucket and not self.global_bucket.ready():
+                    delay = self.global_bucket.wait_time()
+                    break
+                waiter = heapq.heappop(self.waiters)
+                _, _, user_id, future, enqueued = waiter
+                if future.done():
+                    continue
+                bucket = self.user_bucket(user_id)
+                if bucket and not bucket.ready():
+                    # Don't let one throttled user block everyone queued behind them
+                    deferred.append(waiter)
+                    wait = bucket.wait_time()
+                    delay = wait if delay is None else min(delay, wait)
+                    continue
+                self.grant(user_id)
+                waited = time.monotonic() - enqueued
+                self.wait_total += waited
+                self.wait_max = max(self.wait_max, waited)
+                future.set_result(None)
+            for waiter in deferred:
+                heapq.heappush(self.waiters, waiter)
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def acquire(self, user_id: Optional[int], priority: int):
+        if not self.waiters and not self.saturated():
+            bucket = self.user_bucket(user_id)
+            if (not self.global_bucket or self.global_bucket.ready()) and (not bucket or bucket.ready()):
+                self.grant(user_id)
+                return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (priority, next(self.seq), user_id, future, time.monotonic()))
+        self.counters["queued"] += 1
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.dispatch())
+        self.wakeup.set()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Granted just as the caller went away
+                self.release()
+            raise
+
+    async def reserve_daily(self, cost: int):
+        if self.daily_credits <= 0:
+            return
+        today = datetime.now(timezone.utc).strftime('%Y-%m-%d')
+        doc = await db.quota_usage.find_one_and_update(
+            {"_id": today}, {"$inc": {"credits": cost}},
+            upsert=True, return_document=ReturnDocument.AFTER
+        )
+        if doc["credits"] > self.daily_credits:
+            await self.refund_daily(cost)
+            self.counters["rejected_daily"] += 1
+            raise QuotaExceeded(f"Daily budget of {self.daily_credits} credits used up")
+
+    async def refund_daily(self, cost: int):
+        if self.daily_credits > 0:
+            today = datetime.now(timezone.utc).strftime('%Y-%m-%d')
+            await db.quota_usage.update_one({"_id": today}, {"$inc": {"credits": -cost}})
+
+    @asynccontextmanager
+    async def slot(self, user_id: Optional[int] = None, priority: int = PRIORITY_API, cost: int = 1):
+        """Hold one upstream call slot; `cost` is charged against the daily budget"""
+        await self.reserve_daily(cost)
+        try:
+            await self.acquire(user_id, priority)
+        except BaseException:
+            await asyncio.shield(self.refund_daily(cost))
+            raise
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def stats(self) -> Dict[str, Any]:
+        depth = {"interactive": 0, "api": 0, "batch": 0, "background": 0}
+        names = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_API: "api", PRIORITY_BATCH: "batch",
+                 PRIORITY_BACKGROUND: "background"}
+        for priority, _, _, future, _ in self.waiters:
+            if not future.done():
+                depth[names.get(priority, "background")] += 1
+        granted_after_wait = self.counters["queued"] or 1
+        daily_used = None
+        if self.daily_credits > 0:
+            doc = await db.quota_usage.find_one({"_id": datetime.now(timezone.utc).strftime('%Y-%m-%d')})
+            daily_used = (doc or {}).get("credits", 0)
+        return {
+            **self.counters,
+            "in_flight": self.in_flight,
+            "queue_depth": depth,
+            "avg_wait_seconds": round(self.wait_total / granted_after_wait, 4),
+            "max_wait_seconds": round(self.wait_max, 4),
+            "daily_budget": self.daily_credits or None,
+            "daily_used": daily_used,
+        }
+
+upstream_quota = QuotaManager(
+    QUOTA_USER_RATE, QUOTA_USER_BURST,
+    QUOTA_GLOBAL_RATE, QUOTA_GLOBAL_BURST,
+    QUOTA_MAX_CONCURRENT, QUOTA_DAILY_CREDITS
+)
+
+class UpstreamHTTP:
+    """Long-lived pooled HTTP client shared by all upstream WHOIS calls"""
+
+    def __init__(self):
+        self.client: Optional[httpx.AsyncClient] = None
+        self.http2 = False
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.counters = {"requests": 0, "pool_timeouts": 0, "errors": 0}
+
+    def start(self) -> httpx.AsyncClient:
+        if self.client is None:
+            http2 = WHOIS_HTTP2
+            if http2:
+                try:
+                    import h2  # noqa: F401
+                except ImportError:
+                    logger.warning("WHOIS_HTTP2 is enabled but the h2 package is not installed, using HTTP/1.1")
+                    http2 = False
+            self.http2 = http2
+            self.client = httpx.AsyncClient(
+                http2=http2,
+                limits=httpx.Limits(
+                    max_connections=WHOIS_HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=WHOIS_HTTP_MAX_KEEPALIVE,
+                    keepalive_expiry=WHOIS_HTTP_KEEPALIVE_EXPIRY,
+                ),
+                timeout=httpx.Timeout(
+                    connect=WHOIS_HTTP_CONNECT_TIMEOUT,
+                    read=WHOIS_HTTP_READ_TIMEOUT,
+                    write=WHOIS_HTTP_CONNECT_TIMEOUT,
+                    pool=WHOIS_HTTP_POOL_TIMEOUT,
+                ),
+            )
+        return self.client
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        client = self.start()
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        self.counters["requests"] += 1
+        try:
+            return await client.request(method, url, **kwargs)
+        except httpx.PoolTimeout:
+            self.counters["pool_timeouts"] += 1
+            raise
+        except Exception:
+            self.counters["errors"] += 1
+            raise
+        finally:
+            self.in_flight -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.counters,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "max_connections": WHOIS_HTTP_MAX_CONNECTIONS,
+            "saturation": round(self.in_flight / WHOIS_HTTP_MAX_CONNECTIONS, 4) if WHOIS_HTTP_MAX_CONNECTIONS else 0.0,
+            "http2": self.http2,
+        }
+
+upstream_http = UpstreamHTTP()
+
+class ApiKey:
+    def __init__(self, key: str, weight: int):
+        self.key = key
+        self.weight = weight
+        self.current_weight = 0
+        self.in_flight = 0
+        self.benched_until = 0.0
+        self.remaining_credits: Optional[int] = None
+        self.counters = {"requests": 0, "errors": 0, "rate_limited": 0, "exhausted": 0}
+
+    def available(self) -> bool:
+        return self.benched_until <= time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        bench = max(0.0, self.benched_until - time.monotonic())
+        return {
+            "key": f"...{self.key[-4:]}",
+            "weight": self.weight,
+            **self.counters,
+            "in_flight": self.in_flight,
+            "remaining_credits": self.remaining_credits,
+            "benched_for_seconds": round(bench, 1),
+        }
+
+class ApiKeyPool:
+    """Spreads upstream calls across WhoisFreaks keys and benches exhausted ones"""
+
+    REMAINING_HEADERS = ('x-ratelimit-remaining', 'x-credits-remaining', 'x-remaining-credits')
+
+    def __init__(self, spec: str, fallback: Optional[str], strategy: str):
+        self.strategy = strategy
+        self.keys: List[ApiKey] = []
+        for item in filter(None, (part.strip() for part in spec.split(','))):
+            key, _, weight = item.partition(':')
+            self.keys.append(ApiKey(key, int(weight) if weight else 1))
+        if not self.keys and fallback:
+            self.keys.append(ApiKey(fallback, 1))
+
+    def size(self) -> int:
+        return len(self.keys)
+
+    def pick(self) -> Optional[ApiKey]:
+        candidates = [k for k in self.keys if k.available()]
+        if not candidates:
+            return None
+        if self.strategy == 'least_used':
+            key = min(candidates, key=lambda k: (k.in_flight, k.counters["requests"]))
+        else:
+            # Smooth weighted round-robin
+            total = sum(k.weight for k in candidates)
+            for k in candidates:
+                k.current_weight += k.weight
+            key = max(candidates, key=lambda k: k.current_weight)
+            key.current_weight -= total
+        key.in_flight += 1
+        key.counters["requests"] += 1
+        return key
+
+    def report(self, key: ApiKey, response: Optional[httpx.Response]):
+        """Record the outcome of a call; returns True if another key should be tried"""
+        key.in_flight -= 1
+        if response is None:
+            key.counters["errors"] += 1
+            return False
+        for header in self.REMAINING_HEADERS:
+            value = response.headers.get(header)
+            if value and value.isdigit():
+                key.remaining_credits = int(value)
+                break
+        if response.status_code == 429:
+            key.counters["rate_limited"] += 1
+            retry_after = response.headers.get('retry-after', '')
+            bench = int(retry_after) if retry_after.isdigit() else WHOISFREAKS_KEY_BENCH_SECONDS
+            key.benched_until = time.monotonic() + bench
+            return True
+        if response.status_code in (401, 402, 403) or key.remaining_credits == 0:
+            key.counters["exhausted"] += 1
+            key.benched_until = time.monotonic() + WHOISFREAKS_KEY_EXHAUSTED_BENCH_SECONDS
+            return response.status_code != 200
+        if response.status_code >= 500:
+            key.counters["errors"] += 1
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        return {"strategy": self.strategy, "keys": [k.stats() for k in self.keys]}
+
+whois_keys = ApiKeyPool(WHOISFREAKS_API_KEYS, WHOISFREAKS_API_KEY, WHOISFREAKS_KEY_STRATEGY)
+
+async def call_whoisfreaks(method: str, url: str, params: Optional[Dict[str, Any]] = None,
+                           **kwargs) -> Optional[httpx.Response]:
+    """Send one WhoisFreaks request, moving on to the next key when one is rate limited or exhausted"""
+    response = None
+    for _ in range(max(whois_keys.size(), 1)):
+        key = whois_keys.pick()
+        if key is None:
+            logger.error("No WhoisFreaks API key available (all benched or none configured)")
+            return response
+        answer = None
+        try:
+            answer = await upstream_http.request(method, url, params={**(params or {}), "apiKey": key.key}, **kwargs)
+        finally:
+            # Also on cancellation (adaptive timeouts, lost hedges), so the key's in_flight count can't leak
+            retry = whois_keys.report(key, answer)
+        response = answer
+        if not retry:
+            return response
+    return response
+
+class ProviderError(Exception):
+    """Upstream failed to answer (transport error, 5xx, unexpected status)"""
+
+class InvalidDomain(Exception):
+    """Upstream rejected the domain itself; retrying elsewhere won't help"""
+
+async def fetch_whois_live(domain: str) -> Optional[Dict[Any, Any]]:
+    """Fetch WHOIS data from WhoisFreaks API"""
+    response = await call_whoisfreaks(
+        "GET", f"{WHOISFREAKS_BASE_URL}/v1.0/whois",
+        params={"domainName": domain, "whois": "live"}
+    )
+    if response is None:
+        raise ProviderError("no WhoisFreaks key available")
+    if response.status_code == 200:
+        return response.json()
+    if response.status_code in (400, 404, 422):
+        raise InvalidDomain(f"WhoisFreaks rejected {domain}: {response.status_code}")
+    raise ProviderError(f"WhoisFreaks API error: {response.status_code} - {response.text[:200]}")
+
+async def fetch_whois_bulk_live(domains: List[str]) -> Optional[Dict[str, Dict[Any, Any]]]:
+    """Fetch several domains with one WhoisFreaks bulk lookup, keyed by domain; None if the call failed"""
+    try:
+        response = await call_whoisfreaks(
+            "POST", f"{WHOISFREAKS_BASE_URL}/v1.0/bulkwhois",
+            json={"domainNames": domains}
+        )
+        if response is None:
+            return None
+        if response.status_code != 200:
+            logger.error(f"WhoisFreaks bulk API error: {response.status_code} - {response.text}")
+            return None
+        results = {}
+        for record in response.json().get('bulk_whois_response') or []:
+            name = str(record.get('domain_name') or '').lower()
+            if name and record.get('status') != False:
+                results[name] = record
+        return results
+    except Exception as e:
+        logger.error(f"Error fetching bulk WHOIS data: {e}")
+        return None
+
+# WHOIS providers: every backend returns the WhoisFreaks-shaped dict the formatters expect
+class WhoisProvider(ABC):
+    name = "base"
+
+    @abstractmethod
+    async def lookup(self, domain: str) -> Optional[Dict[Any, Any]]:
+        """WHOIS data for the domain, None when there is no answer; raises InvalidDomain or ProviderError"""
+
+class WhoisFreaksProvider(WhoisProvider):
+    name = "whoisfreaks"
+
+    async def lookup(self, domain: str) -> Optional[Dict[Any, Any]]:
+        data = await fetch_whois_live(domain)
+        if data and data.get('status') != False:
+            return data
+        return None
+
+def parse_server_overrides(spec: str) -> Dict[str, str]:
+    """Parse "tld=server,tld2=server2" overrides"""
+    overrides = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        tld, _, server = item.partition('=')
+        overrides[tld.strip().lower().lstrip('.')] = server.strip()
+    return overrides
+
+class BootstrapCache:
+    """TLD -> server table kept in memory and mirrored to a local JSON file"""
+
+    def __init__(self, name: str, max_age: int):
+        self.path = PROVIDER_CACHE_DIR / f"{name}.json"
+        self.max_age = max_age
+        self.table: Dict[str, str] = {}
+        self.loaded_at = 0.0
+        self.lock = asyncio.Lock()
+
+    def load_file(self) -> bool:
+        try:
+            if time.time() - self.path.stat().st_mtime > self.max_age:
+                return False
+            self.table = json.loads(self.path.read_text())
+            self.loaded_at = time.monotonic()
+            return True
+        except (OSError, ValueError):
+            return False
+
+    def save_file(self):
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.path.write_text(json.dumps(self.table))
+        except OSError as e:
+            logger.warning(f"Could not write bootstrap cache {self.path}: {e}")
+
+    def fresh(self) -> bool:
+        return bool(self.table) and time.monotonic() - self.loaded_at < self.max_age
+
+    def get(self, tld: str) -> Optional[str]:
+        return self.table.get(tld)
+
+    def put(self, tld: str, server: str):
+        self.table[tld] = server
+        self.save_file()
+
+class RdapProvider(WhoisProvider):
+    """Native RDAP client using the IANA bootstrap registry"""
+    name = "rdap"
+
+    def __init__(self):
+        self.overrides = parse_server_overrides(RDAP_SERVERS)
+        self.bootstrap = BootstrapCache("rdap_dns", PROVIDER_BOOTSTRAP_MAX_AGE)
+
+    async def refresh_bootstrap(self):
+        async with self.bootstrap.lock:
+            if self.bootstrap.fresh() or self.bootstrap.load_file():
+                return
+            response = await upstream_http.get(RDAP_BOOTSTRAP_URL)
+            response.raise_for_status()
+            table = {}
+            for tlds, urls in response.json().get('services', []):
+                for tld in tlds:
+                    table[tld.lower()] = urls[0]
+            self.bootstrap.table = table
+            self.bootstrap.loaded_at = time.monotonic()
+            self.bootstrap.save_file()
+
+    async def server_for(self, tld: str) -> Optional[str]:
+        if tld in self.overrides:
+            return self.overrides[tld]
+        if not self.bootstrap.fresh():
+            await self.refresh_bootstrap()
+        return self.bootstrap.get(tld)
+
+    async def lookup(self, domain: str) -> Optional[Dict[Any, Any]]:
+        base = await self.server_for(domain.rsplit('.', 1)[-1])
+        if not base:
+            return None
+        response = await upstream_http.get(f"{base.rstrip('/')}/domain/{domain}",
+                                           headers={"Accept": "application/rdap+json"})
+        if response.status_code == 404:
+            return {"domain_name": domain, "domain_registered": "no", "provider": self.name}
+        if response.status_code in (400, 422):
+            raise InvalidDomain(f"RDAP rejected {domain}: {response.status_code}")
+        if response.status_code != 200:
+            raise ProviderError(f"RDAP error for {domain}: {response.status_code}")
+        return normalize_rdap(domain, response.json())
+
+def rdap_vcard_value(entity: Dict, field: str) -> Optional[str]:
+    for item in (entity.get('vcardArray') or [None, []])[1]:
+        if item and item[0] == field and len(item) > 3:
+            return item[3] if isinstance(item[3], str) else None
+    return None
+
+def normalize_rdap(domain: str, doc: Dict[str, Any]) -> Dict[str, Any]:
+    events = {event.get('eventAction'): event.get('eventDate') for event in doc.get('events', [])}
+    data: Dict[str, Any] = {
+        "domain_name": (doc.get('ldhName') or domain).lower(),
+        "domain_registered": "yes",
+        "create_date": events.get('registration'),
+        "update_date": events.get('last changed'),
+        "expiry_date": events.get('expiration'),
+        "whois_server": doc.get('port43'),
+        "name_servers": [ns.get('ldhName', '').lower() for ns in doc.get('nameservers', []) if ns.get('ldhName')],
+        "domain_status": doc.get('status', []),
+        "provider": "rdap",
+    }
+    for entity in doc.get('entities', []):
+        roles = entity.get('roles', [])
+        if 'registrar' in roles:
+            data["domain_registrar"] = {"registrar_name": rdap_vcard_value(entity, 'fn')}
+        elif 'registrant' in roles:
+            name = rdap_vcard_value(entity, 'fn')
+            org = rdap_vcard_value(entity, 'org')
+            if name or org:
+                data["registrant_contact"] = {"name": name, "organization": org}
+    return {k: v for k, v in data.items() if v not in (None, [], '')}
+
+class Port43Provider(WhoisProvider):
+    """Raw WHOIS over TCP port 43, following one registrar referral"""
+    name = "port43"
+
+    def __init__(self):
+        self.overrides = parse_server_overrides(WHOIS_PORT43_SERVERS)
+        self.bootstrap = BootstrapCache("whois_servers", PROVIDER_BOOTSTRAP_MAX_AGE)
+        self.bootstrap.load_file()
+
+    @staticmethod
+    def split_server(server: str):
+        host, _, port = server.partition(':')
+        return host, int(port) if port else 43
+
+    async def query(self, server: str, text: str) -> str:
+        host, port = self.split_server(server)
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port), timeout=WHOIS_HTTP_CONNECT_TIMEOUT
+        )
+        try:
+            writer.write(f"{text}\r\n".encode())
+            await writer.drain()
+            raw = await asyncio.wait_for(reader.read(), timeout=WHOIS_HTTP_READ_TIMEOUT)
+        finally:
+            writer.close()
+        return raw.decode('utf-8', errors='replace')
+
+    async def server_for(self, tld: str) -> Optional[str]:
+        if tld in self.overrides:
+            return self.overrides[tld]
+        server = self.bootstrap.get(tld)
+        if server:
+            return server
+        # Ask IANA which server is authoritative for the TLD
+        answer = await self.query(WHOIS_IANA_SERVER, tld)
+        for line in answer.splitlines():
+            key, _, value = line.partition(':')
+            if key.strip().lower() in ('refer', 'whois') and value.strip():
+                self.bootstrap.put(tld, value.strip())
+                return value.strip()
+        return None
+
+    async def lookup(self, domain: str) -> Optional[Dict[Any, Any]]:
+        server = await self.server_for(domain.rsplit('.', 1)[-1])
+        if not server:
+            return None
+        text = await self.query(server, domain)
+        data = parse_port43(domain, text)
+        referral = data.pop("referral", None)
+        if referral and referral.lower() != self.split_server(server)[0].lower():
+            try:
+                detail = parse_port43(domain, await self.query(referral, domain))
+                detail.pop("referral", None)
+                data = {**data, **{k: v for k, v in detail.items() if v}}
+            except Exception as e:
+                logger.debug(f"WHOIS referral to {referral} failed: {e}")
+        data["whois_server"] = data.get("whois_server") or self.split_server(server)[0]
+        return data
+
+PORT43_NOT_FOUND = ('no match for', 'not found', 'no entries found', 'no data found',
+                    'status: free', 'status: available', 'no object found')
+
+PORT43_FIELDS = {
+    'creation date': 'create_date', 'created': 'create_date', 'registered on': 'create_date',
+    'updated date': 'update_date', 'last updated': 'update_date', 'changed': 'update_date',
+    'registry expiry date': 'expiry_date', 'registrar registration expiration date': 'expiry_date',
+    'expiry date': 'expiry_date', 'expiration date': 'expiry_date', 'paid-till': 'expiry_date',
+    'expire-date': 'expiry_date',
+    'registrar': 'registrar', 'registrar whois server': 'referral',
+    'registrant name': 'registrant_name', 'registrant organization': 'registrant_org',
+}
+
+def parse_port43(domain: str, text: str) -> Dict[str, Any]:
+    # Registries put the "not found" notice at the top, before any legal boilerplate
+    head = '\n'.join(line for line in text.strip().splitlines()[:5]).lower()
+    if any(marker in head for marker in PORT43_NOT_FOUND):
+        return {"domain_name": domain, "domain_registered": "no", "provider": "port43"}
+    fields: Dict[str, str] = {}
+    name_servers: List[str] = []
+    statuses: List[str] = []
+    for line in text.splitlines():
+        key, sep, value = line.strip().partition(':')
+        if not sep or not value.strip():
+            continue
+        key, value = key.strip().lower(), value.strip()
+        if key in ('name server', 'nserver', 'nameserver'):
+            name_servers.append(value.split()[0].lower().rstrip('.'))
+        elif key in ('domain status', 'status', 'state'):
+            statuses.append(value.split()[0])
+        elif key in PORT43_FIELDS and PORT43_FIELDS[key] not in fields:
+            fields[PORT43_FIELDS[key]] = value
+    data: Dict[str, Any] = {
+        "domain_name": domain,
+        "domain_registered": "yes",
+        "create_date": fields.get('create_date'),
+        "update_date": fields.get('update_date'),
+        "expiry_date": fields.get('expiry_date'),
+        "name_servers": name_servers,
+        "domain_status": statuses,
+        "referral": fields.get('referral'),
+        "provider": "port43",
+    }
+    if fields.get('registrar'):
+        data["domain_registrar"] = {"registrar_name": fields['registrar']}
+    if fields.get('registrant_name') or fields.get('registrant_org'):
+        data["registrant_contact"] = {"name": fields.get('registrant_name'),
+                                      "organization": fields.get('registrant_org')}
+    return {k: v for k, v in data.items() if v not in (None, [], '')}
+
+class CircuitBreaker:
+    """Fails fast once the recent error rate crosses a threshold, then probes half-open"""
+
+    def __init__(self, window: int, min_calls: int, error_rate: float, open_seconds: float):
+        self.results: deque = deque(maxlen=window)
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.open_seconds = open_seconds
+        self.state = 'closed'
+        self.opened_at = 0.0
+        self.probing = False
+        self.counters = {"opened": 0, "short_circuited": 0}
+
+    def allow(self) -> bool:
+        if self.state == 'open':
+            if time.monotonic() - self.opened_at < self.open_seconds:
+                self.counters["short_circuited"] += 1
+                return False
+            self.state = 'half_open'
+            self.probing = False
+        if self.state == 'half_open':
+            if self.probing:
+                self.counters["short_circuited"] += 1
+                return False
+            self.probing = True
+        return True
+
+    def record(self, ok: bool):
+        if self.state == 'half_open':
+            self.probing = False
+            if ok:
+                self.state = 'closed'
+                self.results.clear()
+            else:
+                self.trip()
+            return
+        self.results.append(ok)
+        failures = self.results.count(False)
+        if len(self.results) >= self.min_calls and failures / len(self.results) >= self.error_rate:
+            self.trip()
+
+    def ready(self) -> bool:
+        """Whether allow() would let a call through, without claiming the half-open probe"""
+        if self.state == 'open':
+            return time.monotonic() - self.opened_at >= self.open_seconds
+        return not (self.state == 'half_open' and self.probing)
+
+    def abandon(self):
+        """A half-open probe was cancelled before it could report"""
+        self.probing = False
+
+    def trip(self):
+        self.state = 'open'
+        self.opened_at = time.monotonic()
+        self.results.clear()
+        self.counters["opened"] += 1
+
+def percentile(samples, q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+class ProviderChain:
+    """Ordered failover across providers, with optional hedged requests"""
+
+    def __init__(self, providers: List[WhoisProvider], hedge: bool, percentile: float, default_delay: float):
+        self.providers = providers
+        self.hedge = hedge
+        self.percentile = percentile
+        self.default_delay = default_delay
+        self.latencies: Dict[str, deque] = {p.name: deque(maxlen=500) for p in providers}
+        self.breakers: Dict[str, CircuitBreaker] = {
+            p.name: CircuitBreaker(CIRCUIT_WINDOW, CIRCUIT_MIN_CALLS, CIRCUIT_ERROR_RATE, CIRCUIT_OPEN_SECONDS)
+            for p in providers
+        }
+        self.counters: Dict[str, Dict[str, int]] = {
+            p.name: {"calls": 0, "successes": 0, "failures": 0, "timeouts": 0, "hedges": 0} for p in providers
+        }
+
+    def hedge_delay(self, provider: WhoisProvider) -> float:
+        samples = self.latencies[provider.name]
+        if len(samples) < 20:
+            return self.default_delay
+        return percentile(samples, self.percentile)
+
+    def timeout_for(self, provider: WhoisProvider) -> float:
+        """Scale the timeout with observed p99 latency instead of a fixed ceiling"""
+        samples = self.latencies[provider.name]
+        if len(samples) < 20:
+            return WHOIS_HTTP_READ_TIMEOUT
+        adaptive = percentile(samples, 0.99) * ADAPTIVE_TIMEOUT_MULTIPLIER
+        return min(max(adaptive, ADAPTIVE_TIMEOUT_MIN), WHOIS_HTTP_READ_TIMEOUT)
+
+    def available(self, name: str) -> bool:
+        """Whether a call to this provider would get past its circuit breaker"""
+        breaker = self.breakers.get(name)
+        return breaker is not None and breaker.ready()
+
+    def can_attempt(self) -> bool:
+        """Whether a lookup could reach any provider, or every circuit would short-circuit it"""
+        return any(breaker.ready() for breaker in self.breakers.values())
+
+    async def call(self, provider: WhoisProvider, domain: str) -> Optional[Dict[Any, Any]]:
+        breaker = self.breakers[provider.name]
+        if not breaker.allow():
+            return None
+        counters = self.counters[provider.name]
+        counters["calls"] += 1
+        in_flight.inc("upstream")
+        started = time.monotonic()
+        try:
+            data = await asyncio.wait_for(provider.lookup(domain), timeout=self.timeout_for(provider))
+        except InvalidDomain:
+            # The provider is healthy, the input is not
+            breaker.record(True)
+            upstream_latency.observe(time.monotonic() - started, provider.name, "invalid")
+            raise
+        except asyncio.TimeoutError:
+            logger.warning(f"{provider.name} lookup for {domain} timed out")
+            counters["timeouts"] += 1
+            counters["failures"] += 1
+            breaker.record(False)
+            upstream_latency.observe(time.monotonic() - started, provider.name, "timeout")
+            errors_total.inc("upstream", "timeout")
+            return None
+        except asyncio.CancelledError:
+            breaker.abandon()
+            raise
+        except Exception as e:
+            logger.warning(f"{provider.name} lookup for {domain} failed: {e}")
+            counters["failures"] += 1
+            breaker.record(False)
+            upstream_latency.observe(time.monotonic() - started, provider.name, "error")
+            errors_total.inc("upstream", "error")
+            return None
+        finally:
+            in_flight.dec("upstream")
+        elapsed = time.monotonic() - started
+        breaker.record(True)
+        self.latencies[provider.name].append(elapsed)
+        upstream_latency.observe(elapsed, provider.name, "ok")
+        if data:
+            counters["successes"] += 1
+        return data
+
+    async def bulk(self, domains: List[str]) -> Dict[str, Dict[Any, Any]]:
+        """One WhoisFreaks bulk lookup, counted against the same circuit breaker as single lookups"""
+        breaker = self.breakers.get("whoisfreaks")
+        if breaker is None or not breaker.allow():
+            return {}
+        counters = self.counters["whoisfreaks"]
+        counters["calls"] += 1
+        in_flight.inc("upstream")
+        try:
+            results = await fetch_whois_bulk_live(domains)
+        except asyncio.CancelledError:
+            breaker.abandon()
+            raise
+        finally:
+            in_flight.dec("upstream")
+        breaker.record(results is not None)
+        if results is None:
+            counters["failures"] += 1
+            errors_total.inc("upstream", "error")
+            return {}
+        counters["successes"] += 1
+        return results
+
+    async def hedged(self, first: WhoisProvider, second: WhoisProvider, domain: str) -> Optional[Dict[Any, Any]]:
+        primary = asyncio.create_task(self.call(first, domain))
+        done, _ = await asyncio.wait({primary}, timeout=self.hedge_delay(first))
+        if done and primary.result():
+            return primary.result()
+        self.counters[second.name]["hedges"] += 1
+        pending = {primary, asyncio.create_task(self.call(second, domain))} - done
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.result():
+                        return task.result()
+            return None
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def lookup(self, domain: str) -> Optional[Dict[Any, Any]]:
+        providers = list(self.providers)
+        while providers:
+            if self.hedge and len(providers) > 1:
+                data = await self.hedged(providers[0], providers[1], domain)
+                providers = providers[2:]
+            else:
+                data = await self.call(providers[0], domain)
+                providers = providers[1:]
+            if data:
+                return data
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            p.name: {
+                **self.counters[p.name],
+                **self.breakers[p.name].counters,
+                "circuit": self.breakers[p.name].state,
+                "hedge_delay": round(self.hedge_delay(p), 3),
+                "timeout": round(self.timeout_for(p), 3),
+            }
+            for p in self.providers
+        }
+
+PROVIDER_TYPES = {"whoisfreaks": WhoisFreaksProvider, "rdap": RdapProvider, "port43": Port43Provider}
+
+whois_providers = ProviderChain(
+    [PROVIDER_TYPES[name.strip()]() for name in WHOIS_PROVIDERS.split(',') if name.strip() in PROVIDER_TYPES],
+    WHOIS_HEDGE_ENABLED, WHOIS_HEDGE_PERCENTILE, WHOIS_HEDGE_DELAY
+)
+
+async def fetch_whois_data(domain: str, user_id: Optional[int] = None,
+                           priority: int = PRIORITY_API) -> Optional[WhoisRecord]:
+    """Fetch a WHOIS record, serving from the cache when possible"""
+    domain = clean_domain(domain)
+    if whois_cache.is_negative(domain):
+        return None
+    entry = await whois_cache.get_entry(domain)
+    if entry is not None:
+        record, stale = entry
+        if stale:
+            cache_refresher.schedule(domain)
+        return record
+    return await whois_flight.do(domain, lambda: fetch_and_cache_whois(domain, user_id, priority))
+
+async def fetch_and_cache_whois(domain: str, user_id: Optional[int] = None,
+                                priority: int = PRIORITY_API) -> Optional[WhoisRecord]:
+    """Live lookup that parses and caches successful results"""
+    # Don't spend quota on a lookup every open circuit would refuse
+    if not whois_providers.can_attempt():
+        return None
+    try:
+        async with upstream_quota.slot(user_id, priority):
+            if not whois_providers.can_attempt():
+                # The circuits opened while this call was queued
+                await upstream_quota.refund_daily(1)
+                return None
+            data = await whois_providers.lookup(domain)
+            if not data or data.get('status') == False or data.get('provider', 'whoisfreaks') != 'whoisfreaks':
+                # The credit only pays for a WhoisFreaks answer; RDAP and port 43 are free
+                await upstream_quota.refund_daily(1)
+    except QuotaExceeded as e:
+        logger.warning(f"Skipping upstream lookup for {domain}: {e}")
+        return None
+    except InvalidDomain as e:
+        logger.info(str(e))
+        whois_cache.set_negative(domain)
+        return None
+    if not data or data.get('status') == False:
+        return None
+    record = WhoisRecord.from_raw(data, domain)
+    await whois_cache.set(domain, record)
+    catalog_record(domain, record)
+    return record
+
+def catalog_record(domain: str, record: WhoisRecord):
+    """Queue an upsert of the record's expiry, registrar and status into domain_catalog"""
+    query_log.enqueue("domain_catalog", UpdateOne({"_id": domain}, {"$set": {
+        "tld": domain.rsplit('.', 1)[-1],
+        "expiry_at": record.expiry_at,
+        "registrar": record.registrar,
+        "registered": record.registered,
+        "updated_at": datetime.now(timezone.utc),
+    }}, upsert=True))
+
+class CacheRefresher:
+    """Rate-limited background revalidation of stale and soon-to-expire popular entries"""
+
+    def __init__(self, rate: float, burst: float):
+        self.bucket = TokenBucket(rate, burst)
+        self.pending = set()
+        self.tasks = set()
+        self.prewarm_task: Optional[asyncio.Task] = None
+        self.counters = {"scheduled": 0, "skipped": 0, "prewarm_runs": 0}
+
+    def schedule(self, domain: str) -> bool:
+        if domain in self.pending:
+            return False
+        if not self.bucket.ready():
+            # Over the refresh budget: keep serving stale, a later hit will retry
+            self.counters["skipped"] += 1
+            return False
+        self.bucket.take()
+        self.pending.add(domain)
+        self.counters["scheduled"] += 1
+        task = asyncio.create_task(self.refresh(domain))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return True
+
+    async def refresh(self, domain: str):
+        try:
+            await whois_flight.do(domain, lambda: fetch_and_cache_whois(domain, priority=PRIORITY_BACKGROUND))
+        except Exception as e:
+            logger.warning(f"Background refresh of {domain} failed: {e}")
+        finally:
+            self.pending.discard(domain)
+
+    async def prewarm(self):
+        """Refresh the most popular domains before they go stale"""
+        cursor = db.stats_domains.find({}, {"_id": 1}).sort("count", -1).limit(PREWARM_TOP_N)
+        domains = [doc["_id"] async for doc in cursor]
+        remaining = await whois_cache.fresh_remaining(domains)
+        for domain in domains:
+            if remaining.get(domain, 0) < PREWARM_LEAD_SECONDS:
+                if not self.schedule(domain) and not self.bucket.ready():
+                    break
+        self.counters["prewarm_runs"] += 1
+
+    async def run_prewarm(self):
+        while True:
+            try:
+                await self.prewarm()
+            except Exception as e:
+                logger.error(f"Cache pre-warming failed: {e}")
+            await asyncio.sleep(PREWARM_INTERVAL)
+
+    def start(self):
+        if PREWARM_TOP_N > 0 and self.prewarm_task is None:
+            self.prewarm_task = asyncio.create_task(self.run_prewarm())
+
+    def stop(self):
+        if self.prewarm_task is not None:
+            self.prewarm_task.cancel()
+            self.prewarm_task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.counters, "pending": len(self.pending)}
+
+cache_refresher = CacheRefresher(CACHE_REFRESH_RATE, CACHE_REFRESH_BURST)
+
+def batch_result(domain: str, record: Optional[WhoisRecord]) -> Dict[str, Any]:
+    if record is not None:
+        return {"domain": domain, "data": record.to_api()}
+    return {"domain": domain, "error": "lookup_failed"}
+
+async def resolve_whois_chunk(domains: List[str], limit: Optional[asyncio.Semaphore] = None):
+    """Yield (domain, record) for a chunk: cache first, then one bulk call, then single lookups.
+
+    Every lookup goes through whois_flight, so concurrent lookups of a domain
+    in the bulk call wait for it instead of paying again. Single lookups run
+    concurrently, at most `limit` at a time when given.
+    """
+    misses = []
+    for domain in domains:
+        if whois_cache.is_negative(domain):
+            yield domain, None
+            continue
+        entry = await whois_cache.get_entry(domain)
+        if entry is not None:
+            record, stale = entry
+            if stale:
+                cache_refresher.schedule(domain)
+            yield domain, record
+        else:
+            misses.append(domain)
+
+    if not misses:
+        return
+
+    # Domains already being looked up join that lookup rather than the bulk call
+    bulk_domains = [domain for domain in misses if domain not in whois_flight.inflight]
+    if not (WHOIS_BULK_ENABLED and len(bulk_domains) > 1 and whois_providers.available("whoisfreaks")):
+        bulk_domains = []
+
+    async def bulk_lookup() -> Dict[str, WhoisRecord]:
+        try:
+            async with upstream_quota.slot(priority=PRIORITY_BATCH, cost=len(bulk_domains)):
+                bulk = await whois_providers.bulk(bulk_domains)
+        except QuotaExceeded as e:
+            logger.warning(f"Skipping bulk lookup of {len(bulk_domains)} domains: {e}")
+            return {}
+        # Only answered domains are paid for here; the rest are charged again by their single lookups
+        unanswered = sum(1 for domain in bulk_domains if domain not in bulk)
+        if unanswered:
+            await upstream_quota.refund_daily(unanswered)
+        records = {}
+        for domain in bulk_domains:
+            if domain in bulk:
+                records[domain] = record = WhoisRecord.from_raw(bulk[domain], domain)
+                await whois_cache.set(domain, record)
+                catalog_record(domain, record)
+        return records
+
+    bulk_task = asyncio.create_task(bulk_lookup()) if bulk_domains else None
+    in_bulk = set(bulk_domains)
+
+    async def lookup(domain: str) -> Optional[WhoisRecord]:
+        if domain in in_bulk:
+            # Shielded: the bulk call is shared by every domain in it
+            record = (await asyncio.shield(bulk_task)).get(domain)
+            if record is not None:
+                return record
+        async with limit or nullcontext():
+            return await fetch_and_cache_whois(domain, priority=PRIORITY_BATCH)
+
+    async def single(domain: str) -> tuple:
+        try:
+            record = await whois_flight.do(domain, lambda: lookup(domain))
+        except Exception as e:
+            logger.error(f"Batch WHOIS lookup failed for {domain}: {e}")
+            record = None
+        return domain, record
+
+    tasks = [asyncio.create_task(single(domain)) for domain in misses]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
+async def stream_whois_batch(domains: List[str], concurrency: int):
+    """Yield NDJSON lines in completion order using a bounded pool of workers"""
+    chunk_size = WHOIS_BULK_CHUNK_SIZE if WHOIS_BULK_ENABLED else 1
+    jobs: asyncio.Queue = asyncio.Queue()
+    for i in range(0, len(domains), chunk_size):
+        jobs.put_nowait(domains[i:i + chunk_size])
+    results: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 4)
+    # Shared by every chunk's single lookups, so fallbacks stay within the batch's concurrency
+    limit = asyncio.Semaphore(concurrency)
+    done = object()
+
+    async def worker():
+        try:
+            while True:
+                try:
+                    chunk = jobs.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                emitted = set()
+                try:
+                    async for domain, record in resolve_whois_chunk(chunk, limit):
+                        emitted.add(domain)
+                        await results.put(batch_result(domain, record))
+                except Exception as e:
+                    logger.error(f"Batch WHOIS worker error: {e}")
+                    for domain in chunk:
+                        if domain not in emitted:
+                            await results.put({"domain": domain, "error": "lookup_failed"})
+        finally:
+            await results.put(done)
+
+    workers = [asyncio.create_task(worker()) for _ in range(min(concurrency, jobs.qsize()))]
+    try:
+        running = len(workers)
+        while running:
+            item = await results.get()
+            if item is done:
+                running -= 1
+                continue
+            yield json.dumps(item) + "\n"
+    finally:
+        for task in workers:
+            task.cancel()
+
+def field_line(label: str, value: Any) -> str:
+    return f"{label}: `{escape_code(value)}`"
+
+def build_whois_response(record: WhoisRecord, domain: str, lang: str) -> str:
+    msg = LABELS[lang]
+    
+    lines = [TEMPLATES[lang]['domain_info_title'].render(domain=domain), ""]
+    
+    # Domain registration status
+    if record.registered:
+        lines.append(f"📌 {msg['domain_registered']}")
+    else:
+        lines.append(f"🟢 {msg['domain_available']}")
+    lines.append("")
+    
+    lines.append(field_line(msg['domain_name'], domain))
+    if record.registrar:
+        lines.append(f"{msg['registrar']}: {escape_markdown(record.registrar)}")
+    
+    # Dates
+    if record.create_date:
+        lines.append(field_line(msg['creation_date'], record.create_date))
+    if record.update_date:
+        lines.append(field_line(msg['update_date'], record.update_date))
+    if record.expiry_date:
+        lines.append(field_line(msg['expiry_date'], record.expiry_date))
+        days_left = record.days_left
+        if days_left is not None:
+            if days_left > 0:
+                lines.append(f"   ⏱️ {days_left} {msg['days_left']}")
+            else:
+                lines.append(f"   ⚠️ {msg['expired']}")
+    
+    if record.whois_server:
+        lines.append(field_line(msg['whois_server'], record.whois_server))
+    if record.name_servers:
+        lines.append(field_line(msg['name_servers'], ', '.join(record.name_servers[:4])))
+    if record.statuses:
+        lines.append(field_line(msg['status'], ', '.join(record.statuses[:3])[:50]))
+    if record.registrant:
+        lines.append(f"{msg['registrant']}: {escape_markdown(record.registrant)}")
+    
+    return '\n'.join(lines)
+
+def build_check_response(record: WhoisRecord, domain: str, lang: str) -> str:
+    msg = LABELS[lang]
+    lines = [msg['check_title'], "", field_line(msg['domain_name'], domain), ""]
+    if record.registered:
+        lines.append(f"📌 *{msg['domain_registered']}*")
+        if record.registrar:
+            lines.append(f"{msg['registrar']}: {escape_markdown(record.registrar)}")
+    else:
+        lines.append(f"🎉 *{msg['domain_available']}*")
+    return '\n'.join(lines)
+
+def build_expiry_response(record: WhoisRecord, domain: str, lang: str) -> str:
+    msg = LABELS[lang]
+    lines = [msg['expiry_title'], "", field_line(msg['domain_name'], domain), ""]
+    if record.expiry_date:
+        lines.append(f"📅 *{escape_markdown(record.expiry_date)}*")
+        days_left = record.days_left
+        if days_left is not None:
+            if days_left > 0:
+                lines.append(f"⏱️ {days_left} {msg['days_left']}")
+            else:
+                lines.append(f"⚠️ *{msg['expired']}*")
+    else:
+        lines.append("❓ N/A")
+    return '\n'.join(lines)
+
+RESPONSE_BUILDERS = {
+    "whois": build_whois_response,
+    "check": build_check_response,
+    "expiry": build_expiry_response,
+}
+
+class RenderCache:
+    """LRU of rendered bot responses keyed by (record version, language, command).
+
+    A record is immutable once parsed, so a repeat lookup served from the
+    WHOIS cache reuses the finished text. days_left is part of the key so
+    cached text rolls over at midnight UTC.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[tuple, str]" = OrderedDict()
+        self.counters = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def render(self, command: str, record: WhoisRecord, domain: str, lang: str) -> str:
+        key = (record.version, lang, command, domain, record.days_left)
+        text = self.entries.get(key)
+        if text is not None:
+            self.entries.move_to_end(key)
+            self.counters["hits"] += 1
+            return text
+        self.counters["misses"] += 1
+        text = RESPONSE_BUILDERS[command](record, domain, lang)
+        self.entries[key] = text
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.counters["evictions"] += 1
+        return text
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.counters["hits"] + self.counters["misses"]
+        return {
+            **self.counters,
+            "size": len(self.entries),
+            "max_entries": self.max_entries,
+            "hit_rate": round(self.counters["hits"] / lookups, 4) if lookups else 0.0,
+        }
+
+render_cache = RenderCache(RENDER_CACHE_MAX_ENTRIES)
+
+def format_whois_response(record: WhoisRecord, user_id: int) -> str:
+    """Format WHOIS data for Telegram"""
+    return render_cache.render("whois", record, record.domain or 'N/A', user_prefs.language(user_id))
+
+def format_check_response(record: WhoisRecord, domain: str, user_id: int) -> str:
+    """Format domain check response"""
+    return render_cache.render("check", record, domain, user_prefs.language(user_id))
+
+def format_expiry_response(record: WhoisRecord, domain: str, user_id: int) -> str:
+    """Format expiry date response"""
+    return render_cache.render("expiry", record, domain, user_prefs.language(user_id))
+
+# Expiry watchlist
+def next_watch_interval(days_left: Optional[int]) -> float:
+    """Seconds until the next check: rare while expiry is far away, frequent as it nears"""
+    if days_left is None:
+        interval = 86400.0
+    elif days_left < 0:
+        # Past expiry: renewals still land during the grace period, after it the domain has most likely dropped
+        interval = 86400.0 if -days_left <= WATCH_EXPIRED_GRACE_DAYS else 7 * 86400.0
+    else:
+        interval = min(max(days_left / 4, 1 / 24), 7) * 86400
+        # Make sure a check lands before the next threshold is crossed
+        upcoming = [t for t in WATCH_THRESHOLDS if t < days_left]
+        if upcoming:
+            interval = min(interval, max((days_left - upcoming[0]) * 86400, 3600))
+    return interval * random.uniform(0.9, 1.1)
+
+class WatchScheduler:
+    """Min-heap of upcoming domain checks, topped up from Mongo every tick.
+
+    watch_domains.next_check is the durable schedule; the heap only holds
+    what is due within WATCH_HORIZON_SECONDS, so memory stays small no matter
+    how many domains are watched. Each tick refreshes at most
+    WATCH_MAX_PER_TICK domains through the batch lookup path.
+    """
+
+    def __init__(self):
+        self.heap: List[tuple] = []
+        self.queued = set()
+        self.task: Optional[asyncio.Task] = None
+        self.counters = {"checked": 0, "notified": 0, "ticks": 0}
+
+    async def refill(self, now: datetime):
+        horizon = now + timedelta(seconds=WATCH_HORIZON_SECONDS)
+        cursor = db.watch_domains.find(
+            {"next_check": {"$lte": horizon}}, {"next_check": 1}
+        ).sort("next_check", 1).limit(WATCH_MAX_PER_TICK * 10)
+        async for doc in cursor:
+            if doc["_id"] not in self.queued:
+                heapq.heappush(self.heap, (as_utc(doc["next_check"]), doc["_id"]))
+                self.queued.add(doc["_id"])
+
+    def due(self, now: datetime) -> List[str]:
+        domains = []
+        while self.heap and self.heap[0][0] <= now and len(domains) < WATCH_MAX_PER_TICK:
+            _, domain = heapq.heappop(self.heap)
+            self.queued.discard(domain)
+            domains.append(domain)
+        return domains
+
+    async def tick(self):
+        now = datetime.now(timezone.utc)
+        await self.refill(now)
+        domains = self.due(now)
+        if domains:
+            # Skip domains that were unwatched or rescheduled since they were queued
+            cursor = db.watch_domains.find({"_id": {"$in": domains}, "next_check": {"$lte": now}}, {"_id": 1})
+            domains = [doc["_id"] async for doc in cursor]
+        if domains:
+            async for domain, record in resolve_whois_chunk(domains, asyncio.Semaphore(WHOIS_BATCH_CONCURRENCY)):
+                await self.apply(domain, record)
+        self.counters["ticks"] += 1
+
+    async def apply(self, domain: str, record: Optional[WhoisRecord]):
+        """Store the refreshed expiry, reschedule, and notify watchers that crossed a threshold"""
+        self.counters["checked"] += 1
+        expiry_date = record.expiry_date if record else None
+        days_left = record.days_left if record else None
+        next_check = datetime.now(timezone.utc) + timedelta(seconds=next_watch_interval(days_left))
+        update = {"next_check": next_check, "checked_at": datetime.now(timezone.utc)}
+        if record:
+            update["expiry_date"] = expiry_date
+        await db.watch_domains.update_one({"_id": domain}, {"$set": update})
+        if days_left is None or days_left < 0:
+            return
+        crossed = [t for t in WATCH_THRESHOLDS if days_left <= t]
+        if not crossed:
+            return
+        # Compared as calendar days: providers format the same expiry date differently
+        expiry_day = record.expiry_at.date().isoformat()
+        async for watch in db.watchlist.find({"domain": domain}):
+            notified = watch.get("notified", {})
+            # A renewal moves the expiry date and re-arms every threshold
+            notified_at = parse_whois_date(notified.get("expiry_date"))
+            if notified_at is None or notified_at.date().isoformat() != expiry_day:
+                notified = {"expiry_date": expiry_day, "thresholds": []}
+            pending = [t for t in crossed if t not in notified["thresholds"]]
+            if not pending:
+                continue
+            if not await self.notify(watch["user_id"], domain, expiry_date, days_left):
+                continue
+            notified["thresholds"] = sorted(set(notified["thresholds"]) | set(crossed))
+            await db.watchlist.update_one({"_id": watch["_id"]}, {"$set": {"notified": notified}})
+
+    async def notify(self, user_id: int, domain: str, expiry_date: str, days_left: int) -> bool:
+        if telegram_app is None:
+            return False
+        await user_prefs.load(user_id)
+        text = render_msg(user_id, 'watch_alert', domain=domain, expiry=expiry_date, days=days_left)
+        try:
+            await telegram_app.bot.send_message(chat_id=user_id, text=text, parse_mode=PARSE_MODE)
+        except Exception as e:
+            logger.warning(f"Could not notify {user_id} about {domain}: {e}")
+            return False
+        self.counters["notified"] += 1
+        return True
+
+    async def run(self):
+        while True:
+            try:
+                await self.tick()
+            except Exception as e:
+                logger.error(f"Watch scheduler tick failed: {e}")
+            await asyncio.sleep(WATCH_TICK_SECONDS)
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    def stop(self):
+        """Stop checking; the durable schedule in watch_domains is picked up by the next runner"""
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        self.heap.clear()
+        self.queued.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.counters, "heap_size": len(self.heap)}
+
+watch_scheduler = WatchScheduler()
+
+async def add_watch(user_id: int, domain: str) -> str:
+    """Add a domain to a user's watchlist; returns 'added', 'exists' or 'limit'"""
+    if await db.watchlist.find_one({"user_id": user_id, "domain": domain}, {"_id": 1}):
+        return 'exists'
+    if await db.watchlist.count_documents({"user_id": user_id}) >= WATCH_MAX_PER_USER:
+        return 'limit'
+    await db.watchlist.update_one(
+        {"user_id": user_id, "domain": domain},
+        {"$setOnInsert": {"created_at": datetime.now(timezone.utc), "notified": {}}},
+        upsert=True
+    )
+    await db.watch_domains.update_one(
+        {"_id": domain},
+        {"$setOnInsert": {"next_check": datetime.now(timezone.utc)}, "$inc": {"watchers": 1}},
+        upsert=True
+    )
+    return 'added'
+
+async def remove_watch(user_id: int, domain: str) -> bool:
+    result = await db.watchlist.delete_one({"user_id": user_id, "domain": domain})
+    if not result.deleted_count:
+        return False
+    doc = await db.watch_domains.find_one_and_update(
+        {"_id": domain}, {"$inc": {"watchers": -1}}, return_document=ReturnDocument.AFTER
+    )
+    if doc and doc.get("watchers", 0) <= 0:
+        await db.watch_domains.delete_one({"_id": domain, "watchers": {"$lte": 0}})
+    return True
+
+async def list_watches(user_id: int) -> List[Dict[str, Any]]:
+    watches = await db.watchlist.find({"user_id": user_id}, {"domain": 1}).sort("domain", 1).to_list(WATCH_MAX_PER_USER)
+    domains = [w["domain"] for w in watches]
+    expiries = {}
+    async for doc in db.watch_domains.find({"_id": {"$in": domains}}, {"expiry_date": 1}):
+        expiries[doc["_id"]] = doc.get("expiry_date")
+    return [{"domain": d, "expiry_date": expiries.get(d), "days_left": days_until(expiries.get(d))} for d in domains]
+
+# Approximate analytics sketches
+class HyperLogLog:
+    """Mergeable cardinality estimator"""
+
+    def __init__(self, precision: int, registers: Optional[bytes] = None):
+        self.p = precision
+        self.m = 1 << precision
+        self.registers = bytearray(registers) if registers else bytearray(self.m)
+
+    def add(self, value: Any):
+        h = int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), 'big')
+        idx = h >> (64 - self.p)
+        rest = h & ((1 << (64 - self.p)) - 1)
+        rank = (64 - self.p) - rest.bit_length() + 1
+        if rank > self.registers[idx]:
+            self.registers[idx] = rank
+
+    def merge(self, other: "HyperLogLog"):
+        self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+
+    def count(self) -> int:
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        estimate = alpha * self.m * self.m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * self.m and zeros:
+            estimate = self.m * math.log(self.m / zeros)
+        return int(round(estimate))
+
+    def relative_error(self) -> float:
+        return 1.04 / math.sqrt(self.m)
+
+class SpaceSaving:
+    """Mergeable top-K heavy hitters; each count overestimates by at most its error"""
+
+    def __init__(self, capacity: int, items: Optional[List[List[Any]]] = None):
+        self.capacity = capacity
+        self.counts: Dict[str, List[int]] = {item: [count, error] for item, count, error in (items or [])}
+        self.total = sum(count for count, _ in self.counts.values())
+
+    def add(self, item: str, count: int = 1):
+        self.total += count
+        if item in self.counts:
+            self.counts[item][0] += count
+        elif len(self.counts) < self.capacity:
+            self.counts[item] = [count, 0]
+        else:
+            victim = min(self.counts, key=lambda k: self.counts[k][0])
+            floor = self.counts.pop(victim)[0]
+            self.counts[item] = [floor + count, floor]
+
+    def merge(self, other: "SpaceSaving"):
+        for item, (count, error) in other.counts.items():
+            current = self.counts.setdefault(item, [0, 0])
+            current[0] += count
+            current[1] += error
+        self.total += other.total
+        if len(self.counts) > self.capacity:
+            keep = sorted(self.counts.items(), key=lambda kv: kv[1][0], reverse=True)[:self.capacity]
+            self.counts = dict(keep)
+
+    def top(self, k: int) -> List[Dict[str, Any]]:
+        ranked = sorted(self.counts.items(), key=lambda kv: kv[1][0], reverse=True)[:k]
+        return [{"domain": item, "count": count, "error": error} for item, (count, error) in ranked]
+
+    def dump(self) -> List[List[Any]]:
+        return [[item, count, error] for item, (count, error) in self.counts.items()]
+
+class QuerySketches:
+    """Per-bucket unique-user and top-domain sketches, merged on read.
+
+    Each process keeps sketches for the buckets it has seen recently and
+    periodically replaces its own per-bucket document in Mongo, so readers
+    merge one document per (bucket, process) regardless of history size.
+    """
+
+    def __init__(self, bucket_seconds: int, precision: int, capacity: int):
+        self.bucket_seconds = bucket_seconds
+        self.precision = precision
+        self.capacity = capacity
+        self.node_id = uuid.uuid4().hex
+        self.buckets: Dict[int, Dict[str, Any]] = {}
+        self.dirty = set()
+        self.task: Optional[asyncio.Task] = None
+
+    def bucket_of(self, ts: datetime) -> int:
+        return int(ts.timestamp()) // self.bucket_seconds * self.bucket_seconds
+
+    def add_many(self, docs: List[Dict[str, Any]]):
+        for doc in docs:
+            bucket = self.bucket_of(doc["timestamp"])
+            sketch = self.buckets.get(bucket)
+            if sketch is None:
+                sketch = {"users": HyperLogLog(self.precision), "domains": SpaceSaving(self.capacity), "total": 0}
+                self.buckets[bucket] = sketch
+            sketch["users"].add(doc["user_id"])
+            sketch["domains"].add(doc["domain"])
+            sketch["total"] += 1
+            self.dirty.add(bucket)
+
+    async def persist(self):
+        for bucket in list(self.dirty):
+            sketch = self.buckets[bucket]
+            start = datetime.fromtimestamp(bucket, timezone.utc)
+            await db.stats_sketches.replace_one({"_id": f"{bucket}:{self.node_id}"}, {
+                "_id": f"{bucket}:{self.node_id}",
+                "bucket": start,
+                "users": bytes(sketch["users"].registers),
+                "domains": sketch["domains"].dump(),
+                "total": sketch["total"],
+                "expires_at": start + timedelta(days=SKETCH_RETENTION_DAYS),
+            }, upsert=True)
+            self.dirty.discard(bucket)
+        # Only the current bucket can still receive writes
+        current = self.bucket_of(datetime.now(timezone.utc))
+        for bucket in [b for b in self.buckets if b < current and b not in self.dirty]:
+            del self.buckets[bucket]
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(SKETCH_FLUSH_INTERVAL)
+            try:
+                await self.persist()
+            except Exception as e:
+                logger.error(f"Failed to persist stats sketches: {e}")
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        await self.persist()
+
+    async def window(self, since: datetime) -> Dict[str, Any]:
+        """Merge every stored bucket from `since` onwards"""
+        users = HyperLogLog(self.precision)
+        domains = SpaceSaving(self.capacity)
+        total = 0
+        cursor = db.stats_sketches.find({"bucket": {"$gte": datetime.fromtimestamp(self.bucket_of(since), timezone.utc)}})
+        async for doc in cursor:
+            users.merge(HyperLogLog(self.precision, doc["users"]))
+            domains.merge(SpaceSaving(self.capacity, doc["domains"]))
+            total += doc["total"]
+        return {
+            "total_queries": total,
+            "unique_users": users.count(),
+            "popular_domains": domains.top(10),
+            "error_bounds": {
+                "unique_users_relative": round(users.relative_error(), 4),
+                "domain_count_absolute": total // self.capacity,
+            },
+        }
+
+query_sketches = QuerySketches(SKETCH_BUCKET_SECONDS, SKETCH_HLL_PRECISION, SKETCH_TOPK_CAPACITY)
+
+# Query logging and incrementally maintained stats
+async def record_query_stats(docs: List[Dict[str, Any]]):
+    """Fold a batch of logged queries into the stats rollups"""
+    if not docs:
+        return
+    now = datetime.now(timezone.utc)
+    user_ids = {doc["user_id"] for doc in docs}
+    users = await db.stats_users.bulk_write([
+        UpdateOne({"_id": user_id}, {"$setOnInsert": {"first_seen": now}}, upsert=True)
+        for user_id in user_ids
+    ], ordered=False)
+    inc = {"total_queries": len(docs)}
+    if users.upserted_count:
+        inc["unique_users"] = users.upserted_count
+    await db.stats_counters.update_one({"_id": "global"}, {"$inc": inc}, upsert=True)
+    domain_counts = Counter(doc["domain"] for doc in docs)
+    await db.stats_domains.bulk_write([
+        UpdateOne({"_id": domain}, {"$inc": {"count": count}}, upsert=True)
+        for domain, count in domain_counts.items()
+    ], ordered=False)
+
+class WriteBehindLogger:
+    """Buffers log documents (and upserts) in memory and writes them in batches by size or time"""
+
+    def __init__(self, max_size: int, flush_size: int, flush_interval: float, drop_policy: str = 'newest'):
+        self.max_size = max_size
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.drop_policy = drop_policy
+        self.buffer: deque = deque()
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.stopping = False
+        self.counters = {"enqueued": 0, "written": 0, "dropped": 0, "failed": 0, "flushes": 0}
+
+    def enqueue(self, collection: str, doc: Any):
+        """Queue an insert (a document) or a write operation such as UpdateOne"""
+        if len(self.buffer) >= self.max_size:
+            self.counters["dropped"] += 1
+            if self.drop_policy != 'oldest':
+                return
+            self.buffer.popleft()
+        self.buffer.append((collection, doc))
+        self.counters["enqueued"] += 1
+        if len(self.buffer) >= self.flush_size:
+            self.wakeup.set()
+
+    async def flush(self):
+        while self.buffer:
+            batch = [self.buffer.popleft() for _ in range(min(self.flush_size, len(self.buffer)))]
+            grouped: Dict[str, List[Dict[str, Any]]] = {}
+            operations: Dict[str, List[Any]] = {}
+            for collection, item in batch:
+                if isinstance(item, dict):
+                    grouped.setdefault(collection, []).append(item)
+                else:
+                    operations.setdefault(collection, []).append(item)
+            for collection, ops in operations.items():
+                try:
+                    await db[collection].bulk_write(ops, ordered=False)
+                    self.counters["written"] += len(ops)
+                except Exception as e:
+                    logger.error(f"Failed to apply {len(ops)} {collection} writes: {e}")
+                    self.counters["failed"] += len(ops)
+            for collection, docs in grouped.items():
+                try:
+                    await db[collection].insert_many(docs, ordered=False)
+                    self.counters["written"] += len(docs)
+                except Exception as e:
+                    logger.error(f"Failed to write {len(docs)} {collection} documents: {e}")
+                    self.counters["failed"] += len(docs)
+                    continue
+                if collection == "whois_queries":
+                    query_sketches.add_many(docs)
+                    try:
+                        await record_query_stats(docs)
+                    except Exception as e:
+                        logger.error(f"Failed to update stats rollups: {e}")
+                    stats_stream.notify()
+            self.counters["flushes"] += 1
 
-def escape_markdown(text: str) -> str:
-    """Escape special characters for Telegram Markdown"""
-    if not text:
-        return ""
-    special_chars = ['_', '*', '[', ']', '(', ')', '~', '`', '>', '#', '+', '-', '=', '|', '{', '}', '.', '!']
-    for char in special_chars:
-        text = str(text).replace(char, f'\\{char}')
-    return text
+    async def run(self):
+        while not self.stopping:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            await self.flush()
 
-def is_valid_domain(domain: str) -> bool:
-    """Check if domain format is valid"""
-    if not domain:
-        return False
-    domain = domain.lower().strip()
-    # Remove http/https prefix
-    if domain.startswith('http://'):
-        domain = domain[7:]
-    if domain.startswith('https://'):
-        domain = domain[8:]
-    # Remove www prefix
-    if domain.startswith('www.'):
-        domain = domain[4:]
-    # Basic validation
-    if '.' not in domain:
-        return False
-    if len(domain) < 3:
-        return False
-    return True
+    def start(self):
+        if self.task is None:
+            self.stopping = False
+            self.task = asyncio.create_task(self.run())
 
-def clean_domain(domain: str) -> str:
-    """Clean domain name"""
-    domain = domain.lower().strip()
-    if domain.startswith('http://'):
-        domain = domain[7:]
-    if domain.startswith('https://'):
-        domain = domain[8:]
-    if domain.startswith('www.'):
-        domain = domain[4:]
-    # Remove trailing slash
-    if domain.endswith('/'):
-        domain = domain[:-1]
-    return domain
-
-async def fetch_whois_data(domain: str) -> Optional[Dict[Any, Any]]:
-    """Fetch WHOIS data from WhoisFreaks API"""
+    async def stop(self):
+        """Stop the background flusher and write out whatever is still buffered"""
+        if self.task is not None:
+            # Not cancelled: a batch popped for an in-flight write would be lost
+            self.stopping = True
+            self.wakeup.set()
+            await self.task
+            self.task = None
+        await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.counters, "buffered": len(self.buffer), "max_size": self.max_size}
+
+query_log = WriteBehindLogger(LOG_QUEUE_MAX, LOG_FLUSH_SIZE, LOG_FLUSH_INTERVAL, LOG_DROP_POLICY)
+
+def log_whois_query(update: Update, domain: str, command: str):
+    """Queue a bot query for the write-behind logger"""
+    query_log.enqueue("whois_queries", {
+        "user_id": update.effective_user.id,
+        "username": update.effective_user.username,
+        "domain": domain,
+        "command": command,
+        "timestamp": datetime.now(timezone.utc)
+    })
+
+async def rebuild_stats():
+    """Recompute the stats rollups from the full whois_queries history"""
+    await db.whois_queries.aggregate([
+        {"$group": {"_id": "$domain", "count": {"$sum": 1}}},
+        {"$out": "stats_domains"}
+    ], allowDiskUse=True).to_list(None)
+    await db.whois_queries.aggregate([
+        {"$group": {"_id": "$user_id", "first_seen": {"$min": "$timestamp"}}},
+        {"$out": "stats_users"}
+    ], allowDiskUse=True).to_list(None)
+    total_queries = await db.whois_queries.count_documents({})
+    unique_users = await db.stats_users.count_documents({})
+    await db.stats_counters.replace_one(
+        {"_id": "global"},
+        {"_id": "global", "total_queries": total_queries, "unique_users": unique_users},
+        upsert=True
+    )
+    logger.info(f"Stats rebuilt: {total_queries} queries, {unique_users} users")
+    return {"total_queries": total_queries, "unique_users": unique_users}
+
+async def seed_stats_if_missing():
+    """Build the rollups once for databases that predate them"""
+    if await db.stats_counters.find_one({"_id": "global"}) is None:
+        if await db.whois_queries.find_one({}, {"_id": 1}) is not None:
+            await rebuild_stats()
+
+async def ensure_timestamp_index(collection, ttl: Optional[int]):
+    """Single-field timestamp index, doubling as the TTL index when retention is on"""
+    options = {"expireAfterSeconds": ttl} if ttl else {}
     try:
-        async with httpx.AsyncClient(timeout=30) as client:
-            url = f"https://api.whoisfreaks.com/v1.0/whois?apiKey={WHOISFREAKS_API_KEY}&domainName={domain}&whois=live"
-            response = await client.get(url)
-            if response.status_code == 200:
-                return response.json()
-            else:
-                logger.error(f"WhoisFreaks API error: {response.status_code} - {response.text}")
-                return None
-    except Exception as e:
-        logger.error(f"Error fetching WHOIS data: {e}")
-        return None
+        await collection.create_index([("timestamp", -1)], name="timestamp_-1", **options)
+    except OperationFailure:
+        # Retention setting changed since the index was built
+        if ttl:
+            await db.command("collMod", collection.name, index={"name": "timestamp_-1", "expireAfterSeconds": ttl})
+        else:
+            await collection.drop_index("timestamp_-1")
+            await collection.create_index([("timestamp", -1)], name="timestamp_-1")
 
-def format_whois_response(data: Dict, user_id: int) -> str:
-    """Format WHOIS data for Telegram"""
-    lang = user_languages.get(user_id, 'fa')
-    msg = MESSAGES[lang]
-    
-    domain = data.get('domain_name', 'N/A')
-    
-    # Build response
-    response_parts = []
-    response_parts.append(msg['domain_info_title'].format(domain=domain))
-    response_parts.append("")
-    
-    # Domain registration status
-    if data.get('domain_registered') == 'yes':
-        response_parts.append(f"📌 {msg['domain_registered']}")
-    else:
-        response_parts.append(f"🟢 {msg['domain_available']}")
-    
-    response_parts.append("")
-    
-    # Domain name
-    response_parts.append(f"{msg['domain_name']}: `{domain}`")
-    
-    # Registrar
-    registrar = data.get('domain_registrar') or data.get('registrar', {})
-    if isinstance(registrar, dict):
-        registrar_name = registrar.get('registrar_name') or registrar.get('name', 'N/A')
-    else:
-        registrar_name = str(registrar) if registrar else 'N/A'
-    if registrar_name and registrar_name != 'N/A':
-        response_parts.append(f"{msg['registrar']}: {escape_markdown(registrar_name)}")
-    
-    # Dates
-    create_date = data.get('create_date') or data.get('creation_date')
-    if create_date:
-        response_parts.append(f"{msg['creation_date']}: `{create_date}`")
-    
-    update_date = data.get('update_date')
-    if update_date:
-        response_parts.append(f"{msg['update_date']}: `{update_date}`")
-    
-    expiry_date = data.get('expiry_date')
-    if expiry_date:
-        response_parts.append(f"{msg['expiry_date']}: `{expiry_date}`")
-        # Calculate days left
+async def ensure_query_log_indexes():
+    ttl = None
+    if QUERY_LOG_RETENTION_DAYS > 0 and QUERY_LOG_RETENTION_MODE == 'ttl':
+        ttl = QUERY_LOG_RETENTION_DAYS * 86400
+    for collection in (db.whois_queries, db.bot_logs):
+        await ensure_timestamp_index(collection, ttl)
+    # History pages sort on (timestamp, _id); the _id suffix keeps every filtered sort on an index
+    await db.whois_queries.create_index([("timestamp", -1), ("_id", -1)])
+    for field in ("domain", "user_id", "command"):
+        await db.whois_queries.create_index([(field, 1), ("timestamp", -1), ("_id", -1)])
         try:
-            exp = datetime.strptime(expiry_date.split('T')[0], '%Y-%m-%d')
-            days_left = (exp - datetime.now()).days
-            if days_left > 0:
-                response_parts.append(f"   ⏱️ {days_left} {msg['days_left']}")
-            else:
-                response_parts.append(f"   ⚠️ {msg['expired']}")
-        except:
+            # Prefix of the index above, left over from older versions
+            await db.whois_queries.drop_index(f"{field}_1_timestamp_-1")
+        except OperationFailure:
             pass
-    
-    # WHOIS Server
-    whois_server = data.get('whois_server')
-    if whois_server:
-        response_parts.append(f"{msg['whois_server']}: `{whois_server}`")
-    
-    # Name Servers
-    name_servers = data.get('name_servers') or data.get('nameservers')
-    if name_servers and isinstance(name_servers, list):
-        ns_list = ', '.join(name_servers[:4])
-        response_parts.append(f"{msg['name_servers']}: `{ns_list}`")
-    
-    # Status
-    status = data.get('status') or data.get('domain_status')
-    if status:
-        if isinstance(status, list):
-            status_str = ', '.join(status[:3])
-        else:
-            status_str = str(status)
-        response_parts.append(f"{msg['status']}: `{status_str[:50]}`")
-    
-    # Registrant info
-    registrant = data.get('registrant_contact') or data.get('registrant')
-    if registrant and isinstance(registrant, dict):
-        registrant_name = registrant.get('name') or registrant.get('organization')
-        if registrant_name:
-            response_parts.append(f"{msg['registrant']}: {escape_markdown(registrant_name)}")
-    
-    return '\n'.join(response_parts)
 
-def format_check_response(data: Dict, domain: str, user_id: int) -> str:
-    """Format domain check response"""
-    lang = user_languages.get(user_id, 'fa')
-    msg = MESSAGES[lang]
-    
-    response_parts = []
-    response_parts.append(msg['check_title'])
-    response_parts.append("")
-    response_parts.append(f"{msg['domain_name']}: `{domain}`")
-    response_parts.append("")
-    
-    if data.get('domain_registered') == 'yes':
-        response_parts.append(f"📌 *{msg['domain_registered']}*")
-        registrar = data.get('domain_registrar') or data.get('registrar', {})
-        if isinstance(registrar, dict):
-            registrar_name = registrar.get('registrar_name') or registrar.get('name')
-        else:
-            registrar_name = str(registrar) if registrar else None
-        if registrar_name:
-            response_parts.append(f"{msg['registrar']}: {escape_markdown(registrar_name)}")
-    else:
-        response_parts.append(f"🎉 *{msg['domain_available']}*")
-    
-    return '\n'.join(response_parts)
+async def archive_query_logs():
+    """Move query and bot logs past the retention window into whois_queries_archive and bot_logs_archive"""
+    cutoff = datetime.now(timezone.utc) - timedelta(days=QUERY_LOG_RETENTION_DAYS)
+    old = {"timestamp": {"$lt": cutoff}}
+    for collection in (db.whois_queries, db.bot_logs):
+        await collection.aggregate([
+            {"$match": old},
+            {"$merge": {"into": f"{collection.name}_archive", "whenMatched": "keepExisting"}}
+        ]).to_list(None)
+        result = await collection.delete_many(old)
+        if result.deleted_count:
+            logger.info(f"Archived {result.deleted_count} {collection.name} documents older than {cutoff.date()}")
 
-def format_expiry_response(data: Dict, domain: str, user_id: int) -> str:
-    """Format expiry date response"""
-    lang = user_languages.get(user_id, 'fa')
-    msg = MESSAGES[lang]
-    
-    response_parts = []
-    response_parts.append(msg['expiry_title'])
-    response_parts.append("")
-    response_parts.append(f"{msg['domain_name']}: `{domain}`")
-    response_parts.append("")
-    
-    expiry_date = data.get('expiry_date')
-    if expiry_date:
-        response_parts.append(f"📅 *{expiry_date}*")
-        # Calculate days left
+async def query_log_archiver():
+    while True:
         try:
-            exp = datetime.strptime(expiry_date.split('T')[0], '%Y-%m-%d')
-            days_left = (exp - datetime.now()).days
-            if days_left > 0:
-                response_parts.append(f"⏱️ {days_left} {msg['days_left']}")
-            else:
-                response_parts.append(f"⚠️ *{msg['expired']}*")
-        except:
-            pass
-    else:
-        response_parts.append("❓ N/A")
-    
-    return '\n'.join(response_parts)
+            await archive_query_logs()
+        except Exception as e:
+            logger.error(f"Query log archival failed: {e}")
+        await asyncio.sleep(QUERY_LOG_ARCHIVE_INTERVAL)
+
+async def migrate_timestamps(batch_size: int = 1000):
+    """One-shot conversion of ISO string timestamps to BSON dates"""
+    converted = 0
+    for collection, field in ((db.whois_queries, "timestamp"), (db.bot_logs, "timestamp"),
+                              (db.stats_users, "first_seen")):
+        while True:
+            docs = await collection.find(
+                {field: {"$type": "string"}}, {field: 1}
+            ).limit(batch_size).to_list(batch_size)
+            if not docs:
+                break
+            ops = []
+            for doc in docs:
+                try:
+                    ts = datetime.fromisoformat(doc[field])
+                except ValueError:
+                    ts = datetime.fromtimestamp(0, timezone.utc)
+                    logger.warning(f"Unparseable {field} on {collection.name} {doc['_id']}: {doc[field]!r}")
+                if ts.tzinfo is None:
+                    ts = ts.replace(tzinfo=timezone.utc)
+                ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": {field: ts}}))
+            await collection.bulk_write(ops, ordered=False)
+            converted += len(ops)
+    logger.info(f"Migrated {converted} string timestamps")
+    return {"converted": converted}
+
+async def ensure_indexes():
+    """Create the indexes the app relies on"""
+    await whois_cache.ensure_indexes()
+    await db.stats_domains.create_index([("count", -1)])
+    await ensure_query_log_indexes()
+    await db.stats_sketches.create_index("bucket")
+    await db.stats_sketches.create_index("expires_at", expireAfterSeconds=0)
+    await db.watchlist.create_index([("user_id", 1), ("domain", 1)], unique=True)
+    await db.watchlist.create_index("domain")
+    await db.watch_domains.create_index("next_check")
+    await db.domain_catalog.create_index([("expiry_at", 1), ("_id", 1)])
+    await db.domain_catalog.create_index([("tld", 1), ("expiry_at", 1), ("_id", 1)])
 
 # Telegram Bot Handlers
+async def preload_user_prefs(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Warm the preference cache before any handler formats a message"""
+    if update.effective_user:
+        await user_prefs.load(update.effective_user.id)
+
+def instrumented(command: str):
+    """Record handler latency, errors and in-flight count under `command`"""
+    def decorate(handler):
+        @wraps(handler)
+        async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+            in_flight.inc("bot")
+            started = time.perf_counter()
+            try:
+                return await handler(update, context)
+            except Exception:
+                errors_total.inc("handler", command)
+                raise
+            finally:
+                in_flight.dec("bot")
+                command_latency.observe(time.perf_counter() - started, command)
+        return wrapper
+    return decorate
+
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /start command"""
     user_id = update.effective_user.id
-    if user_id not in user_languages:
-        user_languages[user_id] = 'fa'  # Default to Persian
     
     # Log to database
-    await db.bot_logs.insert_one({
+    query_log.enqueue("bot_logs", {
         "user_id": user_id,
         "username": update.effective_user.username,
         "command": "start",
-        "timestamp": datetime.now(timezone.utc).isoformat()
+        "timestamp": datetime.now(timezone.utc)
     })
     
     await update.message.reply_text(
-        get_msg(user_id, 'welcome'),
-        parse_mode='Markdown'
+        render_msg(user_id, 'welcome'),
+        parse_mode=PARSE_MODE
     )
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /help command"""
     user_id = update.effective_user.id
     await update.message.reply_text(
-        get_msg(user_id, 'help'),
-        parse_mode='Markdown'
+        render_msg(user_id, 'help'),
+        parse_mode=PARSE_MODE
     )
 
 async def lang_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -399,9 +2966,9 @@ async def lang_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     reply_markup = InlineKeyboardMarkup(keyboard)
     
     await update.message.reply_text(
-        get_msg(user_id, 'select_lang'),
+        render_msg(user_id, 'select_lang'),
         reply_markup=reply_markup,
-        parse_mode='Markdown'
+        parse_mode=PARSE_MODE
     )
 
 async def lang_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -412,12 +2979,13 @@ async def lang_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = query.from_user.id
     
     if query.data == "lang_fa":
-        user_languages[user_id] = 'fa'
+        await user_prefs.set(user_id, language='fa')
         await query.edit_message_text("✅ زبان به فارسی تغییر کرد!")
     elif query.data == "lang_en":
-        user_languages[user_id] = 'en'
+        await user_prefs.set(user_id, language='en')
         await query.edit_message_text("✅ Language changed to English!")
 
+@instrumented("whois")
 async def whois_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /whois command"""
     user_id = update.effective_user.id
@@ -427,8 +2995,8 @@ async def whois_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         domain = context.args[0]
     else:
         await update.message.reply_text(
-            get_msg(user_id, 'enter_domain'),
-            parse_mode='Markdown'
+            render_msg(user_id, 'enter_domain'),
+            parse_mode=PARSE_MODE
         )
         return
     
@@ -441,28 +3009,23 @@ async def whois_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # Send searching message
     searching_msg = await update.message.reply_text(
-        get_msg(user_id, 'searching').format(domain=domain),
-        parse_mode='Markdown'
+        render_msg(user_id, 'searching', domain=domain),
+        parse_mode=PARSE_MODE
     )
     
     # Log to database
-    await db.whois_queries.insert_one({
-        "user_id": user_id,
-        "username": update.effective_user.username,
-        "domain": domain,
-        "command": "whois",
-        "timestamp": datetime.now(timezone.utc).isoformat()
-    })
+    log_whois_query(update, domain, "whois")
     
     # Fetch WHOIS data
-    data = await fetch_whois_data(domain)
+    record = await fetch_whois_data(domain, user_id, PRIORITY_INTERACTIVE)
     
-    if data and data.get('status') != False:
-        response = format_whois_response(data, user_id)
-        await searching_msg.edit_text(response, parse_mode='Markdown')
+    if record:
+        response = format_whois_response(record, user_id)
+        await searching_msg.edit_text(response, parse_mode=PARSE_MODE)
     else:
         await searching_msg.edit_text(get_msg(user_id, 'error'))
 
+@instrumented("check")
 async def check_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /check command"""
     user_id = update.effective_user.id
@@ -471,8 +3034,8 @@ async def check_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         domain = context.args[0]
     else:
         await update.message.reply_text(
-            get_msg(user_id, 'enter_domain'),
-            parse_mode='Markdown'
+            render_msg(user_id, 'enter_domain'),
+            parse_mode=PARSE_MODE
         )
         return
     
@@ -483,27 +3046,22 @@ async def check_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     domain = clean_domain(domain)
     
     searching_msg = await update.message.reply_text(
-        get_msg(user_id, 'searching').format(domain=domain),
-        parse_mode='Markdown'
+        render_msg(user_id, 'searching', domain=domain),
+        parse_mode=PARSE_MODE
     )
     
     # Log to database
-    await db.whois_queries.insert_one({
-        "user_id": user_id,
-        "username": update.effective_user.username,
-        "domain": domain,
-        "command": "check",
-        "timestamp": datetime.now(timezone.utc).isoformat()
-    })
+    log_whois_query(update, domain, "check")
     
-    data = await fetch_whois_data(domain)
+    record = await fetch_whois_data(domain, user_id, PRIORITY_INTERACTIVE)
     
-    if data:
-        response = format_check_response(data, domain, user_id)
-        await searching_msg.edit_text(response, parse_mode='Markdown')
+    if record:
+        response = format_check_response(record, domain, user_id)
+        await searching_msg.edit_text(response, parse_mode=PARSE_MODE)
     else:
         await searching_msg.edit_text(get_msg(user_id, 'error'))
 
+@instrumented("expiry")
 async def expiry_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /expiry command"""
     user_id = update.effective_user.id
@@ -512,8 +3070,8 @@ async def expiry_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         domain = context.args[0]
     else:
         await update.message.reply_text(
-            get_msg(user_id, 'enter_domain'),
-            parse_mode='Markdown'
+            render_msg(user_id, 'enter_domain'),
+            parse_mode=PARSE_MODE
         )
         return
     
@@ -524,27 +3082,85 @@ async def expiry_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     domain = clean_domain(domain)
     
     searching_msg = await update.message.reply_text(
-        get_msg(user_id, 'searching').format(domain=domain),
-        parse_mode='Markdown'
+        render_msg(user_id, 'searching', domain=domain),
+        parse_mode=PARSE_MODE
     )
     
     # Log to database
-    await db.whois_queries.insert_one({
-        "user_id": user_id,
-        "username": update.effective_user.username,
-        "domain": domain,
-        "command": "expiry",
-        "timestamp": datetime.now(timezone.utc).isoformat()
-    })
+    log_whois_query(update, domain, "expiry")
     
-    data = await fetch_whois_data(domain)
+    record = await fetch_whois_data(domain, user_id, PRIORITY_INTERACTIVE)
     
-    if data:
-        response = format_expiry_response(data, domain, user_id)
-        await searching_msg.edit_text(response, parse_mode='Markdown')
+    if record:
+        response = format_expiry_response(record, domain, user_id)
+        await searching_msg.edit_text(response, parse_mode=PARSE_MODE)
     else:
         await searching_msg.edit_text(get_msg(user_id, 'error'))
 
+async def watch_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /watch command"""
+    user_id = update.effective_user.id
+    
+    if context.args and len(context.args) > 0:
+        domain = context.args[0]
+    else:
+        await update.message.reply_text(
+            render_msg(user_id, 'enter_domain'),
+            parse_mode=PARSE_MODE
+        )
+        return
+    
+    if not is_valid_domain(domain):
+        await update.message.reply_text(get_msg(user_id, 'invalid_domain'))
+        return
+    
+    domain = clean_domain(domain)
+    result = await add_watch(user_id, domain)
+    
+    if result == 'limit':
+        await update.message.reply_text(get_msg(user_id, 'watch_limit').format(limit=WATCH_MAX_PER_USER))
+    else:
+        key = 'watch_added' if result == 'added' else 'watch_exists'
+        await update.message.reply_text(render_msg(user_id, key, domain=domain), parse_mode=PARSE_MODE)
+
+async def unwatch_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /unwatch command"""
+    user_id = update.effective_user.id
+    
+    if context.args and len(context.args) > 0:
+        domain = context.args[0]
+    else:
+        await update.message.reply_text(
+            render_msg(user_id, 'enter_domain'),
+            parse_mode=PARSE_MODE
+        )
+        return
+    
+    domain = clean_domain(domain)
+    key = 'watch_removed' if await remove_watch(user_id, domain) else 'watch_not_found'
+    await update.message.reply_text(render_msg(user_id, key, domain=domain), parse_mode=PARSE_MODE)
+
+async def watchlist_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /watchlist command"""
+    user_id = update.effective_user.id
+    watches = await list_watches(user_id)
+    
+    if not watches:
+        await update.message.reply_text(render_msg(user_id, 'watchlist_empty'), parse_mode=PARSE_MODE)
+        return
+    
+    response_parts = [render_msg(user_id, 'watchlist_title'), ""]
+    for watch in watches:
+        line = f"• `{escape_code(watch['domain'])}`"
+        if watch['expiry_date']:
+            line += f" — `{escape_code(watch['expiry_date'].split('T')[0])}`"
+            if watch['days_left'] is not None and watch['days_left'] > 0:
+                line += f" \\({watch['days_left']} {render_msg(user_id, 'days_left')}\\)"
+        response_parts.append(line)
+    
+    await update.message.reply_text('\n'.join(response_parts), parse_mode=PARSE_MODE)
+
+@instrumented("direct")
 async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle direct domain input"""
     user_id = update.effective_user.id
@@ -555,61 +3171,258 @@ async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE
         domain = clean_domain(text)
         
         searching_msg = await update.message.reply_text(
-            get_msg(user_id, 'searching').format(domain=domain),
-            parse_mode='Markdown'
+            render_msg(user_id, 'searching', domain=domain),
+            parse_mode=PARSE_MODE
         )
         
         # Log to database
-        await db.whois_queries.insert_one({
-            "user_id": user_id,
-            "username": update.effective_user.username,
-            "domain": domain,
-            "command": "direct",
-            "timestamp": datetime.now(timezone.utc).isoformat()
-        })
+        log_whois_query(update, domain, "direct")
         
-        data = await fetch_whois_data(domain)
+        record = await fetch_whois_data(domain, user_id, PRIORITY_INTERACTIVE)
         
-        if data and data.get('status') != False:
-            response = format_whois_response(data, user_id)
-            await searching_msg.edit_text(response, parse_mode='Markdown')
+        if record:
+            response = format_whois_response(record, user_id)
+            await searching_msg.edit_text(response, parse_mode=PARSE_MODE)
         else:
             await searching_msg.edit_text(get_msg(user_id, 'error'))
     else:
         await update.message.reply_text(
-            get_msg(user_id, 'enter_domain'),
-            parse_mode='Markdown'
+            render_msg(user_id, 'enter_domain'),
+            parse_mode=PARSE_MODE
         )
 
 # Initialize Telegram Bot Application
 telegram_app = None
 
-async def setup_telegram_bot():
-    """Setup and start Telegram bot"""
+class InstrumentedRequest(HTTPXRequest):
+    """Times every Bot API call by method name (sendMessage, editMessageText, ...)"""
+
+    async def do_request(self, url: str, method: str, *args, **kwargs):
+        api_method = url.rsplit('/', 1)[-1]
+        started = time.perf_counter()
+        try:
+            code, payload = await super().do_request(url, method, *args, **kwargs)
+        except Exception:
+            errors_total.inc("telegram", api_method)
+            raise
+        finally:
+            telegram_latency.observe(time.perf_counter() - started, api_method)
+        if code >= 400:
+            errors_total.inc("telegram", api_method)
+        return code, payload
+
+def telegram_webhook_enabled() -> bool:
+    return TELEGRAM_MODE == 'webhook' and bool(TELEGRAM_WEBHOOK_URL)
+
+async def setup_telegram_bot(deliver: bool = True):
+    """Setup and start Telegram bot; without `deliver` it only processes webhook updates posted to this process"""
     global telegram_app
     
     if not TELEGRAM_BOT_TOKEN:
         logger.error("TELEGRAM_BOT_TOKEN not set!")
         return
     
-    telegram_app = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+    webhook = telegram_webhook_enabled()
+    if TELEGRAM_MODE == 'webhook' and not webhook:
+        logger.error("TELEGRAM_MODE=webhook needs TELEGRAM_WEBHOOK_URL, falling back to polling")
+    
+    builder = Application.builder().token(TELEGRAM_BOT_TOKEN).request(InstrumentedRequest(connection_pool_size=256))
+    if TELEGRAM_API_BASE_URL:
+        builder = builder.base_url(TELEGRAM_API_BASE_URL)
+    # Process up to N updates at once so one slow lookup doesn't block everyone else
+    builder = builder.concurrent_updates(TELEGRAM_CONCURRENT_UPDATES if TELEGRAM_CONCURRENT_UPDATES > 1 else False)
+    if webhook:
+        builder = builder.updater(None)
+    telegram_app = builder.build()
     
     # Add handlers
+    telegram_app.add_handler(TypeHandler(Update, preload_user_prefs), group=-1)
     telegram_app.add_handler(CommandHandler("start", start_command))
     telegram_app.add_handler(CommandHandler("help", help_command))
     telegram_app.add_handler(CommandHandler("lang", lang_command))
     telegram_app.add_handler(CommandHandler("whois", whois_command))
     telegram_app.add_handler(CommandHandler("check", check_command))
     telegram_app.add_handler(CommandHandler("expiry", expiry_command))
+    telegram_app.add_handler(CommandHandler("watch", watch_command))
+    telegram_app.add_handler(CommandHandler("unwatch", unwatch_command))
+    telegram_app.add_handler(CommandHandler("watchlist", watchlist_command))
     telegram_app.add_handler(CallbackQueryHandler(lang_callback, pattern="^lang_"))
     telegram_app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text_message))
     
-    # Start polling
     await telegram_app.initialize()
     await telegram_app.start()
-    await telegram_app.updater.start_polling(drop_pending_updates=True)
+    if deliver:
+        await start_update_delivery()
     
-    logger.info("Telegram bot started successfully!")
+    logger.info(f"Telegram bot started successfully ({'webhook' if webhook else 'polling'})!")
+
+async def start_update_delivery():
+    """Register the webhook or start long polling; only one process may do this at a time"""
+    # A runner taking over after failover should still answer what queued up meanwhile
+    drop_pending = BOT_RUNNER == 'embedded'
+    if telegram_webhook_enabled():
+        await telegram_app.bot.set_webhook(
+            url=f"{TELEGRAM_WEBHOOK_URL.rstrip('/')}/telegram/webhook",
+            secret_token=TELEGRAM_WEBHOOK_SECRET,
+            max_connections=min(max(TELEGRAM_CONCURRENT_UPDATES, 1), 100),
+            drop_pending_updates=drop_pending
+        )
+    elif not telegram_app.updater.running:
+        await telegram_app.updater.start_polling(drop_pending_updates=drop_pending)
+
+async def stop_update_delivery():
+    # A registered webhook is left in place for the next runner to take over
+    if telegram_app and telegram_app.updater and telegram_app.updater.running:
+        await telegram_app.updater.stop()
+
+async def stop_telegram_bot():
+    global telegram_app
+    if telegram_app:
+        await stop_update_delivery()
+        await telegram_app.stop()
+        await telegram_app.shutdown()
+        telegram_app = None
+
+class LeaderLease:
+    """Mongo lease so exactly one process at a time holds a role.
+
+    The holder renews every ttl/3 and steps down if it cannot renew before
+    its lease could have expired for others. If a holder dies, a candidate
+    takes over within about one ttl. A clean shutdown deletes the lease so
+    failover is immediate. Expiry compares wall clocks across hosts, so keep
+    the ttl well above any clock skew.
+    """
+
+    def __init__(self, name: str, ttl: int):
+        self.name = name
+        self.ttl = ttl
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.is_leader = False
+        self.valid_until = 0.0
+        self.task: Optional[asyncio.Task] = None
+        self.on_elected = None
+        self.on_demoted = None
+        self.counters = {"elected": 0, "demoted": 0, "renewals": 0, "errors": 0}
+
+    async def try_acquire(self) -> bool:
+        now = datetime.now(timezone.utc)
+        update = {"holder": self.holder, "expires_at": now + timedelta(seconds=self.ttl), "renewed_at": now}
+        if not self.is_leader:
+            update["acquired_at"] = now
+        try:
+            doc = await db.leases.find_one_and_update(
+                {"_id": self.name, "$or": [{"holder": self.holder}, {"expires_at": {"$lte": now}}]},
+                {"$set": update},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # Someone else holds an unexpired lease, so the upsert collided with it
+            return False
+        return doc is not None and doc["holder"] == self.holder
+
+    async def step(self):
+        started = time.monotonic()
+        try:
+            held = await self.try_acquire()
+        except Exception as e:
+            logger.warning(f"Lease {self.name} renewal failed: {e}")
+            self.counters["errors"] += 1
+            held = self.is_leader and time.monotonic() < self.valid_until
+        else:
+            if held:
+                self.valid_until = started + self.ttl * 2 / 3
+                self.counters["renewals"] += 1
+
+        if held and not self.is_leader:
+            self.is_leader = True
+            self.counters["elected"] += 1
+            logger.info(f"Acquired lease {self.name} as {self.holder}")
+            try:
+                await self.on_elected()
+            except Exception as e:
+                logger.error(f"Could not take over {self.name}, releasing the lease: {e}")
+                await self.release()
+        elif not held and self.is_leader:
+            self.is_leader = False
+            self.counters["demoted"] += 1
+            logger.warning(f"Lost lease {self.name}, stepping down")
+            await self.on_demoted()
+
+    async def run(self):
+        while True:
+            try:
+                await self.step()
+            except Exception as e:
+                logger.error(f"Lease {self.name} loop error: {e}")
+            await asyncio.sleep(self.ttl / 3)
+
+    def start(self, on_elected, on_demoted):
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    async def release(self):
+        if self.is_leader:
+            self.is_leader = False
+            await self.on_demoted()
+        try:
+            await db.leases.delete_one({"_id": self.name, "holder": self.holder})
+        except Exception as e:
+            logger.warning(f"Could not release lease {self.name}: {e}")
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+            await self.release()
+
+    async def current(self) -> Optional[Dict[str, Any]]:
+        """The live lease document, whoever holds it"""
+        return await db.leases.find_one({"_id": self.name, "expires_at": {"$gt": datetime.now(timezone.utc)}})
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.counters, "name": self.name, "holder": self.holder, "is_leader": self.is_leader}
+
+bot_lease = LeaderLease(BOT_LEASE_NAME, BOT_LEASE_TTL)
+archiver_task: Optional[asyncio.Task] = None
+# Set on API workers that process webhook posts whether or not they hold the lease
+serves_webhook = False
+
+async def start_leader_duties():
+    """Singleton work: Telegram update delivery, watch alerts, cache pre-warming, log archiving"""
+    global archiver_task
+    cache_refresher.start()
+    watch_scheduler.start()
+    if QUERY_LOG_RETENTION_DAYS > 0 and QUERY_LOG_RETENTION_MODE == 'archive' and archiver_task is None:
+        archiver_task = asyncio.create_task(query_log_archiver())
+    if telegram_app is None:
+        await setup_telegram_bot()
+    else:
+        await start_update_delivery()
+
+async def stop_leader_duties():
+    global archiver_task
+    cache_refresher.stop()
+    watch_scheduler.stop()
+    if archiver_task is not None:
+        archiver_task.cancel()
+        archiver_task = None
+    if serves_webhook:
+        await stop_update_delivery()
+    else:
+        await stop_telegram_bot()
+
+async def start_bot_tier():
+    """Bot setup for BOT_RUNNER elected/external API workers"""
+    global serves_webhook
+    if telegram_webhook_enabled():
+        # Any worker behind the load balancer may receive a webhook post
+        serves_webhook = True
+        await setup_telegram_bot(deliver=False)
+    if BOT_RUNNER == 'elected':
+        bot_lease.start(start_leader_duties, stop_leader_duties)
 
 # Pydantic Models
 class StatusCheck(BaseModel):
@@ -628,25 +3441,49 @@ class WhoisQuery(BaseModel):
     username: Optional[str] = None
     domain: str
     command: str
-    timestamp: str
+    timestamp: datetime
 
 class BotStats(BaseModel):
     total_queries: int
     unique_users: int
     popular_domains: List[Dict[str, Any]]
     recent_queries: List[Dict[str, Any]]
+    window_hours: Optional[int] = None
+    approximate: bool = False
+    error_bounds: Optional[Dict[str, Any]] = None
 
 # Panel Password
 PANEL_PASSWORD = os.environ.get('PANEL_PASSWORD', 'Amin@9579')
 
+async def require_admin(x_panel_password: str = Header(default="")):
+    """Guard for admin endpoints: the panel password in the X-Panel-Password header"""
+    if not hmac.compare_digest(x_panel_password, PANEL_PASSWORD):
+        raise HTTPException(status_code=401, detail="Invalid password")
+
 # API Routes
 @api_router.get("/")
 async def root():
     return {"message": "Whois Bot API is running!"}
 
+async def health_status() -> Dict[str, Any]:
+    if BOT_RUNNER == 'embedded':
+        bot_running = telegram_app is not None
+    else:
+        # The bot may run in another process; a live lease means some runner holds it
+        try:
+            bot_running = await bot_lease.current() is not None
+        except Exception:
+            bot_running = False
+    return {"status": "healthy", "bot_running": bot_running, "bot_runner": BOT_RUNNER}
+
 @api_router.get("/health")
 async def health_check():
-    return {"status": "healthy", "bot_running": telegram_app is not None}
+    return await health_status()
+
+@api_router.get("/lease/stats")
+async def lease_stats():
+    """Bot runner election state of this process"""
+    return bot_lease.stats()
 
 class LoginRequest(BaseModel):
     password: str
@@ -657,37 +3494,263 @@ async def login(request: LoginRequest):
         return {"success": True}
     raise HTTPException(status_code=401, detail="Invalid password")
 
-@api_router.get("/stats", response_model=BotStats)
-async def get_stats():
-    """Get bot statistics"""
-    # Total queries
-    total_queries = await db.whois_queries.count_documents({})
-    
-    # Unique users
-    unique_users = len(await db.whois_queries.distinct("user_id"))
-    
-    # Popular domains (aggregation)
-    pipeline = [
+async def exact_window_stats(since: datetime) -> Dict[str, Any]:
+    """Exact counterpart of QuerySketches.window(), for comparison"""
+    match = {"$match": {"timestamp": {"$gte": since}}}
+    total_queries = await db.whois_queries.count_documents({"timestamp": {"$gte": since}})
+    users = await db.whois_queries.aggregate([
+        match, {"$group": {"_id": "$user_id"}}, {"$count": "n"}
+    ], allowDiskUse=True).to_list(1)
+    popular_domains = []
+    async for doc in db.whois_queries.aggregate([
+        match,
         {"$group": {"_id": "$domain", "count": {"$sum": 1}}},
         {"$sort": {"count": -1}},
         {"$limit": 10}
-    ]
-    popular_cursor = db.whois_queries.aggregate(pipeline)
-    popular_domains = []
-    async for doc in popular_cursor:
+    ], allowDiskUse=True):
         popular_domains.append({"domain": doc["_id"], "count": doc["count"]})
-    
-    # Recent queries
-    recent_cursor = db.whois_queries.find({}, {"_id": 0}).sort("timestamp", -1).limit(20)
-    recent_queries = await recent_cursor.to_list(20)
+    return {
+        "total_queries": total_queries,
+        "unique_users": users[0]["n"] if users else 0,
+        "popular_domains": popular_domains,
+    }
+
+@api_router.get("/stats", response_model=BotStats)
+async def get_stats(window_hours: Optional[int] = None, mode: Optional[str] = None):
+    """Get bot statistics, all-time or over the last `window_hours`"""
+    mode = mode or STATS_MODE
+    extra = {}
+    if window_hours:
+        since = datetime.now(timezone.utc) - timedelta(hours=window_hours)
+        if mode == 'exact':
+            window = await exact_window_stats(since)
+        else:
+            window = await query_sketches.window(since)
+            extra = {"approximate": True, "error_bounds": window["error_bounds"]}
+        total_queries = window["total_queries"]
+        unique_users = window["unique_users"]
+        popular_domains = window["popular_domains"]
+        extra["window_hours"] = window_hours
+    else:
+        totals = await all_time_stats()
+        total_queries = totals["total_queries"]
+        unique_users = totals["unique_users"]
+        popular_domains = totals["popular_domains"]
     
     return BotStats(
         total_queries=total_queries,
         unique_users=unique_users,
         popular_domains=popular_domains,
-        recent_queries=recent_queries
+        recent_queries=await recent_queries(),
+        **extra
+    )
+
+async def all_time_stats() -> Dict[str, Any]:
+    """Counters and top domains, maintained as queries are logged"""
+    counters = await db.stats_counters.find_one({"_id": "global"}) or {}
+    popular_domains = []
+    async for doc in db.stats_domains.find({}).sort("count", -1).limit(10):
+        popular_domains.append({"domain": doc["_id"], "count": doc["count"]})
+    return {
+        "total_queries": counters.get("total_queries", 0),
+        "unique_users": counters.get("unique_users", 0),
+        "popular_domains": popular_domains,
+    }
+
+async def recent_queries(limit: int = 20) -> List[Dict[str, Any]]:
+    """Latest logged queries, newest first, with their ids as strings"""
+    docs = await db.whois_queries.find({}).sort("timestamp", -1).limit(limit).to_list(limit)
+    for doc in docs:
+        doc["id"] = str(doc.pop("_id"))
+    return docs
+
+class StatsStream:
+    """Computes dashboard stats once per process and pushes changes to every subscribed client"""
+
+    FIELDS = ("total_queries", "unique_users", "popular_domains", "health")
+
+    def __init__(self, interval: float, keepalive: float, queue_size: int):
+        self.interval = interval
+        self.keepalive = keepalive
+        self.queue_size = queue_size
+        self.subscribers: Set[asyncio.Queue] = set()
+        self.state: Optional[Dict[str, Any]] = None
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.counters = {"connects": 0, "polls": 0, "deltas": 0, "poll_errors": 0, "dropped_clients": 0}
+
+    async def snapshot(self) -> Dict[str, Any]:
+        return {
+            **await all_time_stats(),
+            "recent_queries": await recent_queries(),
+            "health": await health_status(),
+        }
+
+    def diff(self, old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+        """Changed fields, plus only the recent queries the clients have not seen yet"""
+        delta = {field: new[field] for field in self.FIELDS if new[field] != old[field]}
+        seen = {query["id"] for query in old["recent_queries"]}
+        fresh = [query for query in new["recent_queries"] if query["id"] not in seen]
+        if fresh:
+            delta["recent_queries"] = fresh
+        return delta
+
+    @staticmethod
+    def frame(event: str, data: Dict[str, Any]) -> str:
+        return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+
+    def publish(self, event: str, data: Dict[str, Any]):
+        # Encoded once and shared by every client
+        frame = self.frame(event, data)
+        for queue in list(self.subscribers):
+            try:
+                queue.put_nowait(frame)
+            except asyncio.QueueFull:
+                # A client that stopped reading is cut off; EventSource reconnects and gets a fresh snapshot
+                self.subscribers.discard(queue)
+                self.counters["dropped_clients"] += 1
+
+    def notify(self):
+        """Poll early: this process just logged queries"""
+        if self.task is not None:
+            self.wakeup.set()
+
+    async def run(self):
+        while True:
+            try:
+                state = await self.snapshot()
+            except Exception as e:
+                self.counters["poll_errors"] += 1
+                logger.error(f"Failed to poll dashboard stats: {e}")
+            else:
+                self.counters["polls"] += 1
+                if self.state is None:
+                    self.publish("snapshot", state)
+                else:
+                    delta = self.diff(self.state, state)
+                    if delta:
+                        self.counters["deltas"] += 1
+                        self.publish("delta", delta)
+                self.state = state
+            # Local writes wake the poller early, but never more than four times per interval
+            await asyncio.sleep(self.interval / 4)
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=self.interval * 3 / 4)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+
+    def subscribe(self) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(self.queue_size)
+        if self.state is not None:
+            queue.put_nowait(self.frame("snapshot", self.state))
+        self.subscribers.add(queue)
+        self.counters["connects"] += 1
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self.subscribers.discard(queue)
+        if not self.subscribers:
+            # Nobody is watching: stop polling and drop the cached state so it can't go stale
+            self.stop_polling()
+
+    def stop_polling(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        self.state = None
+
+    async def events(self, queue: asyncio.Queue):
+        try:
+            while True:
+                try:
+                    frame = await asyncio.wait_for(queue.get(), timeout=self.keepalive)
+                except asyncio.TimeoutError:
+                    # SSE comment line, keeps proxies from closing an idle connection
+                    yield ": keepalive\n\n"
+                    continue
+                if queue not in self.subscribers:
+                    break
+                yield frame
+        finally:
+            self.unsubscribe(queue)
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.counters, "subscribers": len(self.subscribers), "polling": self.task is not None}
+
+stats_stream = StatsStream(STATS_STREAM_INTERVAL, STATS_STREAM_KEEPALIVE, STATS_STREAM_QUEUE)
+
+@api_router.get("/stats/stream")
+async def stream_stats():
+    """Server-Sent Events: a `snapshot` of the dashboard stats, then `delta` events as they change"""
+    return StreamingResponse(
+        stats_stream.events(stats_stream.subscribe()),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
+@api_router.get("/stats/stream/stats")
+async def stats_stream_stats():
+    """Live dashboard subscribers and poller counters"""
+    return stats_stream.stats()
+
+@api_router.get("/cache/stats")
+async def cache_stats():
+    """WHOIS cache hit/miss and request coalescing counters"""
+    return {**whois_cache.stats(), "singleflight": whois_flight.stats(), "refresh": cache_refresher.stats()}
+
+@api_router.get("/logging/stats")
+async def logging_stats():
+    """Write-behind query logger counters"""
+    return query_log.stats()
+
+@api_router.get("/prefs/stats")
+async def prefs_stats():
+    """User preference cache counters"""
+    return user_prefs.stats()
+
+@api_router.get("/render/stats")
+async def render_stats():
+    """Rendered response cache counters"""
+    return render_cache.stats()
+
+@api_router.get("/quota/stats")
+async def quota_stats():
+    """Upstream quota queue depth, wait times and daily budget usage"""
+    return await upstream_quota.stats()
+
+@api_router.get("/admin/keys", dependencies=[Depends(require_admin)])
+async def admin_keys():
+    """Per-key WhoisFreaks usage, rate limiting and bench state"""
+    return whois_keys.stats()
+
+@api_router.get("/providers/stats")
+async def providers_stats():
+    """Per-provider success/failure counts and current hedge delays"""
+    return whois_providers.stats()
+
+@api_router.get("/http/stats")
+async def http_stats():
+    """Upstream connection pool usage"""
+    return upstream_http.stats()
+
+@metrics.collector
+def collect_cache_metrics():
+    for outcome in ("memory_hits", "mongo_hits", "stale_hits", "misses", "negative_hits"):
+        cache_events.set(whois_cache.counters[outcome], "whois", outcome)
+    cache_events.set(render_cache.counters["hits"], "render", "hits")
+    cache_events.set(render_cache.counters["misses"], "render", "misses")
+    cache_events.set(whois_flight.counters["coalesced"], "singleflight", "coalesced")
+    in_flight.set(len(whois_flight.inflight), "lookup")
+    in_flight.set(len(stats_stream.subscribers), "stats_stream")
+
+@api_router.get("/metrics")
+async def get_metrics():
+    """Prometheus text exposition"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 @api_router.get("/whois/{domain}")
 async def api_whois(domain: str):
     """Direct WHOIS lookup via API"""
@@ -695,13 +3758,223 @@ async def api_whois(domain: str):
         raise HTTPException(status_code=400, detail="Invalid domain name")
     
     domain = clean_domain(domain)
-    data = await fetch_whois_data(domain)
+    record = await fetch_whois_data(domain)
     
-    if data:
-        return data
+    if record:
+        return record.to_api()
     else:
         raise HTTPException(status_code=500, detail="Failed to fetch WHOIS data")
 
+class WhoisBatchRequest(BaseModel):
+    domains: List[str]
+    concurrency: Optional[int] = Field(default=None, ge=1, le=64)
+
+@api_router.post("/whois/batch", dependencies=[Depends(require_admin)])
+async def api_whois_batch(request: WhoisBatchRequest):
+    """Batch WHOIS lookup streamed back as NDJSON in completion order"""
+    if len(request.domains) > WHOIS_BATCH_MAX_DOMAINS:
+        raise HTTPException(status_code=413, detail=f"At most {WHOIS_BATCH_MAX_DOMAINS} domains per batch")
+
+    invalid = []
+    domains = []
+    seen = set()
+    for raw, domain in zip(request.domains, normalize_domains(request.domains)):
+        if domain is None:
+            invalid.append(raw)
+            continue
+        if domain not in seen:
+            seen.add(domain)
+            domains.append(domain)
+
+    concurrency = request.concurrency or WHOIS_BATCH_CONCURRENCY
+
+    async def body():
+        for raw in invalid:
+            yield json.dumps({"domain": raw, "error": "invalid_domain"}) + "\n"
+        async for line in stream_whois_batch(domains, concurrency):
+            yield line
+
+    return StreamingResponse(body(), media_type="application/x-ndjson")
+
+def encode_cursor(*values: Any) -> str:
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor: str, *types: type) -> List[Any]:
+    """Unpack a cursor made by encode_cursor(), checking it holds one value of each type.
+
+    Datetimes come back parsed and in UTC. Anything else a client could have
+    edited into the cursor is a 400, never a failure further down.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if not isinstance(values, list) or len(values) != len(types):
+            raise ValueError("wrong cursor shape")
+        decoded = []
+        for value, kind in zip(values, types):
+            if not isinstance(value, str if kind is datetime else kind):
+                raise ValueError("wrong cursor value type")
+            decoded.append(as_utc(datetime.fromisoformat(value)) if kind is datetime else value)
+        return decoded
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@api_router.get("/expiring")
+async def api_expiring(
+    from_: Optional[datetime] = Query(default=None, alias="from"),
+    to: Optional[datetime] = None,
+    tld: Optional[str] = None,
+    limit: int = Query(default=100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+):
+    """Known domains expiring in [from, to), ordered by expiry, with keyset pagination"""
+    start = as_utc(from_) if from_ else datetime.now(timezone.utc)
+    end = as_utc(to) if to else start + timedelta(days=7)
+    query: Dict[str, Any] = {"expiry_at": {"$gte": start, "$lt": end}}
+    if tld:
+        query["tld"] = tld.lower().lstrip('.')
+    if cursor:
+        last_expiry, last_domain = decode_cursor(cursor, datetime, str)
+        query["$or"] = [
+            {"expiry_at": {"$gt": last_expiry}},
+            {"expiry_at": last_expiry, "_id": {"$gt": last_domain}},
+        ]
+    docs = await db.domain_catalog.find(query).sort([("expiry_at", 1), ("_id", 1)]).limit(limit).to_list(limit)
+    items = [{
+        "domain": doc["_id"],
+        "expiry_date": doc["expiry_at"].isoformat(),
+        "registrar": doc.get("registrar"),
+        "registered": doc.get("registered"),
+        "updated_at": doc.get("updated_at"),
+    } for doc in docs]
+    next_cursor = encode_cursor(docs[-1]["expiry_at"], docs[-1]["_id"]) if len(docs) == limit else None
+    return {"items": items, "next_cursor": next_cursor}
+
+def query_history_filter(
+    domain: Optional[str] = None,
+    user_id: Optional[int] = None,
+    command: Optional[str] = None,
+    from_: Optional[datetime] = Query(default=None, alias="from"),
+    to: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Mongo filter for the query history endpoints, resuming after `cursor` when given"""
+    query: Dict[str, Any] = {}
+    if domain:
+        query["domain"] = clean_domain(domain)
+    if user_id is not None:
+        query["user_id"] = user_id
+    if command:
+        query["command"] = command.lower().lstrip('/')
+    if from_ or to:
+        query["timestamp"] = {}
+        if from_:
+            query["timestamp"]["$gte"] = as_utc(from_)
+        if to:
+            query["timestamp"]["$lt"] = as_utc(to)
+    if cursor:
+        last_timestamp, last_id = decode_cursor(cursor, datetime, str)
+        if not ObjectId.is_valid(last_id):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        last_id = ObjectId(last_id)
+        query["$or"] = [
+            {"timestamp": {"$lt": last_timestamp}},
+            {"timestamp": last_timestamp, "_id": {"$lt": last_id}},
+        ]
+    return query
+
+QUERY_HISTORY_SORT = [("timestamp", -1), ("_id", -1)]
+QUERY_HISTORY_FIELDS = ("id", "timestamp", "user_id", "username", "domain", "command")
+
+def query_history_item(doc: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": str(doc["_id"]),
+        "timestamp": doc["timestamp"].isoformat() if isinstance(doc["timestamp"], datetime) else doc["timestamp"],
+        "user_id": doc.get("user_id"),
+        "username": doc.get("username"),
+        "domain": doc.get("domain"),
+        "command": doc.get("command"),
+    }
+
+@api_router.get("/queries", dependencies=[Depends(require_admin)])
+async def api_queries(
+    query: Dict[str, Any] = Depends(query_history_filter),
+    limit: int = Query(default=50, ge=1, le=1000),
+):
+    """Logged bot queries, newest first, filtered and with keyset pagination"""
+    docs = await db.whois_queries.find(query).sort(QUERY_HISTORY_SORT).limit(limit).to_list(limit)
+    next_cursor = encode_cursor(docs[-1]["timestamp"], str(docs[-1]["_id"])) if len(docs) == limit else None
+    return {"items": [query_history_item(doc) for doc in docs], "next_cursor": next_cursor}
+
+@api_router.get("/queries/export", dependencies=[Depends(require_admin)])
+async def api_queries_export(
+    query: Dict[str, Any] = Depends(query_history_filter),
+    format_: str = Query(default="csv", alias="format", pattern="^(csv|ndjson)$"),
+    limit: Optional[int] = Query(default=None, ge=1),
+):
+    """Stream the filtered query history as CSV or NDJSON, one cursor batch at a time"""
+    cursor = db.whois_queries.find(query).sort(QUERY_HISTORY_SORT).batch_size(QUERY_EXPORT_BATCH)
+    if limit:
+        cursor = cursor.limit(limit)
+
+    async def body():
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=QUERY_HISTORY_FIELDS)
+        if format_ == "csv":
+            writer.writeheader()
+        rows = 0
+        async for doc in cursor:
+            item = query_history_item(doc)
+            if format_ == "csv":
+                writer.writerow(item)
+            else:
+                buffer.write(json.dumps(item) + "\n")
+            rows += 1
+            # Hand each batch to the client before reading the next, so memory stays flat
+            if rows % QUERY_EXPORT_BATCH == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+    media_type = "text/csv" if format_ == "csv" else "application/x-ndjson"
+    filename = f"whois_queries.{format_}"
+    return StreamingResponse(body(), media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+class WatchRequest(BaseModel):
+    user_id: int
+    domain: str
+
+@api_router.get("/watchlist", dependencies=[Depends(require_admin)])
+async def api_watchlist(user_id: int):
+    """List a user's watched domains with their last known expiry"""
+    return await list_watches(user_id)
+
+@api_router.post("/watchlist", dependencies=[Depends(require_admin)])
+async def api_add_watch(request: WatchRequest):
+    """Add a domain to a user's watchlist"""
+    if not is_valid_domain(request.domain):
+        raise HTTPException(status_code=400, detail="Invalid domain name")
+    domain = clean_domain(request.domain)
+    result = await add_watch(request.user_id, domain)
+    if result == 'limit':
+        raise HTTPException(status_code=409, detail=f"At most {WATCH_MAX_PER_USER} watched domains per user")
+    return {"domain": domain, "status": result}
+
+@api_router.delete("/watchlist/{domain}", dependencies=[Depends(require_admin)])
+async def api_remove_watch(domain: str, user_id: int):
+    """Remove a domain from a user's watchlist"""
+    domain = clean_domain(domain)
+    if not await remove_watch(user_id, domain):
+        raise HTTPException(status_code=404, detail="Domain is not on the watchlist")
+    return {"domain": domain, "status": "removed"}
+
+@api_router.get("/watchlist/stats")
+async def watchlist_stats():
+    """Watch scheduler counters"""
+    return watch_scheduler.stats()
+
 @api_router.post("/status", response_model=StatusCheck)
 async def create_status_check(input: StatusCheckCreate):
     status_dict = input.model_dump()
@@ -722,6 +3995,49 @@ async def get_status_checks():
 # Include the router in the main app
 app.include_router(api_router)
 
+@app.post("/telegram/webhook")
+async def telegram_webhook(request: Request):
+    """Receive Telegram updates in webhook mode"""
+    secret = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+    if not TELEGRAM_WEBHOOK_SECRET or not hmac.compare_digest(secret, TELEGRAM_WEBHOOK_SECRET):
+        raise HTTPException(status_code=403, detail="Invalid secret token")
+    if telegram_app is None:
+        raise HTTPException(status_code=503, detail="Bot is not running")
+    update = Update.de_json(await request.json(), telegram_app.bot)
+    await telegram_app.update_queue.put(update)
+    return {"ok": True}
+
+class MetricsMiddleware:
+    """Time HTTP requests by route template, including streamed bodies"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        in_flight.inc("http")
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            in_flight.dec("http")
+            route = scope.get("route")
+            path = route.path if route else "unmatched"
+            http_latency.observe(time.perf_counter() - started, path)
+            if status >= 500:
+                errors_total.inc("http", path)
+
+app.add_middleware(MetricsMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -730,17 +4046,52 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+async def start_core():
+    """Start what every process needs, API worker or bot runner"""
+    upstream_http.start()
+    query_log.start()
+    query_sketches.start()
+    try:
+        await load_public_suffixes()
+    except Exception as e:
+        logger.error(f"Failed to load public suffix list, using built-in rules: {e}")
+    try:
+        await ensure_indexes()
+    except Exception as e:
+        logger.error(f"Failed to create indexes: {e}")
+    asyncio.create_task(seed_stats_if_missing())
+
+async def stop_core():
+    stats_stream.stop_polling()
+    await query_log.stop()
+    await query_sketches.stop()
+    await upstream_http.close()
+    client.close()
+
 @app.on_event("startup")
 async def startup_event():
     """Start Telegram bot on app startup"""
-    asyncio.create_task(setup_telegram_bot())
+    await start_core()
+    if BOT_RUNNER == 'embedded':
+        asyncio.create_task(start_leader_duties())
+    else:
+        asyncio.create_task(start_bot_tier())
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Cleanup on shutdown"""
-    global telegram_app
-    if telegram_app:
-        await telegram_app.updater.stop()
-        await telegram_app.stop()
-        await telegram_app.shutdown()
-    client.close()
+    await bot_lease.stop()
+    await stop_telegram_bot()
+    await stop_core()
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Whois bot maintenance commands")
+    parser.add_argument("command", choices=["rebuild-stats", "migrate-timestamps"])
+    args = parser.parse_args()
+
+    if args.command == "rebuild-stats":
+        print(asyncio.run(rebuild_stats()))
+    elif args.command == "migrate-timestamps":
+        print(asyncio.run(migrate_timestamps()))
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks for the domain normalizer in backend/server.py
+Compares cold (uncached) and warm single calls with the batch helper
+"""
+
+import os
+import sys
+import json
+import timeit
+import random
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "whois_bench")
+
+import server  # noqa: E402
+
+SAMPLES = [
+    "google.com",
+    "WWW.Example.COM",
+    "https://sub.domain.example.co.uk/path?x=1",
+    "HTTP://user@shop.example.com:8080/",
+    "news.bbc.co.uk",
+    "Bücher.de",
+    "digikala.com",
+    "a.b.c.d.example.org",
+    "not a domain",
+    "localhost",
+    "1.2.3.4",
+    "http://192.168.0.1:8080/admin",
+]
+
+# Inputs that look like hosts but must be rejected before the public suffix lookup
+IP_LITERALS = [f"10.{i % 256}.{i // 256 % 256}.{i % 7}" for i in range(20000)]
+
+def bench(name: str, stmt, number: int) -> dict:
+    seconds = min(timeit.repeat(stmt, number=number, repeat=5))
+    return {"name": name, "calls": number, "ns_per_call": round(seconds / number * 1e9, 1)}
+
+def main():
+    psl = os.environ.get("PUBLIC_SUFFIX_LIST_PATH")
+    if psl:
+        server.public_suffixes = server.PublicSuffixTrie.parse(Path(psl).read_text(encoding="utf-8"), psl)
+
+    unique = [f"host{i}.site{i % 5000}.example.com" for i in range(20000)]
+    batch = [random.choice(SAMPLES) for _ in range(10000)]
+
+    def cold():
+        server.normalize_domain.cache_clear()
+        for raw in unique:
+            server.normalize_domain(raw)
+
+    def cold_ips():
+        server.normalize_domain.cache_clear()
+        for raw in IP_LITERALS:
+            server.normalize_domain(raw)
+
+    cold_seconds = min(timeit.repeat(cold, number=1, repeat=5))
+    cold_ip_seconds = min(timeit.repeat(cold_ips, number=1, repeat=5))
+    results = [
+        bench("normalize_domain (warm)", lambda: server.normalize_domain("https://sub.example.co.uk/x"), 200000),
+        {"name": "normalize_domain (cold)", "calls": len(unique),
+         "ns_per_call": round(cold_seconds / len(unique) * 1e9, 1)},
+        {"name": "normalize_domain (cold, IP literals)", "calls": len(IP_LITERALS),
+         "ns_per_call": round(cold_ip_seconds / len(IP_LITERALS) * 1e9, 1)},
+        bench("normalize_domains (batch of 10k)", lambda: server.normalize_domains(batch), 20),
+        bench("is_valid_domain + clean_domain", lambda: server.clean_domain("WWW.Example.COM")
+              if server.is_valid_domain("WWW.Example.COM") else None, 200000),
+    ]
+
+    assert not any(server.normalize_domains(IP_LITERALS[:100])), "IP literals must not normalize"
+    print(json.dumps({"psl_rules": server.public_suffixes.rules, "results": results}, indent=2))
+
+if __name__ == "__main__":
+    main()
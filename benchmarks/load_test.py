@@ -0,0 +1,466 @@
+#!/usr/bin/env python3
+"""
+Load benchmark for the bot and the HTTP API, fully offline
+Starts backend/server.py under uvicorn in webhook mode and points it at a fake
+WhoisFreaks API and a fake Telegram Bot API served from this process. It then
+drives a weighted mix of bot commands and /api calls at a target rate and
+prints throughput and p50/p95/p99 latency per path as JSON.
+
+    python benchmarks/load_test.py --rate 50 --duration 60 --output before.json
+    python benchmarks/load_test.py --rate 50 --duration 60 --baseline before.json
+
+Bot commands are timed from the webhook POST until the fake Bot API receives
+the final editMessageText for that chat. Mongo comes from --mongo-url, or a
+throwaway mongod found on PATH is started on a temporary dbpath; pass
+--mongod-args "--storageEngine inMemory" on builds that support it.
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import random
+import shutil
+import socket
+import asyncio
+import argparse
+import itertools
+import subprocess
+import tempfile
+import hashlib
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, List
+
+import httpx
+from aiohttp import web
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+BOT_TOKEN = "123456:BENCHMARK-TOKEN"
+WEBHOOK_SECRET = "benchmark-webhook-secret"
+PANEL_PASSWORD = "benchmark-panel-password"
+BOT_PATHS = ("whois", "check", "expiry", "direct")
+DEFAULT_MIX = "whois=30,check=15,expiry=10,direct=15,api_whois=20,api_stats=5,api_batch=5"
+TLDS = ("com", "com", "com", "net", "org", "io", "ir", "co.uk")
+SUFFIX_LIST = "// ===BEGIN ICANN DOMAINS===\n" + "\n".join(sorted(set(TLDS) | {"uk"})) + "\n// ===END ICANN DOMAINS===\n"
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    mix = {}
+    for item in spec.split(","):
+        name, _, weight = item.strip().partition("=")
+        if name not in BOT_PATHS and name not in LoadDriver.API_PATHS:
+            raise SystemExit(f"Unknown path in --mix: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+def percentile(samples: List[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not samples:
+        return 0.0
+    return samples[min(len(samples) - 1, max(0, math.ceil(q * len(samples)) - 1))]
+
+class FakeWhoisFreaks:
+    """WhoisFreaks stand-in with lognormal latency around a median and a configurable error rate"""
+
+    def __init__(self, latency_ms: float, sigma: float, error_rate: float, available_rate: float, seed: int):
+        self.latency_ms = latency_ms
+        self.sigma = sigma
+        self.error_rate = error_rate
+        self.available_rate = available_rate
+        self.rng = random.Random(seed)
+        self.calls = Counter()
+
+    async def delay(self):
+        if self.latency_ms > 0:
+            await asyncio.sleep(self.latency_ms / 1000 * math.exp(self.rng.gauss(0, self.sigma)))
+
+    def record(self, domain: str) -> Dict:
+        """Deterministic per domain, so repeated runs see the same data"""
+        digest = int(hashlib.sha1(domain.encode()).hexdigest(), 16)
+        if (digest % 1000) / 1000 < self.available_rate:
+            return {"status": True, "domain_name": domain, "domain_registered": "no"}
+        created = datetime(2000, 1, 1, tzinfo=timezone.utc) + timedelta(days=digest % 8000)
+        expires = datetime.now(timezone.utc) + timedelta(days=1 + digest % 700)
+        return {
+            "status": True,
+            "domain_name": domain,
+            "domain_registered": "yes",
+            "create_date": created.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "update_date": created.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "expiry_date": expires.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "whois_server": "whois.example-registrar.test",
+            "domain_registrar": {"registrar_name": f"Registrar {digest % 40}", "iana_id": str(digest % 3000)},
+            "registrant_contact": {"name": "Domain Admin", "organization": f"Org {digest % 500}"},
+            "name_servers": [f"ns{i}.host{digest % 90}.test" for i in (1, 2)],
+            "domain_status": ["clientTransferProhibited"],
+        }
+
+    async def whois(self, request: web.Request) -> web.Response:
+        self.calls["whois"] += 1
+        await self.delay()
+        if self.rng.random() < self.error_rate:
+            self.calls["errors"] += 1
+            return web.json_response({"status": False, "error": "upstream unavailable"}, status=503)
+        return web.json_response(self.record(request.query.get("domainName", "").lower()))
+
+    async def bulk(self, request: web.Request) -> web.Response:
+        self.calls["bulkwhois"] += 1
+        domains = (await request.json()).get("domainNames", [])
+        await self.delay()
+        if self.rng.random() < self.error_rate:
+            self.calls["errors"] += 1
+            return web.json_response({"status": False, "error": "upstream unavailable"}, status=503)
+        return web.json_response({"bulk_whois_response": [self.record(d.lower()) for d in domains]})
+
+    async def suffixes(self, request: web.Request) -> web.Response:
+        return web.Response(text=SUFFIX_LIST)
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.add_routes([
+            web.get("/v1.0/whois", self.whois),
+            web.post("/v1.0/bulkwhois", self.bulk),
+            web.get("/public_suffix_list.dat", self.suffixes),
+        ])
+        return app
+
+class FakeTelegram:
+    """Bot API stand-in: answers every method and resolves a chat's waiter on its final edit"""
+
+    def __init__(self, latency_ms: float):
+        self.latency_ms = latency_ms
+        self.message_ids = itertools.count(1)
+        self.waiters: Dict[int, asyncio.Future] = {}
+        self.calls = Counter()
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.calls[method] += 1
+        if request.content_type == "application/json":
+            params = await request.json()
+        else:
+            params = dict(await request.post())
+        if self.latency_ms > 0:
+            await asyncio.sleep(self.latency_ms / 1000)
+
+        if method == "getMe":
+            result = {"id": int(BOT_TOKEN.split(":")[0]), "is_bot": True, "first_name": "Bench",
+                      "username": "bench_whois_bot", "can_join_groups": False,
+                      "can_read_all_group_messages": False, "supports_inline_queries": False}
+        elif method in ("sendMessage", "editMessageText"):
+            chat_id = int(params.get("chat_id", 0))
+            text = str(params.get("text", ""))
+            result = {"message_id": int(params.get("message_id") or next(self.message_ids)),
+                      "date": int(time.time()), "chat": {"id": chat_id, "type": "private"}, "text": text}
+            waiter = self.waiters.get(chat_id)
+            if method == "editMessageText" and waiter and not waiter.done():
+                waiter.set_result(text)
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.add_routes([web.post("/bot{token}/{method}", self.handle), web.get("/bot{token}/{method}", self.handle)])
+        return app
+
+class LoadDriver:
+    """Open-loop load: Poisson arrivals at the target rate, Zipf-popular domains"""
+
+    API_PATHS = ("api_whois", "api_stats", "api_batch")
+
+    def __init__(self, client: httpx.AsyncClient, telegram: FakeTelegram, mix: Dict[str, float],
+                 domains: List[str], users: int, zipf: float, batch_size: int, timeout: float, seed: int):
+        self.client = client
+        self.telegram = telegram
+        self.paths = list(mix)
+        self.path_weights = list(itertools.accumulate(mix.values()))
+        self.domains = domains
+        self.domain_weights = list(itertools.accumulate(1 / (i + 1) ** zipf for i in range(len(domains))))
+        self.free_users: asyncio.Queue = asyncio.Queue()
+        for user_id in range(1_000_000, 1_000_000 + users):
+            self.free_users.put_nowait(user_id)
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.rng = random.Random(seed)
+        self.update_ids = itertools.count(1)
+        self.samples: Dict[str, List[float]] = {path: [] for path in self.paths}
+        self.errors: Counter = Counter()
+        self.recording = False
+
+    def pick_domain(self) -> str:
+        return self.rng.choices(self.domains, cum_weights=self.domain_weights)[0]
+
+    async def bot_command(self, path: str) -> bool:
+        domain = self.pick_domain()
+        text = domain if path == "direct" else f"/{path} {domain}"
+        user_id = await self.free_users.get()
+        waiter = asyncio.get_running_loop().create_future()
+        self.telegram.waiters[user_id] = waiter
+        try:
+            update_id = next(self.update_ids)
+            message = {
+                "message_id": update_id,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": {"id": user_id, "is_bot": False, "first_name": "Load", "language_code": "en"},
+                "text": text,
+            }
+            if path != "direct":
+                message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(path) + 1}]
+            response = await self.client.post(
+                "/telegram/webhook", json={"update_id": update_id, "message": message},
+                headers={"X-Telegram-Bot-Api-Secret-Token": WEBHOOK_SECRET}
+            )
+            response.raise_for_status()
+            reply = await asyncio.wait_for(waiter, self.timeout)
+            return not reply.startswith("❌")
+        finally:
+            self.telegram.waiters.pop(user_id, None)
+            self.free_users.put_nowait(user_id)
+
+    async def api_call(self, path: str) -> bool:
+        if path == "api_whois":
+            response = await self.client.get(f"/api/whois/{self.pick_domain()}")
+        elif path == "api_stats":
+            response = await self.client.get("/api/stats")
+        else:
+            domains = [self.pick_domain() for _ in range(self.batch_size)]
+            response = await self.client.post("/api/whois/batch", json={"domains": domains},
+                                              headers={"X-Panel-Password": PANEL_PASSWORD})
+            lines = [json.loads(line) for line in response.text.splitlines() if line]
+            return response.status_code == 200 and all("data" in line for line in lines)
+        return response.status_code == 200
+
+    async def timed(self, path: str):
+        recording = self.recording
+        started = time.perf_counter()
+        try:
+            ok = await (self.bot_command(path) if path in BOT_PATHS else self.api_call(path))
+        except Exception:
+            ok = False
+        if recording:
+            self.samples[path].append((time.perf_counter() - started) * 1000)
+            if not ok:
+                self.errors[path] += 1
+
+    async def run(self, rate: float, seconds: float):
+        loop = asyncio.get_running_loop()
+        tasks = set()
+        deadline = loop.time() + seconds
+        next_at = loop.time()
+        while True:
+            next_at += self.rng.expovariate(rate)
+            if next_at >= deadline:
+                break
+            await asyncio.sleep(max(0.0, next_at - loop.time()))
+            path = self.rng.choices(self.paths, cum_weights=self.path_weights)[0]
+            task = asyncio.create_task(self.timed(path))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+
+    def report(self, seconds: float) -> Dict:
+        paths = {}
+        for path, samples in self.samples.items():
+            samples.sort()
+            paths[path] = {
+                "count": len(samples),
+                "errors": self.errors[path],
+                "throughput_rps": round(len(samples) / seconds, 2),
+                "p50_ms": round(percentile(samples, 0.50), 2),
+                "p95_ms": round(percentile(samples, 0.95), 2),
+                "p99_ms": round(percentile(samples, 0.99), 2),
+                "max_ms": round(samples[-1], 2) if samples else 0.0,
+            }
+        total = sum(len(s) for s in self.samples.values())
+        return {"requests": total, "errors": sum(self.errors.values()),
+                "throughput_rps": round(total / seconds, 2), "paths": paths}
+
+def start_mongod(args, workdir: Path) -> tuple:
+    if args.mongo_url:
+        return None, args.mongo_url
+    mongod = shutil.which("mongod")
+    if not mongod:
+        raise SystemExit("No --mongo-url given and no mongod on PATH")
+    port = free_port()
+    dbpath = workdir / "mongo"
+    dbpath.mkdir()
+    proc = subprocess.Popen(
+        [mongod, "--dbpath", str(dbpath), "--port", str(port), "--bind_ip", "127.0.0.1", "--quiet",
+         *args.mongod_args.split()],
+        stdout=open(workdir / "mongod.log", "w"), stderr=subprocess.STDOUT
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return proc, f"mongodb://127.0.0.1:{port}"
+        except OSError:
+            time.sleep(0.2)
+    proc.kill()
+    raise SystemExit(f"mongod did not start, see {workdir / 'mongod.log'}")
+
+async def start_site(app: web.Application) -> tuple:
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    port = free_port()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner, f"http://127.0.0.1:{port}"
+
+async def wait_until_ready(client: httpx.AsyncClient, server: subprocess.Popen, log_path: Path):
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise SystemExit(f"Server exited with {server.returncode}, see {log_path}")
+        try:
+            health = (await client.get("/api/health")).json()
+            if health.get("bot_running"):
+                return
+        except (httpx.HTTPError, ValueError):
+            pass
+        await asyncio.sleep(0.25)
+    raise SystemExit(f"Server did not become ready, see {log_path}")
+
+def compare(report: Dict, baseline: Dict, tolerance: float) -> List[Dict]:
+    """Paths whose p95 grew by more than `tolerance` relative to the baseline run"""
+    regressions = []
+    for path, current in report["paths"].items():
+        before = baseline.get("paths", {}).get(path)
+        if before and before["p95_ms"] > 0 and current["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append({"path": path, "baseline_p95_ms": before["p95_ms"], "p95_ms": current["p95_ms"]})
+    return regressions
+
+async def main(args) -> int:
+    workdir = Path(tempfile.mkdtemp(prefix="whois-bench-"))
+    mongod, mongo_url = start_mongod(args, workdir)
+    db_name = f"whois_bench_{int(time.time())}"
+
+    whoisfreaks = FakeWhoisFreaks(args.upstream_latency_ms, args.upstream_latency_sigma,
+                                  args.upstream_error_rate, args.available_rate, args.seed)
+    telegram = FakeTelegram(args.telegram_latency_ms)
+    whois_runner, whois_url = await start_site(whoisfreaks.app())
+    telegram_runner, telegram_url = await start_site(telegram.app())
+
+    port = free_port()
+    app_url = f"http://127.0.0.1:{port}"
+    env = {
+        **os.environ,
+        "MONGO_URL": mongo_url,
+        "DB_NAME": db_name,
+        "TELEGRAM_BOT_TOKEN": BOT_TOKEN,
+        "TELEGRAM_MODE": "webhook",
+        "TELEGRAM_WEBHOOK_URL": app_url,
+        "TELEGRAM_WEBHOOK_SECRET": WEBHOOK_SECRET,
+        "PANEL_PASSWORD": PANEL_PASSWORD,
+        "TELEGRAM_API_BASE_URL": f"{telegram_url}/bot",
+        "WHOISFREAKS_BASE_URL": whois_url,
+        "WHOISFREAKS_API_KEY": "benchmark",
+        "WHOISFREAKS_API_KEYS": "",
+        "WHOIS_PROVIDERS": "whoisfreaks",
+        "PUBLIC_SUFFIX_LIST_URL": f"{whois_url}/public_suffix_list.dat",
+        "PUBLIC_SUFFIX_LIST_PATH": "",
+        "PROVIDER_CACHE_DIR": str(workdir / "cache"),
+    }
+    for item in args.env:
+        key, _, value = item.partition("=")
+        env[key] = value
+
+    log_path = workdir / "server.log"
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=open(log_path, "w"), stderr=subprocess.STDOUT
+    )
+
+    rng = random.Random(args.seed)
+    domains = [f"site{i}.{rng.choice(TLDS)}" for i in range(args.domains)]
+    limits = httpx.Limits(max_connections=args.connections, max_keepalive_connections=args.connections)
+    try:
+        async with httpx.AsyncClient(base_url=app_url, timeout=args.timeout, limits=limits) as client:
+            await wait_until_ready(client, server, log_path)
+            driver = LoadDriver(client, telegram, parse_mix(args.mix), domains, args.users, args.zipf,
+                                args.batch_size, args.timeout, args.seed)
+            if args.warmup > 0:
+                await driver.run(args.rate, args.warmup)
+            driver.recording = True
+            started = time.perf_counter()
+            await driver.run(args.rate, args.duration)
+            elapsed = time.perf_counter() - started
+
+            report = {
+                "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+                "duration_s": round(elapsed, 2),
+                **driver.report(elapsed),
+                "upstream_calls": dict(whoisfreaks.calls),
+                "telegram_calls": dict(telegram.calls),
+                "server": {
+                    "cache": (await client.get("/api/cache/stats")).json(),
+                    "render": (await client.get("/api/render/stats")).json(),
+                },
+            }
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        await whois_runner.cleanup()
+        await telegram_runner.cleanup()
+        try:
+            from pymongo import MongoClient
+            MongoClient(mongo_url, serverSelectionTimeoutMS=2000).drop_database(db_name)
+        except Exception as e:
+            print(f"Could not drop {db_name}: {e}", file=sys.stderr)
+        if mongod:
+            mongod.terminate()
+            mongod.wait(timeout=15)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    status = 0
+    if args.baseline:
+        report["regressions"] = compare(report, json.loads(Path(args.baseline).read_text()), args.tolerance)
+        status = 1 if report["regressions"] else 0
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + "\n")
+    print(output)
+    return status
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Offline load benchmark for the Whois bot and API")
+    parser.add_argument("--rate", type=float, default=20, help="target requests per second")
+    parser.add_argument("--duration", type=float, default=30, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=5, help="unmeasured seconds before the run")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="weighted paths, e.g. whois=3,api_stats=1")
+    parser.add_argument("--domains", type=int, default=2000, help="size of the domain pool")
+    parser.add_argument("--zipf", type=float, default=1.1, help="popularity skew of the domain pool")
+    parser.add_argument("--users", type=int, default=500, help="distinct simulated bot users")
+    parser.add_argument("--batch-size", type=int, default=20, help="domains per /api/whois/batch call")
+    parser.add_argument("--connections", type=int, default=200, help="HTTP connections to the app")
+    parser.add_argument("--timeout", type=float, default=30, help="per-request timeout in seconds")
+    parser.add_argument("--upstream-latency-ms", type=float, default=300, help="median fake WhoisFreaks latency")
+    parser.add_argument("--upstream-latency-sigma", type=float, default=0.5, help="lognormal spread of that latency")
+    parser.add_argument("--upstream-error-rate", type=float, default=0.02, help="share of upstream calls failing with 503")
+    parser.add_argument("--available-rate", type=float, default=0.2, help="share of domains reported unregistered")
+    parser.add_argument("--telegram-latency-ms", type=float, default=30, help="fake Bot API latency per call")
+    parser.add_argument("--mongo-url", help="use this Mongo instead of starting a local mongod")
+    parser.add_argument("--mongod-args", default="", help="extra arguments for the local mongod")
+    parser.add_argument("--env", action="append", default=[], help="extra KEY=VALUE for the server, repeatable")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="also write the JSON report here")
+    parser.add_argument("--baseline", help="earlier report to compare against; exits 1 on p95 regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative p95 growth")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(parse_args())))
@@ -93,24 +93,24 @@ const Dashboard = ({ onLogout }) => {
   const [searching, setSearching] = useState(false);
   const [healthStatus, setHealthStatus] = useState(null);
 
-  const fetchStats = useCallback(async () => {
-    try {
-      const response = await axios.get(`${API}/stats`);
-      setStats(response.data);
-    } catch (e) {
-      console.error("Error fetching stats:", e);
-    } finally {
-      setLoading(false);
-    }
+  const applySnapshot = useCallback((data) => {
+    const { health, ...rest } = data;
+    setStats(rest);
+    setHealthStatus(health);
+    setLoading(false);
   }, []);
 
-  const fetchHealth = useCallback(async () => {
-    try {
-      const response = await axios.get(`${API}/health`);
-      setHealthStatus(response.data);
-    } catch (e) {
-      console.error("Error fetching health:", e);
-    }
+  const applyDelta = useCallback((delta) => {
+    const { health, recent_queries, ...counters } = delta;
+    if (health) setHealthStatus(health);
+    setStats((prev) => {
+      if (!prev) return prev;
+      const next = { ...prev, ...counters };
+      if (recent_queries) {
+        next.recent_queries = [...recent_queries, ...prev.recent_queries].slice(0, 20);
+      }
+      return next;
+    });
   }, []);
 
   const searchWhois = async () => {
@@ -133,15 +133,15 @@ const Dashboard = ({ onLogout }) => {
     onLogout();
   };
 
+  // Live stats: a snapshot on connect, then deltas as they happen.
+  // EventSource reconnects on its own and each reconnect starts with a fresh snapshot.
   useEffect(() => {
-    fetchStats();
-    fetchHealth();
-    const interval = setInterval(() => {
-      fetchStats();
-      fetchHealth();
-    }, 30000);
-    return () => clearInterval(interval);
-  }, [fetchStats, fetchHealth]);
+    const source = new EventSource(`${API}/stats/stream`);
+    source.addEventListener("snapshot", (e) => applySnapshot(JSON.parse(e.data)));
+    source.addEventListener("delta", (e) => applyDelta(JSON.parse(e.data)));
+    source.onerror = () => console.error("Stats stream disconnected, reconnecting...");
+    return () => source.close();
+  }, [applySnapshot, applyDelta]);
 
   return (
     <div className="dashboard" data-testid="dashboard">
@@ -337,7 +337,7 @@ const Dashboard = ({ onLogout }) => {
                 <div className="loading-placeholder">در حال بارگذاری...</div>
               ) : stats?.recent_queries?.length > 0 ? (
                 stats.recent_queries.slice(0, 10).map((query, index) => (
-                  <div className="recent-item" key={index} data-testid={`recent-query-${index}`}>
+                  <div className="recent-item" key={query.id || index} data-testid={`recent-query-${index}`}>
                     <div className="recent-icon">
                       <Activity size={16} />
                     </div>
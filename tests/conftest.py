@@ -0,0 +1,48 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import httpx
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+# server.py reads these at import time; the tests never reach a real Mongo or write into the repo
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "whois_bot_test")
+os.environ.setdefault("PROVIDER_CACHE_DIR", tempfile.mkdtemp(prefix="whois-test-cache-"))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import server  # noqa: E402
+
+
+@pytest.fixture
+def mongo(monkeypatch):
+    """Swap the module's database for an in-memory one"""
+    database = AsyncMongoMockClient(tz_aware=True)["whois_bot_test"]
+    monkeypatch.setattr(server, "db", database)
+    return database
+
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Route upstream HTTP calls to a handler: upstream(lambda request: httpx.Response(200, json=...))"""
+    http = server.UpstreamHTTP()
+    monkeypatch.setattr(server, "upstream_http", http)
+
+    def route(handler):
+        http.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        return http
+
+    return route
+
+
+@pytest.fixture
+def lookups(monkeypatch, mongo):
+    """Fresh cache, coalescer, quota and logger, so lookup tests don't share state"""
+    monkeypatch.setattr(server, "whois_cache", server.WhoisCache(100, 3600, 600, use_mongo=False))
+    monkeypatch.setattr(server, "whois_flight", server.SingleFlight())
+    monkeypatch.setattr(server, "upstream_quota", server.QuotaManager(0, 0, 0, 0, 0, daily_credits=1000))
+    monkeypatch.setattr(server, "query_log", server.WriteBehindLogger(1000, 100, 1.0))
+    return server
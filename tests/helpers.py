@@ -0,0 +1,25 @@
+import base64
+import json
+
+import server
+
+
+def whois_data(domain: str, registered: bool = True, expiry_date: str = "2030-01-01T00:00:00Z", **extra):
+    """A WhoisFreaks-shaped response"""
+    return {
+        "status": True,
+        "domain_name": domain,
+        "domain_registered": "yes" if registered else "no",
+        "expiry_date": expiry_date if registered else None,
+        "domain_registrar": {"registrar_name": "Example Registrar"},
+        **extra,
+    }
+
+
+def whois_record(domain: str, **kwargs) -> server.WhoisRecord:
+    return server.WhoisRecord.from_raw(whois_data(domain, **kwargs), domain)
+
+
+def raw_cursor(value) -> str:
+    """A pagination cursor holding arbitrary JSON, as a client could forge one"""
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip("=")
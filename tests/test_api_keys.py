@@ -0,0 +1,96 @@
+import asyncio
+from collections import Counter
+
+import httpx
+import pytest
+
+import server
+
+URL = "https://whoisfreaks.test/v1.0/whois"
+
+
+def use_keys(monkeypatch, spec, strategy="weighted"):
+    pool = server.ApiKeyPool(spec, None, strategy)
+    monkeypatch.setattr(server, "whois_keys", pool)
+    return pool
+
+
+def test_weighted_round_robin_follows_the_weights():
+    pool = server.ApiKeyPool("k1:3,k2:1", None, "weighted")
+    picks = Counter()
+    for _ in range(40):
+        key = pool.pick()
+        picks[key.key] += 1
+        pool.report(key, httpx.Response(200))
+    assert picks == {"k1": 30, "k2": 10}
+
+
+def test_least_used_prefers_idle_keys():
+    pool = server.ApiKeyPool("k1,k2", None, "least_used")
+    busy = pool.pick()
+    assert pool.pick() is not busy
+
+
+def test_single_key_fallback():
+    pool = server.ApiKeyPool("", "only", "weighted")
+    assert pool.size() == 1
+    assert pool.pick().key == "only"
+
+
+def test_rate_limited_key_is_benched_and_the_call_moves_on(monkeypatch, upstream):
+    pool = use_keys(monkeypatch, "k1,k2")
+
+    def handler(request):
+        if request.url.params["apiKey"] == "k1":
+            return httpx.Response(429, headers={"retry-after": "120"})
+        return httpx.Response(200, json={"ok": True})
+
+    upstream(handler)
+    response = asyncio.run(server.call_whoisfreaks("GET", URL))
+    assert response.status_code == 200
+    k1, k2 = pool.keys
+    assert not k1.available() and k2.available()
+    assert k1.counters["rate_limited"] == 1
+    # Benched keys are skipped until their time is up
+    assert all(pool.pick() is k2 for _ in range(3))
+
+
+def test_exhausted_keys_are_benched(monkeypatch, upstream):
+    pool = use_keys(monkeypatch, "k1,k2")
+
+    def handler(request):
+        if request.url.params["apiKey"] == "k1":
+            return httpx.Response(402)
+        return httpx.Response(200, headers={"x-credits-remaining": "0"}, json={})
+
+    upstream(handler)
+    response = asyncio.run(server.call_whoisfreaks("GET", URL))
+    # The last credit was still answered, then that key was benched too
+    assert response.status_code == 200
+    assert [k.counters["exhausted"] for k in pool.keys] == [1, 1]
+    assert pool.pick() is None
+
+
+def test_cancelled_requests_release_their_key(monkeypatch, upstream):
+    pool = use_keys(monkeypatch, "k1,k2", "least_used")
+
+    async def hang(request):
+        await asyncio.sleep(10)
+
+    upstream(hang)
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(asyncio.wait_for(server.call_whoisfreaks("GET", URL), timeout=0.01))
+    assert [k.in_flight for k in pool.keys] == [0, 0]
+
+
+def test_transport_errors_release_their_key(monkeypatch, upstream):
+    pool = use_keys(monkeypatch, "k1")
+
+    def refuse(request):
+        raise httpx.ConnectError("refused", request=request)
+
+    upstream(refuse)
+    with pytest.raises(httpx.ConnectError):
+        asyncio.run(server.call_whoisfreaks("GET", URL))
+    assert pool.keys[0].in_flight == 0
+    assert pool.keys[0].counters["errors"] == 1
@@ -0,0 +1,164 @@
+import asyncio
+import json
+
+from fastapi.testclient import TestClient
+
+import server
+from tests.helpers import whois_data
+
+
+def collect(domains, concurrency=4):
+    async def scenario():
+        return [json.loads(line) async for line in server.stream_whois_batch(domains, concurrency)]
+    return asyncio.run(scenario())
+
+
+def credits_used(mongo):
+    async def scenario():
+        doc = await mongo.quota_usage.find_one({})
+        return doc["credits"] if doc else 0
+    return asyncio.run(scenario())
+
+
+def test_batch_endpoint_requires_admin(monkeypatch):
+    client = TestClient(server.app)
+    response = client.post("/api/whois/batch", json={"domains": ["example.com"]})
+    assert response.status_code == 401
+    response = client.post("/api/whois/batch", json={"domains": ["example.com"]},
+                           headers={"X-Panel-Password": "wrong"})
+    assert response.status_code == 401
+
+
+def test_batch_endpoint_streams_for_admin(lookups, monkeypatch):
+    async def lookup(domain):
+        return whois_data(domain)
+
+    monkeypatch.setattr(server, "WHOIS_BULK_ENABLED", False)
+    monkeypatch.setattr(server.whois_providers, "lookup", lookup)
+    client = TestClient(server.app)
+    response = client.post("/api/whois/batch", json={"domains": ["example.com", "not a domain"]},
+                           headers={"X-Panel-Password": server.PANEL_PASSWORD})
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert response.status_code == 200
+    assert {"domain": "not a domain", "error": "invalid_domain"} in lines
+    assert any(line.get("data", {}).get("domain_name") == "example.com" for line in lines)
+
+
+def test_unanswered_bulk_credits_are_refunded(lookups, mongo, monkeypatch):
+    domains = ["a.com", "b.com", "c.com", "d.com"]
+
+    async def bulk(names):
+        return {name: whois_data(name) for name in names[:2]}
+
+    async def lookup(domain):
+        return whois_data(domain)
+
+    monkeypatch.setattr(server, "fetch_whois_bulk_live", bulk)
+    monkeypatch.setattr(server.whois_providers, "lookup", lookup)
+    monkeypatch.setattr(server.whois_providers, "available", lambda name: True)
+
+    lines = collect(domains)
+    assert sorted(line["domain"] for line in lines) == domains
+    assert all("data" in line for line in lines)
+    # Two answered by the bulk call, two by single lookups: each domain is paid for once
+    assert credits_used(mongo) == 4
+
+
+def test_fallback_lookups_run_concurrently(lookups, monkeypatch):
+    active = peak = 0
+
+    async def bulk(names):
+        return {}
+
+    async def lookup(domain):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.02)
+        active -= 1
+        return whois_data(domain)
+
+    monkeypatch.setattr(server, "fetch_whois_bulk_live", bulk)
+    monkeypatch.setattr(server.whois_providers, "lookup", lookup)
+    monkeypatch.setattr(server.whois_providers, "available", lambda name: True)
+
+    lines = collect([f"d{i}.com" for i in range(8)], concurrency=3)
+    assert len(lines) == 8
+    assert peak == 3
+
+
+def test_failed_chunk_only_reports_unsent_domains(lookups, monkeypatch):
+    async def resolve(domains, limit=None):
+        yield domains[0], server.WhoisRecord.from_raw(whois_data(domains[0]), domains[0])
+        raise RuntimeError("worker crashed")
+
+    monkeypatch.setattr(server, "resolve_whois_chunk", resolve)
+    lines = collect(["a.com", "b.com", "c.com"])
+    assert sorted(line["domain"] for line in lines) == ["a.com", "b.com", "c.com"]
+    assert "data" in next(line for line in lines if line["domain"] == "a.com")
+    assert [line["error"] for line in lines if line["domain"] != "a.com"] == ["lookup_failed"] * 2
+
+
+def test_failing_bulk_calls_trip_the_whoisfreaks_breaker(lookups, monkeypatch):
+    monkeypatch.setattr(server, "CIRCUIT_WINDOW", 2)
+    monkeypatch.setattr(server, "CIRCUIT_MIN_CALLS", 2)
+    chain = server.ProviderChain([server.WhoisFreaksProvider()], False, 0.95, 3)
+    monkeypatch.setattr(server, "whois_providers", chain)
+    calls = []
+
+    async def bulk(names):
+        calls.append(names)
+        return None
+
+    async def lookup(domain):
+        return whois_data(domain)
+
+    monkeypatch.setattr(server, "fetch_whois_bulk_live", bulk)
+    monkeypatch.setattr(chain, "lookup", lookup)
+
+    async def scenario():
+        for i in range(5):
+            [item async for item in server.resolve_whois_chunk([f"a{i}.com", f"b{i}.com"])]
+
+    asyncio.run(scenario())
+    # Once open, the circuit skips the doomed bulk call
+    assert len(calls) == 2
+    assert chain.stats()["whoisfreaks"]["circuit"] == "open"
+    assert chain.stats()["whoisfreaks"]["failures"] == 2
+
+
+def test_bulk_lookups_are_coalesced_with_single_lookups(lookups, monkeypatch):
+    monkeypatch.setattr(server.whois_providers, "available", lambda name: True)
+    bulk_calls, single_calls = [], []
+
+    async def bulk(names):
+        bulk_calls.append(names)
+        await asyncio.sleep(0.02)
+        return {name: whois_data(name) for name in names}
+
+    async def lookup(domain):
+        single_calls.append(domain)
+        await asyncio.sleep(0.02)
+        return whois_data(domain)
+
+    monkeypatch.setattr(server, "fetch_whois_bulk_live", bulk)
+    monkeypatch.setattr(server.whois_providers, "lookup", lookup)
+
+    async def collect_chunk(domains):
+        return {domain: record async for domain, record in server.resolve_whois_chunk(domains)}
+
+    async def scenario():
+        # a.com is already being looked up, so the chunk joins that lookup
+        early = asyncio.create_task(server.fetch_whois_data("a.com"))
+        await asyncio.sleep(0)
+        chunk = asyncio.create_task(collect_chunk(["a.com", "b.com", "c.com"]))
+        await asyncio.sleep(0.005)
+        # b.com is in the bulk call, so this lookup waits for it
+        late = await server.fetch_whois_data("b.com")
+        return await early, await chunk, late
+
+    early, chunk, late = asyncio.run(scenario())
+    assert bulk_calls == [["b.com", "c.com"]]
+    assert single_calls == ["a.com"]
+    assert chunk["a.com"] is early
+    assert chunk["b.com"] is late
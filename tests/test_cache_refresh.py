@@ -0,0 +1,91 @@
+import asyncio
+
+import server
+from tests.helpers import whois_data, whois_record
+
+
+def test_stale_entries_are_served_then_revalidated(lookups, monkeypatch):
+    cache = server.WhoisCache(10, 0, 0, use_mongo=False, stale_seconds=3600)
+    refresher = server.CacheRefresher(10, 10)
+    monkeypatch.setattr(server, "whois_cache", cache)
+    monkeypatch.setattr(server, "cache_refresher", refresher)
+
+    async def lookup(domain):
+        return whois_data(domain, expiry_date="2040-01-01T00:00:00Z")
+
+    monkeypatch.setattr(server.whois_providers, "lookup", lookup)
+
+    async def scenario():
+        await cache.set("example.com", whois_record("example.com"))
+        served = await server.fetch_whois_data("example.com")
+        await asyncio.gather(*refresher.tasks)
+        return served, cache.entries["example.com"][2]
+
+    served, refreshed = asyncio.run(scenario())
+    assert served.expiry_date == "2030-01-01T00:00:00Z"
+    assert refreshed.expiry_date == "2040-01-01T00:00:00Z"
+    assert cache.counters["stale_hits"] == 1
+    assert refresher.counters["scheduled"] == 1
+
+
+def test_refreshes_are_rate_limited_and_deduplicated(monkeypatch):
+    refresher = server.CacheRefresher(0.001, 2)
+
+    async def refresh(domain):
+        await asyncio.sleep(0.01)
+        refresher.pending.discard(domain)
+
+    monkeypatch.setattr(refresher, "refresh", refresh)
+
+    async def scenario():
+        results = [refresher.schedule(domain) for domain in ("a.com", "a.com", "b.com", "c.com")]
+        await asyncio.gather(*refresher.tasks)
+        return results
+
+    assert asyncio.run(scenario()) == [True, False, True, False]
+    assert refresher.counters["skipped"] == 1
+
+
+def test_prewarm_only_refreshes_popular_domains_near_expiry(lookups, mongo, monkeypatch):
+    cache = server.WhoisCache(10, 3600, 3600, use_mongo=False)
+    refresher = server.CacheRefresher(100, 100)
+    monkeypatch.setattr(server, "whois_cache", cache)
+    monkeypatch.setattr(server, "PREWARM_TOP_N", 2)
+    monkeypatch.setattr(server, "PREWARM_LEAD_SECONDS", 600)
+    scheduled = []
+    monkeypatch.setattr(refresher, "schedule", lambda domain: scheduled.append(domain) or True)
+
+    async def scenario():
+        await mongo.stats_domains.insert_many([
+            {"_id": "fresh.com", "count": 30},
+            {"_id": "missing.com", "count": 20},
+            {"_id": "unpopular.com", "count": 1},
+        ])
+        await cache.set("fresh.com", whois_record("fresh.com"))
+        await refresher.prewarm()
+
+    asyncio.run(scenario())
+    assert scheduled == ["missing.com"]
+
+
+def test_batch_lookups_revalidate_stale_entries(lookups, monkeypatch):
+    cache = server.WhoisCache(10, 0, 0, use_mongo=False, stale_seconds=3600)
+    refresher = server.CacheRefresher(10, 10)
+    monkeypatch.setattr(server, "whois_cache", cache)
+    monkeypatch.setattr(server, "cache_refresher", refresher)
+
+    async def lookup(domain):
+        return whois_data(domain, expiry_date="2040-01-01T00:00:00Z")
+
+    monkeypatch.setattr(server.whois_providers, "lookup", lookup)
+
+    async def scenario():
+        await cache.set("example.com", whois_record("example.com"))
+        served = [item async for item in server.resolve_whois_chunk(["example.com"])]
+        await asyncio.gather(*refresher.tasks)
+        return served, cache.entries["example.com"][2]
+
+    served, refreshed = asyncio.run(scenario())
+    assert served[0][1].expiry_date == "2030-01-01T00:00:00Z"
+    assert refreshed.expiry_date == "2040-01-01T00:00:00Z"
+    assert refresher.counters["scheduled"] == 1
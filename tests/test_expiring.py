@@ -0,0 +1,63 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+import server
+from tests.helpers import raw_cursor
+
+START = datetime(2030, 1, 1, tzinfo=timezone.utc)
+
+
+def seed(mongo, docs):
+    asyncio.run(mongo.domain_catalog.insert_many(docs))
+
+
+def test_cursor_round_trips_datetimes():
+    cursor = server.encode_cursor(START, "example.com")
+    assert server.decode_cursor(cursor, datetime, str) == [START, "example.com"]
+
+
+@pytest.mark.parametrize("cursor", [
+    "not base64!", raw_cursor({"a": 1}), raw_cursor([1]), raw_cursor(["x", "y"]),
+    raw_cursor([START.isoformat(), 1]), raw_cursor([START.isoformat(), "a.com", "extra"]),
+])
+def test_tampered_cursors_are_rejected(cursor):
+    with pytest.raises(HTTPException) as error:
+        server.decode_cursor(cursor, datetime, str)
+    assert error.value.status_code == 400
+
+
+def test_pages_follow_expiry_then_domain(mongo):
+    # Two domains share an expiry, so the page boundary has to break the tie on _id
+    seed(mongo, [
+        {"_id": "c.com", "tld": "com", "expiry_at": START + timedelta(days=1)},
+        {"_id": "b.com", "tld": "com", "expiry_at": START + timedelta(days=2)},
+        {"_id": "a.com", "tld": "com", "expiry_at": START + timedelta(days=2)},
+        {"_id": "a.net", "tld": "net", "expiry_at": START + timedelta(days=3)},
+        {"_id": "late.com", "tld": "com", "expiry_at": START + timedelta(days=30)},
+    ])
+    client = TestClient(server.app)
+    params = {"from": START.isoformat(), "limit": 2}
+
+    pages, cursor = [], None
+    while True:
+        response = client.get("/api/expiring", params={**params, **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == 200
+        body = response.json()
+        pages.append([item["domain"] for item in body["items"]])
+        cursor = body["next_cursor"]
+        if cursor is None:
+            break
+    assert pages == [["c.com", "a.com"], ["b.com", "a.net"], []]
+
+    response = client.get("/api/expiring", params={**params, "tld": ".NET"})
+    assert [item["domain"] for item in response.json()["items"]] == ["a.net"]
+
+
+@pytest.mark.parametrize("value", [[1], ["x", "y"], [START.isoformat(), 1]])
+def test_endpoint_answers_400_for_a_tampered_cursor(mongo, value):
+    response = TestClient(server.app).get("/api/expiring", params={"cursor": raw_cursor(value)})
+    assert response.status_code == 400
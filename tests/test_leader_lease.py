@@ -0,0 +1,129 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import server
+
+
+class Roles:
+    """Records the elected/demoted callbacks a lease makes"""
+
+    def __init__(self, fail_election=False):
+        self.fail_election = fail_election
+        self.events = []
+
+    async def elected(self):
+        self.events.append("elected")
+        if self.fail_election:
+            raise RuntimeError("could not start")
+
+    async def demoted(self):
+        self.events.append("demoted")
+
+
+def candidate(roles, ttl=30):
+    lease = server.LeaderLease("bot", ttl)
+    lease.on_elected, lease.on_demoted = roles.elected, roles.demoted
+    return lease
+
+
+def test_only_one_candidate_holds_the_lease(mongo):
+    first_roles, second_roles = Roles(), Roles()
+    first, second = candidate(first_roles), candidate(second_roles)
+
+    async def scenario():
+        await first.step()
+        await second.step()
+        await first.step()
+        return await first.current()
+
+    held = asyncio.run(scenario())
+    assert first.is_leader and not second.is_leader
+    assert first_roles.events == ["elected"]
+    assert second_roles.events == []
+    assert first.counters["renewals"] == 2
+    assert held["holder"] == first.holder
+
+
+def test_expired_lease_is_taken_over_and_the_old_holder_steps_down(mongo):
+    first_roles, second_roles = Roles(), Roles()
+    first, second = candidate(first_roles), candidate(second_roles)
+
+    async def scenario():
+        await first.step()
+        # The holder stopped renewing long enough for its lease to run out
+        expired = datetime.now(timezone.utc) - timedelta(seconds=1)
+        await mongo.leases.update_one({"_id": "bot"}, {"$set": {"expires_at": expired}})
+        await second.step()
+        await first.step()
+
+    asyncio.run(scenario())
+    assert second.is_leader and not first.is_leader
+    assert first_roles.events == ["elected", "demoted"]
+    assert second_roles.events == ["elected"]
+
+
+def test_release_hands_over_immediately(mongo):
+    first_roles, second_roles = Roles(), Roles()
+    first, second = candidate(first_roles), candidate(second_roles)
+
+    async def scenario():
+        await first.step()
+        await first.release()
+        await second.step()
+        return await second.current()
+
+    held = asyncio.run(scenario())
+    assert first_roles.events == ["elected", "demoted"]
+    assert second.is_leader
+    assert held["holder"] == second.holder
+
+
+def test_holder_keeps_the_role_through_a_brief_mongo_outage(mongo, monkeypatch):
+    roles = Roles()
+    lease = candidate(roles)
+
+    async def unreachable():
+        raise ConnectionError("mongo down")
+
+    async def scenario():
+        await lease.step()
+        monkeypatch.setattr(lease, "try_acquire", unreachable)
+        await lease.step()
+        still_leader = lease.is_leader
+        # Past the point where another candidate could have taken over
+        lease.valid_until = 0
+        await lease.step()
+        return still_leader
+
+    assert asyncio.run(scenario())
+    assert not lease.is_leader
+    assert roles.events == ["elected", "demoted"]
+    assert lease.counters["errors"] == 2
+
+
+def test_failed_takeover_releases_the_lease(mongo):
+    roles = Roles(fail_election=True)
+    lease = candidate(roles)
+
+    async def scenario():
+        await lease.step()
+        return await lease.current()
+
+    assert asyncio.run(scenario()) is None
+    assert not lease.is_leader
+    assert roles.events == ["elected", "demoted"]
+
+
+def test_elected_runner_keeps_updates_queued_during_failover(monkeypatch):
+    polled = []
+
+    async def start_polling(**kwargs):
+        polled.append(kwargs)
+
+    updater = SimpleNamespace(running=False, start_polling=start_polling)
+    monkeypatch.setattr(server, "telegram_app", SimpleNamespace(updater=updater))
+    monkeypatch.setattr(server, "TELEGRAM_MODE", "polling")
+    monkeypatch.setattr(server, "BOT_RUNNER", "elected")
+    asyncio.run(server.start_update_delivery())
+    assert polled == [{"drop_pending_updates": False}]
@@ -0,0 +1,55 @@
+import asyncio
+
+import httpx
+import pytest
+
+import server
+from benchmarks import load_test
+
+
+def test_percentile_is_nearest_rank():
+    samples = sorted(float(i) for i in range(1, 101))
+    assert load_test.percentile(samples, 0.5) == 50
+    assert load_test.percentile(samples, 0.99) == 99
+    assert load_test.percentile(samples, 1.0) == 100
+    assert load_test.percentile([], 0.95) == 0.0
+
+
+def test_mix_accepts_known_paths_only():
+    assert load_test.parse_mix("whois=3, api_stats") == {"whois": 3.0, "api_stats": 1.0}
+    with pytest.raises(SystemExit):
+        load_test.parse_mix("whois=1,nope=2")
+
+
+def test_compare_flags_p95_regressions_beyond_tolerance():
+    baseline = {"paths": {"whois": {"p95_ms": 100}, "check": {"p95_ms": 100}}}
+    report = {"paths": {"whois": {"p95_ms": 125}, "check": {"p95_ms": 105}, "new": {"p95_ms": 1}}}
+    assert load_test.compare(report, baseline, 0.1) == [
+        {"path": "whois", "baseline_p95_ms": 100, "p95_ms": 125},
+    ]
+
+
+def test_fake_whoisfreaks_serves_parseable_deterministic_records():
+    async def scenario(error_rate):
+        fake = load_test.FakeWhoisFreaks(0, 0, error_rate, 0.0, seed=1)
+        runner, base = await load_test.start_site(fake.app())
+        try:
+            async with httpx.AsyncClient(base_url=base) as client:
+                single = [await client.get("/v1.0/whois", params={"domainName": "Example.com"}) for _ in range(2)]
+                bulk = await client.post("/v1.0/bulkwhois", json={"domainNames": ["a.com", "b.net"]})
+        finally:
+            await runner.cleanup()
+        return single, bulk, fake.calls
+
+    single, bulk, calls = asyncio.run(scenario(0.0))
+    assert single[0].json() == single[1].json()
+    record = server.WhoisRecord.from_raw(single[0].json())
+    assert record.domain == "example.com"
+    assert record.registered and record.days_left > 0
+    assert [r["domain_name"] for r in bulk.json()["bulk_whois_response"]] == ["a.com", "b.net"]
+    assert calls == {"whois": 2, "bulkwhois": 1}
+
+    single, bulk, calls = asyncio.run(scenario(1.0))
+    assert [r.status_code for r in single] == [503, 503]
+    assert bulk.status_code == 503
+    assert calls["errors"] == 3
@@ -0,0 +1,83 @@
+import sys
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+import server
+
+
+@pytest.fixture(autouse=True)
+def frequent_thread_switches():
+    # Switch threads often enough that an unlocked read-modify-write loses updates
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    yield
+    sys.setswitchinterval(interval)
+
+
+def hammer(func, threads=8, calls=20000):
+    workers = [threading.Thread(target=lambda: [func() for _ in range(calls)]) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return threads * calls
+
+
+def test_counter_increments_from_many_threads_are_not_lost():
+    counter = server.CounterMetric("test_total", "test", ("kind",))
+    total = hammer(lambda: counter.inc("a"))
+    assert counter.values[("a",)] == total
+
+
+def test_histogram_observations_from_many_threads_are_not_lost():
+    histogram = server.HistogramMetric("test_seconds", "test", ("kind",), buckets=(0.1, 1.0))
+    total = hammer(lambda: histogram.observe(0.5, "a"))
+    assert histogram.series[("a",)][1] == total
+    assert histogram.series[("a",)][-1] == total * 0.5
+
+
+def test_render_while_updating_from_another_thread():
+    counter = server.CounterMetric("test_total", "test", ("kind",))
+    stop = threading.Event()
+
+    def update():
+        i = 0
+        while not stop.is_set():
+            counter.inc(f"k{i % 1000}")
+            i += 1
+
+    worker = threading.Thread(target=update)
+    worker.start()
+    try:
+        for _ in range(200):
+            counter.render()
+    finally:
+        stop.set()
+        worker.join()
+
+
+def test_exposition_format():
+    registry = server.MetricsRegistry()
+    requests = registry.counter("test_requests_total", "Requests", ("route",))
+    latency = registry.histogram("test_seconds", "Latency")
+    registry.collector(lambda: requests.set(5, 'say "hi"'))
+    requests.inc("/a")
+    latency.observe(0.003)
+    text = registry.render()
+    assert "# TYPE test_requests_total counter" in text
+    assert 'test_requests_total{route="/a"} 1' in text
+    assert 'test_requests_total{route="say \\"hi\\""} 5' in text
+    assert 'test_seconds_bucket{le="0.001"} 0' in text
+    assert 'test_seconds_bucket{le="0.005"} 1' in text
+    assert 'test_seconds_bucket{le="+Inf"} 1' in text
+    assert "test_seconds_count 1" in text
+
+
+def test_metrics_endpoint(mongo):
+    server.errors_total.inc("test", "scrape")
+    response = TestClient(server.app).get("/api/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'whoisbot_errors_total{component="test",kind="scrape"}' in response.text
@@ -0,0 +1,35 @@
+import pytest
+
+import server
+
+
+@pytest.mark.parametrize("raw, expected", [
+    ("WWW.Example.COM", "example.com"),
+    ("https://sub.domain.example.co.uk/path?x=1", "example.co.uk"),
+    ("HTTP://user@shop.example.com:8080/", "example.com"),
+    ("Bücher.de", "xn--bcher-kva.de"),
+    ("example.com.", "example.com"),
+])
+def test_reduces_input_to_the_registrable_domain(raw, expected):
+    assert server.normalize_domain(raw) == expected
+
+
+@pytest.mark.parametrize("raw", [
+    "", "not a domain", "localhost", "co.uk", "-bad-.com",
+    "1.2.3.4", "http://192.168.0.1:8080/admin", "10.0.0.1.", "1.2.3", "[::1]", "::ffff:1.2.3.4",
+    "example.123",
+])
+def test_rejects_non_domains_and_ip_literals(raw):
+    assert server.normalize_domain(raw) is None
+    assert not server.is_valid_domain(raw)
+
+
+def test_numeric_labels_below_the_tld_are_still_domains():
+    assert server.normalize_domain("www.123.com") == "123.com"
+    assert server.normalize_domain("1.2.3.example.net") == "example.net"
+
+
+def test_batch_preserves_order():
+    assert server.normalize_domains(["a.example.com", "1.2.3.4", "example.org"]) == [
+        "example.com", None, "example.org",
+    ]
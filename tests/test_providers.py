@@ -0,0 +1,214 @@
+import asyncio
+import contextlib
+
+import httpx
+import pytest
+
+import server
+from tests.helpers import whois_data
+
+RDAP_BASE = "https://rdap.registry.test/"
+RDAP_DOMAIN = {
+    "ldhName": "EXAMPLE.COM",
+    "status": ["client transfer prohibited"],
+    "events": [
+        {"eventAction": "registration", "eventDate": "1995-08-14T04:00:00Z"},
+        {"eventAction": "expiration", "eventDate": "2030-08-13T04:00:00Z"},
+    ],
+    "nameservers": [{"ldhName": "A.IANA-SERVERS.NET"}],
+    "entities": [{"roles": ["registrar"], "vcardArray": ["vcard", [["fn", {}, "text", "RDAP Registrar"]]]}],
+}
+
+REGISTRY_ANSWER = """Domain Name: EXAMPLE.COM
+Registry Expiry Date: 2030-08-13T04:00:00Z
+Registrar: Registry Registrar
+Registrar WHOIS Server: {referral}
+Name Server: A.IANA-SERVERS.NET
+Domain Status: clientTransferProhibited https://icann.org/epp#clientTransferProhibited
+"""
+REGISTRAR_ANSWER = """Domain Name: EXAMPLE.COM
+Registrant Name: Jane Doe
+Registrant Organization: Example Org
+"""
+
+
+def rdap_registry(request):
+    if request.url.host == "data.iana.test":
+        return httpx.Response(200, json={"services": [[["com"], [RDAP_BASE]]]})
+    if request.url.path == "/domain/example.com":
+        return httpx.Response(200, json=RDAP_DOMAIN)
+    if request.url.path == "/domain/free.com":
+        return httpx.Response(404)
+    return httpx.Response(400)
+
+
+@contextlib.asynccontextmanager
+async def whois_server(answers):
+    """Port-43 stand-in answering each query line from `answers`"""
+    queries = []
+
+    async def handle(reader, writer):
+        query = (await reader.readline()).decode().strip()
+        queries.append(query)
+        writer.write(answers.get(query, "No match for domain").encode())
+        await writer.drain()
+        writer.close()
+
+    listener = await asyncio.start_server(handle, "127.0.0.1", 0)
+    port = listener.sockets[0].getsockname()[1]
+    try:
+        yield f"127.0.0.1:{port}", queries
+    finally:
+        listener.close()
+        await listener.wait_closed()
+
+
+def test_providers_must_implement_lookup():
+    class Incomplete(server.WhoisProvider):
+        name = "incomplete"
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_rdap_uses_the_bootstrap_registry(upstream, monkeypatch):
+    monkeypatch.setattr(server, "RDAP_BOOTSTRAP_URL", "https://data.iana.test/rdap/dns.json")
+    upstream(rdap_registry)
+    provider = server.RdapProvider()
+    provider.bootstrap.path = provider.bootstrap.path.with_name("rdap_test.json")
+
+    async def scenario():
+        return await provider.lookup("example.com"), await provider.lookup("free.com")
+
+    data, free = asyncio.run(scenario())
+    record = server.WhoisRecord.from_raw(data, "example.com")
+    assert record.registered and record.provider == "rdap"
+    assert record.registrar == "RDAP Registrar"
+    assert record.expiry_date == "2030-08-13T04:00:00Z"
+    assert record.name_servers == ("a.iana-servers.net",)
+    assert free["domain_registered"] == "no"
+
+
+def test_rdap_rejections_are_invalid_domains(upstream):
+    upstream(rdap_registry)
+    provider = server.RdapProvider()
+    provider.overrides = {"com": RDAP_BASE}
+    with pytest.raises(server.InvalidDomain):
+        asyncio.run(provider.lookup("bad-.com"))
+
+
+def test_port43_follows_the_registrar_referral(monkeypatch):
+    async def scenario():
+        async with whois_server({"example.com": REGISTRAR_ANSWER}) as (registrar, _):
+            registry_answer = REGISTRY_ANSWER.format(referral=registrar)
+            async with whois_server({"example.com": registry_answer}) as (registry, _):
+                async with whois_server({"com": f"refer: {registry}\n"}) as (iana, iana_queries):
+                    monkeypatch.setattr(server, "WHOIS_IANA_SERVER", iana)
+                    provider = server.Port43Provider()
+                    provider.bootstrap.path = provider.bootstrap.path.with_name("port43_test.json")
+                    provider.bootstrap.table = {}
+                    first = await provider.lookup("example.com")
+                    second = await provider.lookup("example.com")
+                    return first, second, iana_queries
+
+    data, again, iana_queries = asyncio.run(scenario())
+    record = server.WhoisRecord.from_raw(data, "example.com")
+    assert record.registered and record.provider == "port43"
+    assert record.registrar == "Registry Registrar"
+    assert record.registrant == "Jane Doe"
+    assert record.expiry_date == "2030-08-13T04:00:00Z"
+    assert record.statuses == ("clientTransferProhibited",)
+    assert again == data
+    # The TLD's server is remembered after the first IANA referral
+    assert iana_queries == ["com"]
+
+
+def test_port43_not_found():
+    async def scenario():
+        async with whois_server({}) as (registry, _):
+            provider = server.Port43Provider()
+            provider.overrides = {"com": registry}
+            return await provider.lookup("free.com")
+
+    assert asyncio.run(scenario())["domain_registered"] == "no"
+
+
+def chain(hedge=False, delay=3.0):
+    rdap = server.RdapProvider()
+    rdap.overrides = {"com": RDAP_BASE}
+    return server.ProviderChain([server.WhoisFreaksProvider(), rdap], hedge, 0.95, delay)
+
+
+def test_chain_fails_over_when_whoisfreaks_is_down(upstream, monkeypatch):
+    monkeypatch.setattr(server, "whois_keys", server.ApiKeyPool("k1", None, "weighted"))
+
+    def handler(request):
+        if request.url.host == "rdap.registry.test":
+            return rdap_registry(request)
+        return httpx.Response(503, text="maintenance")
+
+    upstream(handler)
+    providers = chain()
+    data = asyncio.run(providers.lookup("example.com"))
+    assert data["provider"] == "rdap"
+    stats = providers.stats()
+    assert stats["whoisfreaks"]["failures"] == 1
+    assert stats["rdap"]["successes"] == 1
+
+
+def test_chain_prefers_the_first_provider(upstream, monkeypatch):
+    monkeypatch.setattr(server, "whois_keys", server.ApiKeyPool("k1", None, "weighted"))
+
+    def handler(request):
+        if request.url.host == "rdap.registry.test":
+            return rdap_registry(request)
+        return httpx.Response(200, json=whois_data("example.com"))
+
+    upstream(handler)
+    providers = chain()
+    data = asyncio.run(providers.lookup("example.com"))
+    assert data.get("provider", "whoisfreaks") == "whoisfreaks"
+    assert providers.stats()["rdap"]["calls"] == 0
+
+
+def test_hedged_request_wins_when_the_primary_is_slow(upstream, monkeypatch):
+    monkeypatch.setattr(server, "whois_keys", server.ApiKeyPool("k1", None, "weighted"))
+
+    async def handler(request):
+        if request.url.host == "rdap.registry.test":
+            return rdap_registry(request)
+        await asyncio.sleep(1)
+        return httpx.Response(200, json=whois_data("example.com"))
+
+    upstream(handler)
+    providers = chain(hedge=True, delay=0.01)
+    data = asyncio.run(providers.lookup("example.com"))
+    assert data["provider"] == "rdap"
+    assert providers.stats()["rdap"]["hedges"] == 1
+    # The losing primary was cancelled, and its key released
+    assert server.whois_keys.keys[0].in_flight == 0
+
+
+def test_fallback_answers_do_not_spend_whoisfreaks_credits(lookups, mongo, upstream, monkeypatch):
+    monkeypatch.setattr(server, "whois_keys", server.ApiKeyPool("k1", None, "weighted"))
+    monkeypatch.setattr(server, "whois_providers", chain())
+
+    def handler(request):
+        if request.url.host == "rdap.registry.test":
+            return rdap_registry(request)
+        if request.url.params.get("domainName") == "paid.com":
+            return httpx.Response(200, json=whois_data("paid.com"))
+        return httpx.Response(503, text="maintenance")
+
+    upstream(handler)
+
+    async def scenario():
+        record = await server.fetch_whois_data("example.com")
+        after_fallback = await mongo.quota_usage.find_one({})
+        await server.fetch_whois_data("paid.com")
+        return record, after_fallback, await mongo.quota_usage.find_one({})
+
+    record, after_fallback, after_paid = asyncio.run(scenario())
+    assert record.provider == "rdap"
+    assert after_fallback["credits"] == 0
+    assert after_paid["credits"] == 1
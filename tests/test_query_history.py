@@ -0,0 +1,94 @@
+import asyncio
+import csv
+import io
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from bson import ObjectId
+from fastapi.testclient import TestClient
+
+import server
+from tests.helpers import raw_cursor
+
+START = datetime(2030, 1, 1, tzinfo=timezone.utc)
+ADMIN = {"X-Panel-Password": server.PANEL_PASSWORD}
+
+
+@pytest.fixture
+def history(mongo):
+    # Pairs of queries share a timestamp, so pages have to break ties on _id
+    docs = [{
+        "_id": ObjectId(),
+        "timestamp": START + timedelta(minutes=i // 2),
+        "user_id": 1 + i % 2,
+        "username": f"user{1 + i % 2}",
+        "domain": "example.com" if i % 3 else "example.org",
+        "command": "whois" if i % 4 else "check",
+    } for i in range(10)]
+    asyncio.run(mongo.whois_queries.insert_many(docs))
+    return docs
+
+
+def newest_first(docs):
+    return [str(doc["_id"]) for doc in sorted(docs, key=lambda d: (d["timestamp"], d["_id"]), reverse=True)]
+
+
+def test_requires_admin(mongo):
+    client = TestClient(server.app)
+    assert client.get("/api/queries").status_code == 401
+    assert client.get("/api/queries/export", headers={"X-Panel-Password": "wrong"}).status_code == 401
+
+
+def test_pages_cover_every_query_once_newest_first(history):
+    client = TestClient(server.app)
+    ids, cursor = [], None
+    while True:
+        params = {"limit": 3, **({"cursor": cursor} if cursor else {})}
+        body = client.get("/api/queries", params=params, headers=ADMIN).json()
+        ids += [item["id"] for item in body["items"]]
+        cursor = body["next_cursor"]
+        if cursor is None:
+            break
+    assert ids == newest_first(history)
+
+
+def test_filters(history):
+    client = TestClient(server.app)
+    params = {"domain": "https://www.Example.com/", "user_id": 2, "command": "/WHOIS",
+              "from": (START + timedelta(minutes=1)).isoformat()}
+    items = client.get("/api/queries", params=params, headers=ADMIN).json()["items"]
+    expected = [doc for doc in history if doc["domain"] == "example.com" and doc["user_id"] == 2
+                and doc["command"] == "whois" and doc["timestamp"] >= START + timedelta(minutes=1)]
+    assert expected
+    assert [item["id"] for item in items] == newest_first(expected)
+
+
+@pytest.mark.parametrize("value", [
+    [1], ["x", "y"], [START.isoformat(), "not-an-object-id"], [START.isoformat(), 1], {"timestamp": 1},
+])
+def test_tampered_cursor_is_a_400(mongo, value):
+    client = TestClient(server.app)
+    for path in ("/api/queries", "/api/queries/export"):
+        response = client.get(path, params={"cursor": raw_cursor(value)}, headers=ADMIN)
+        assert response.status_code == 400
+
+
+def test_export_csv_and_ndjson(history, monkeypatch):
+    # Smaller than the history, so the export streams several batches
+    monkeypatch.setattr(server, "QUERY_EXPORT_BATCH", 4)
+    client = TestClient(server.app)
+
+    response = client.get("/api/queries/export", params={"user_id": 1}, headers=ADMIN)
+    assert response.headers["content-type"].startswith("text/csv")
+    assert 'filename="whois_queries.csv"' in response.headers["content-disposition"]
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [row["id"] for row in rows] == newest_first([doc for doc in history if doc["user_id"] == 1])
+    assert rows[0]["username"] == "user1"
+
+    response = client.get("/api/queries/export", params={"format": "ndjson", "limit": 7}, headers=ADMIN)
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["id"] for line in lines] == newest_first(history)[:7]
+
+    assert client.get("/api/queries/export", params={"format": "xml"}, headers=ADMIN).status_code == 422
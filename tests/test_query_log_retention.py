@@ -0,0 +1,80 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import server
+
+
+class RecordingCollection:
+    def __init__(self, name, calls):
+        self.name = name
+        self.calls = calls
+
+    def aggregate(self, pipeline):
+        self.calls.append((self.name, "aggregate", pipeline))
+
+        class Cursor:
+            async def to_list(self, length):
+                return []
+        return Cursor()
+
+    async def delete_many(self, query):
+        self.calls.append((self.name, "delete_many", query))
+
+        class Result:
+            deleted_count = 1
+        return Result()
+
+
+class RecordingDatabase:
+    def __init__(self):
+        self.calls = []
+
+    def __getattr__(self, name):
+        return RecordingCollection(name, self.calls)
+
+
+def test_archive_mode_keeps_bot_logs_too(monkeypatch):
+    database = RecordingDatabase()
+    monkeypatch.setattr(server, "db", database)
+    monkeypatch.setattr(server, "QUERY_LOG_RETENTION_DAYS", 30)
+    asyncio.run(server.archive_query_logs())
+
+    for name in ("whois_queries", "bot_logs"):
+        steps = [(op, arg) for collection, op, arg in database.calls if collection == name]
+        assert [op for op, _ in steps] == ["aggregate", "delete_many"]
+        pipeline, deleted = steps[0][1], steps[1][1]
+        assert pipeline[-1]["$merge"]["into"] == f"{name}_archive"
+        # Exactly what was copied is deleted
+        assert pipeline[0]["$match"] == deleted
+        cutoff = deleted["timestamp"]["$lt"]
+        assert abs(cutoff - (datetime.now(timezone.utc) - timedelta(days=30))) < timedelta(minutes=1)
+
+
+def test_ttl_mode_puts_the_ttl_on_the_timestamp_index(mongo, monkeypatch):
+    monkeypatch.setattr(server, "QUERY_LOG_RETENTION_DAYS", 7)
+    monkeypatch.setattr(server, "QUERY_LOG_RETENTION_MODE", "ttl")
+
+    async def scenario():
+        await server.ensure_query_log_indexes()
+        return (await mongo.whois_queries.index_information(),
+                await mongo.bot_logs.index_information())
+
+    queries, bot_logs = asyncio.run(scenario())
+    for indexes in (queries, bot_logs):
+        assert indexes["timestamp_-1"]["expireAfterSeconds"] == 7 * 86400
+
+
+def test_migration_converts_string_timestamps(mongo):
+    async def scenario():
+        await mongo.whois_queries.insert_many([
+            {"domain": "a.com", "timestamp": "2024-05-01T10:00:00+00:00"},
+            {"domain": "b.com", "timestamp": "2024-05-01T10:00:00"},
+            {"domain": "c.com", "timestamp": datetime(2024, 5, 2, tzinfo=timezone.utc)},
+        ])
+        result = await server.migrate_timestamps(batch_size=1)
+        return result, await mongo.whois_queries.find({}).sort("domain", 1).to_list(None)
+
+    result, docs = asyncio.run(scenario())
+    assert result["converted"] == 2
+    assert all(isinstance(doc["timestamp"], datetime) for doc in docs)
+    assert docs[1]["timestamp"] == datetime(2024, 5, 1, 10, tzinfo=timezone.utc)
@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+
+import server
+
+
+def daily_used(mongo):
+    async def scenario():
+        doc = await mongo.quota_usage.find_one({})
+        return doc["credits"] if doc else 0
+    return asyncio.run(scenario())
+
+
+def test_waiters_are_served_by_priority(mongo):
+    quota = server.QuotaManager(0, 0, 0, 0, max_concurrent=1, daily_credits=0)
+    order = []
+
+    async def call(name, priority):
+        async with quota.slot(priority=priority):
+            order.append(name)
+            await asyncio.sleep(0.001)
+
+    async def scenario():
+        async with quota.slot():
+            tasks = [asyncio.create_task(call(name, priority)) for name, priority in (
+                ("background", server.PRIORITY_BACKGROUND),
+                ("batch", server.PRIORITY_BATCH),
+                ("interactive", server.PRIORITY_INTERACTIVE),
+                ("api", server.PRIORITY_API),
+            )]
+            await asyncio.sleep(0.01)
+        await asyncio.gather(*tasks)
+        quota.task.cancel()
+
+    asyncio.run(scenario())
+    assert order == ["interactive", "api", "batch", "background"]
+
+
+def test_daily_budget_rejects_and_refunds(mongo):
+    quota = server.QuotaManager(0, 0, 0, 0, 0, daily_credits=3)
+
+    async def scenario():
+        async with quota.slot(cost=2):
+            pass
+        with pytest.raises(server.QuotaExceeded):
+            async with quota.slot(cost=2):
+                pass
+        async with quota.slot(cost=1):
+            pass
+
+    asyncio.run(scenario())
+    assert daily_used(mongo) == 3
+    assert quota.counters["rejected_daily"] == 1
+
+
+def test_cancelled_waiter_gets_its_credit_back(mongo):
+    quota = server.QuotaManager(0, 0, 0, 0, max_concurrent=1, daily_credits=10)
+
+    async def scenario():
+        async with quota.slot():
+            waiter = asyncio.create_task(quota.slot().__aenter__())
+            await asyncio.sleep(0.01)
+            waiter.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await waiter
+        quota.task.cancel()
+
+    asyncio.run(scenario())
+    assert daily_used(mongo) == 1
+    assert quota.in_flight == 0
+
+
+def test_throttled_user_does_not_block_others(mongo):
+    # One token per user, refilled slowly; the global limit is off
+    quota = server.QuotaManager(0.5, 1, 0, 0, 0, daily_credits=0)
+    served = []
+
+    async def call(user_id):
+        async with quota.slot(user_id):
+            served.append(user_id)
+
+    async def scenario():
+        await call(1)
+        slow = asyncio.create_task(call(1))
+        await asyncio.sleep(0.01)
+        await asyncio.wait_for(call(2), timeout=0.5)
+        slow.cancel()
+        quota.task.cancel()
+
+    asyncio.run(scenario())
+    assert served == [1, 2]
+
+
+def test_global_bucket_paces_callers(mongo):
+    quota = server.QuotaManager(0, 0, 50, 1, 0, daily_credits=0)
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        for _ in range(4):
+            async with quota.slot():
+                pass
+        quota.task.cancel()
+        return loop.time() - started
+
+    # One token up front, then 50/s: three more take about 60ms
+    assert asyncio.run(scenario()) >= 0.05
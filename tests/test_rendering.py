@@ -0,0 +1,58 @@
+import server
+from tests.helpers import whois_record
+
+
+def test_escapes_every_markdown_v2_special_character():
+    assert server.escape_markdown("a_b*c[d](e)~f`g>h#i+j-k=l|m{n}o.p!q\\") == (
+        "a\\_b\\*c\\[d\\]\\(e\\)\\~f\\`g\\>h\\#i\\+j\\-k\\=l\\|m\\{n\\}o\\.p\\!q\\\\"
+    )
+    assert server.escape_markdown(None) == ""
+    assert server.escape_code("a`b\\c_d") == "a\\`b\\\\c_d"
+
+
+def test_templates_keep_markup_and_escape_values_for_their_context():
+    compiled = server.MessageTemplate("*Title* for {domain}: `{value}`.")
+    assert compiled.render(domain="a-b.com", value="x`y") == "*Title* for a\\-b\\.com: `x\\`y`\\."
+    static = server.MessageTemplate("Plain (text).")
+    assert static.text == "Plain \\(text\\)\\."
+    assert static.render() == static.text
+
+
+def test_bundled_templates_render_in_both_languages():
+    for lang in ("en", "fa"):
+        text = server.template(lang, "watch_alert").render(domain="ex_ample.com", expiry="2030-01-01", days=7)
+        assert "`ex_ample.com`" in text
+        assert "7" in text
+
+
+def test_responses_are_rendered_once_per_record_and_language():
+    cache = server.RenderCache(10)
+    record = whois_record("example.com")
+    first = cache.render("whois", record, "example.com", "en")
+    assert cache.render("whois", record, "example.com", "en") is first
+    cache.render("whois", record, "example.com", "fa")
+    cache.render("check", record, "example.com", "en")
+    assert cache.counters == {"hits": 1, "misses": 3, "evictions": 0}
+    # A refetch is a new record version, so the text is rebuilt
+    cache.render("whois", whois_record("example.com"), "example.com", "en")
+    assert cache.counters["misses"] == 4
+
+
+def test_render_cache_evicts_least_recently_used():
+    cache = server.RenderCache(2)
+    a, b, c = (whois_record(f"{name}.com") for name in "abc")
+    cache.render("check", a, "a.com", "en")
+    cache.render("check", b, "b.com", "en")
+    cache.render("check", a, "a.com", "en")
+    cache.render("check", c, "c.com", "en")
+    assert cache.counters["evictions"] == 1
+    assert [key[3] for key in cache.entries] == ["a.com", "c.com"]
+
+
+def test_whois_response_escapes_record_fields():
+    record = whois_record("example.com", expiry_date="2030-01-01T00:00:00Z",
+                          domain_registrar={"registrar_name": "Example, Inc. (US)"})
+    text = server.build_whois_response(record, "example.com", "en")
+    assert "Example, Inc\\. \\(US\\)" in text
+    assert "`2030-01-01T00:00:00Z`" in text
+    assert server.build_expiry_response(whois_record("example.com", registered=False), "example.com", "en").endswith("❓ N/A")
@@ -0,0 +1,121 @@
+import asyncio
+
+import httpx
+
+import server
+from tests.helpers import whois_data
+
+
+def breaker(open_seconds=30.0):
+    return server.CircuitBreaker(window=10, min_calls=4, error_rate=0.5, open_seconds=open_seconds)
+
+
+def test_breaker_trips_on_the_error_rate():
+    cb = breaker()
+    for ok in (True, False, True, False):
+        assert cb.allow()
+        cb.record(ok)
+    assert cb.state == 'open'
+    assert not cb.ready()
+    assert not cb.allow()
+    assert cb.counters == {"opened": 1, "short_circuited": 1}
+
+
+def test_breaker_needs_min_calls_before_tripping():
+    cb = breaker()
+    for _ in range(3):
+        cb.record(False)
+    assert cb.state == 'closed'
+
+
+def test_half_open_allows_a_single_probe():
+    cb = breaker(open_seconds=0)
+    cb.trip()
+    assert cb.ready()
+    assert cb.allow()
+    assert cb.state == 'half_open'
+    assert not cb.ready() and not cb.allow()
+    cb.record(True)
+    assert cb.state == 'closed'
+
+
+def test_failed_probe_reopens_and_abandoned_probe_frees_the_slot():
+    cb = breaker(open_seconds=0)
+    cb.trip()
+    cb.allow()
+    cb.abandon()
+    assert cb.allow()
+    cb.record(False)
+    assert cb.state == 'open'
+    assert cb.counters["opened"] == 2
+
+
+def test_timeout_adapts_to_observed_latency(monkeypatch):
+    monkeypatch.setattr(server, "ADAPTIVE_TIMEOUT_MIN", 0.5)
+    monkeypatch.setattr(server, "ADAPTIVE_TIMEOUT_MULTIPLIER", 2)
+    chain = server.ProviderChain([server.WhoisFreaksProvider()], False, 0.95, 3)
+    provider = chain.providers[0]
+    assert chain.timeout_for(provider) == server.WHOIS_HTTP_READ_TIMEOUT
+    chain.latencies[provider.name].extend([0.4] * 50)
+    assert chain.timeout_for(provider) == 0.8
+
+
+def test_rejected_domains_are_negatively_cached(lookups, monkeypatch):
+    calls = 0
+
+    async def lookup(domain):
+        nonlocal calls
+        calls += 1
+        raise server.InvalidDomain(f"rejected {domain}")
+
+    monkeypatch.setattr(server.whois_providers, "lookup", lookup)
+
+    async def scenario():
+        return [await server.fetch_whois_data("bogus.com") for _ in range(3)]
+
+    assert asyncio.run(scenario()) == [None] * 3
+    assert calls == 1
+    assert server.whois_cache.counters["negative_hits"] == 2
+
+
+def test_open_circuits_do_not_spend_quota(lookups, mongo, upstream, monkeypatch):
+    monkeypatch.setattr(server, "CIRCUIT_MIN_CALLS", 10)
+    monkeypatch.setattr(server, "CIRCUIT_WINDOW", 10)
+    monkeypatch.setattr(server, "whois_keys", server.ApiKeyPool("k1", None, "weighted"))
+    monkeypatch.setattr(server, "whois_providers",
+                        server.ProviderChain([server.WhoisFreaksProvider()], False, 0.95, 3))
+    http = upstream(lambda request: httpx.Response(503, text="down"))
+
+    async def scenario():
+        for i in range(40):
+            await server.fetch_whois_data(f"d{i}.com")
+        return await mongo.quota_usage.find_one({})
+
+    usage = asyncio.run(scenario())
+    assert server.whois_providers.stats()["whoisfreaks"]["circuit"] == "open"
+    assert http.counters["requests"] == 10
+    # The failed calls got no answer, so their credits were refunded too
+    assert usage["credits"] == 0
+
+
+def test_circuits_opening_while_queued_refund_the_credit(lookups, mongo, monkeypatch):
+    chain = server.ProviderChain([server.WhoisFreaksProvider()], False, 0.95, 3)
+    monkeypatch.setattr(server, "whois_providers", chain)
+    monkeypatch.setattr(server, "upstream_quota", server.QuotaManager(0, 0, 0, 0, 1, daily_credits=100))
+
+    async def lookup(domain):
+        # The second caller queues for the slot meanwhile; then the circuit opens
+        await asyncio.sleep(0.01)
+        chain.breakers["whoisfreaks"].trip()
+        return whois_data(domain)
+
+    monkeypatch.setattr(chain, "lookup", lookup)
+
+    async def scenario():
+        results = await asyncio.gather(server.fetch_whois_data("a.com"), server.fetch_whois_data("b.com"))
+        server.upstream_quota.task.cancel()
+        return results, await mongo.quota_usage.find_one({})
+
+    (first, second), usage = asyncio.run(scenario())
+    assert first is not None and second is None
+    assert usage["credits"] == 1
@@ -0,0 +1,72 @@
+import asyncio
+
+import server
+
+
+def test_concurrent_callers_share_one_call():
+    flight = server.SingleFlight()
+    calls = 0
+
+    async def lookup():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "result"
+
+    async def scenario():
+        return await asyncio.gather(*(flight.do("example.com", lookup) for _ in range(10)))
+
+    assert asyncio.run(scenario()) == ["result"] * 10
+    assert calls == 1
+    assert flight.counters == {"leaders": 1, "coalesced": 9}
+    assert flight.inflight == {}
+
+
+def test_cancelled_caller_does_not_cancel_the_others():
+    flight = server.SingleFlight()
+
+    async def lookup():
+        await asyncio.sleep(0.02)
+        return "result"
+
+    async def scenario():
+        first = asyncio.create_task(flight.do("example.com", lookup))
+        second = asyncio.create_task(flight.do("example.com", lookup))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second, first
+
+    result, first = asyncio.run(scenario())
+    assert result == "result"
+    assert first.cancelled()
+
+
+def test_errors_reach_every_caller_and_release_the_key():
+    flight = server.SingleFlight()
+
+    async def lookup():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream down")
+
+    async def scenario():
+        results = await asyncio.gather(*(flight.do("example.com", lookup) for _ in range(3)),
+                                       return_exceptions=True)
+        return results
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert flight.inflight == {}
+
+
+def test_sequential_calls_are_not_coalesced():
+    flight = server.SingleFlight()
+
+    async def lookup():
+        return 1
+
+    async def scenario():
+        await flight.do("example.com", lookup)
+        await flight.do("example.com", lookup)
+
+    asyncio.run(scenario())
+    assert flight.counters["leaders"] == 2
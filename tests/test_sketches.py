@@ -0,0 +1,82 @@
+import asyncio
+import random
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+import server
+
+
+def test_hyperloglog_stays_within_its_error_bound():
+    hll = server.HyperLogLog(12)
+    for user_id in range(20000):
+        hll.add(user_id)
+    assert abs(hll.count() - 20000) / 20000 < 3 * hll.relative_error()
+
+
+def test_hyperloglog_merge_equals_union():
+    left, right, union = (server.HyperLogLog(10) for _ in range(3))
+    for value in range(3000):
+        (left if value % 2 else right).add(value)
+        union.add(value)
+    left.merge(right)
+    assert left.registers == union.registers
+
+
+def test_space_saving_bounds_every_count():
+    rng = random.Random(7)
+    stream = [f"d{int(rng.paretovariate(1.2))}.com" for _ in range(5000)]
+    sketch = server.SpaceSaving(50)
+    for item in stream:
+        sketch.add(item)
+    truth = Counter(stream)
+    for entry in sketch.top(10):
+        assert truth[entry["domain"]] <= entry["count"] <= truth[entry["domain"]] + entry["error"]
+    assert sketch.top(1)[0]["domain"] == truth.most_common(1)[0][0]
+
+
+def test_window_merges_buckets_from_every_process(mongo):
+    now = datetime.now(timezone.utc)
+    first = server.QuerySketches(3600, 10, 20)
+    second = server.QuerySketches(3600, 10, 20)
+    first.add_many([{"user_id": u, "domain": "a.com", "timestamp": now} for u in range(30)])
+    second.add_many([{"user_id": u, "domain": "b.com", "timestamp": now} for u in range(20, 40)])
+    # Outside the window
+    second.add_many([{"user_id": 99, "domain": "old.com", "timestamp": now - timedelta(days=3)}])
+
+    async def scenario():
+        await first.persist()
+        await second.persist()
+        return await first.window(now - timedelta(hours=1))
+
+    window = asyncio.run(scenario())
+    assert window["total_queries"] == 50
+    assert abs(window["unique_users"] - 40) <= 2
+    assert [d["domain"] for d in window["popular_domains"]] == ["a.com", "b.com"]
+
+
+def test_persist_drops_finished_buckets_from_memory(mongo):
+    sketches = server.QuerySketches(3600, 10, 20)
+    sketches.add_many([{"user_id": 1, "domain": "a.com", "timestamp": datetime.now(timezone.utc) - timedelta(days=1)}])
+    asyncio.run(sketches.persist())
+    assert sketches.buckets == {}
+    assert asyncio.run(mongo.stats_sketches.count_documents({})) == 1
+
+
+def test_windowed_stats_report_their_error_bounds(mongo, monkeypatch):
+    sketches = server.QuerySketches(3600, 12, 50)
+    monkeypatch.setattr(server, "query_sketches", sketches)
+    now = datetime.now(timezone.utc)
+    docs = [{"user_id": u % 5, "username": None, "domain": "a.com", "command": "whois", "timestamp": now}
+            for u in range(10)]
+
+    async def scenario():
+        await mongo.whois_queries.insert_many([dict(doc) for doc in docs])
+        sketches.add_many(docs)
+        await sketches.persist()
+        return await server.get_stats(window_hours=1, mode="approx"), await server.get_stats(window_hours=1, mode="exact")
+
+    approx, exact = asyncio.run(scenario())
+    assert approx.approximate and approx.error_bounds is not None
+    assert not exact.approximate
+    assert approx.total_queries == exact.total_queries == 10
+    assert approx.unique_users == exact.unique_users == 5
@@ -0,0 +1,60 @@
+import asyncio
+from datetime import datetime, timezone
+
+import server
+
+
+def query(user_id, domain, timestamp=None):
+    return {"user_id": user_id, "username": None, "domain": domain, "command": "whois",
+            "timestamp": timestamp or datetime.now(timezone.utc)}
+
+
+def test_batches_fold_into_counters(mongo):
+    async def scenario():
+        await server.record_query_stats([query(1, "a.com"), query(2, "a.com"), query(1, "b.com")])
+        await server.record_query_stats([query(2, "a.com"), query(3, "c.com")])
+        return await server.all_time_stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["total_queries"] == 5
+    assert stats["unique_users"] == 3
+    assert stats["popular_domains"][0] == {"domain": "a.com", "count": 3}
+
+
+def test_first_seen_is_a_datetime_and_never_moves(mongo):
+    async def scenario():
+        await server.record_query_stats([query(1, "a.com")])
+        first = await mongo.stats_users.find_one({"_id": 1})
+        await server.record_query_stats([query(1, "b.com")])
+        second = await mongo.stats_users.find_one({"_id": 1})
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert isinstance(first["first_seen"], datetime)
+    assert first["first_seen"].tzinfo is not None
+    assert second["first_seen"] == first["first_seen"]
+
+
+def test_rebuild_matches_incremental_rollups(mongo):
+    docs = [query(1, "a.com"), query(2, "a.com"), query(3, "b.com")]
+
+    async def scenario():
+        await mongo.whois_queries.insert_many([dict(doc) for doc in docs])
+        await server.record_query_stats(docs)
+        incremental = await server.all_time_stats()
+        await server.rebuild_stats()
+        return incremental, await server.all_time_stats()
+
+    incremental, rebuilt = asyncio.run(scenario())
+    assert rebuilt == incremental
+
+
+def test_migration_converts_string_first_seen(mongo):
+    async def scenario():
+        await mongo.stats_users.insert_one({"_id": 1, "first_seen": "2024-05-01T10:00:00+00:00"})
+        result = await server.migrate_timestamps()
+        return result, await mongo.stats_users.find_one({"_id": 1})
+
+    result, doc = asyncio.run(scenario())
+    assert result["converted"] == 1
+    assert doc["first_seen"] == datetime(2024, 5, 1, 10, tzinfo=timezone.utc)
@@ -0,0 +1,94 @@
+import asyncio
+import json
+
+import server
+
+
+def state(total=1, recent=(1,)):
+    return {
+        "total_queries": total,
+        "unique_users": 1,
+        "popular_domains": [{"domain": "example.com", "count": total}],
+        "health": {"mongo": "ok"},
+        "recent_queries": [{"id": str(i), "domain": f"d{i}.com"} for i in recent],
+    }
+
+
+def parse(frame: str):
+    event, data = frame.rstrip("\n").split("\n")
+    return event.removeprefix("event: "), json.loads(data.removeprefix("data: "))
+
+
+def polling(monkeypatch, states, interval=0.02, queue_size=10):
+    stream = server.StatsStream(interval, 5, queue_size)
+    states = iter(states)
+
+    async def snapshot():
+        return next(states)
+
+    monkeypatch.setattr(stream, "snapshot", snapshot)
+    return stream
+
+
+def test_diff_sends_changed_fields_and_unseen_queries():
+    stream = server.StatsStream(1, 1, 1)
+    assert stream.diff(state(), state()) == {}
+    delta = stream.diff(state(total=1, recent=(1, 2)), state(total=2, recent=(3, 1, 2)))
+    assert delta["total_queries"] == 2
+    assert delta["popular_domains"] == [{"domain": "example.com", "count": 2}]
+    assert delta["recent_queries"] == [{"id": "3", "domain": "d3.com"}]
+    assert "health" not in delta and "unique_users" not in delta
+
+
+def test_snapshot_then_deltas_and_late_joiners_get_the_cached_snapshot(monkeypatch):
+    async def scenario():
+        stream = polling(monkeypatch, [state()] + [state(total=2, recent=(2, 1))] * 50)
+        first = stream.subscribe()
+        frames = [parse(await asyncio.wait_for(first.get(), 1)), parse(await asyncio.wait_for(first.get(), 1))]
+        late = stream.subscribe()
+        late_frame = parse(late.get_nowait())
+        polls = stream.counters["polls"]
+        stream.unsubscribe(first)
+        stream.unsubscribe(late)
+        return stream, frames, late_frame, polls
+
+    stream, frames, late_frame, polls = asyncio.run(scenario())
+    assert frames[0] == ("snapshot", state())
+    assert frames[1] == ("delta", {"total_queries": 2, "popular_domains": [{"domain": "example.com", "count": 2}],
+                                   "recent_queries": [{"id": "2", "domain": "d2.com"}]})
+    assert late_frame == ("snapshot", state(total=2, recent=(2, 1)))
+    assert polls >= 2 and stream.counters["deltas"] == 1
+    # The last client leaving stops the poller and forgets the cached state
+    assert stream.task is None and stream.state is None
+
+
+def test_slow_client_is_dropped_without_blocking_others():
+    async def scenario():
+        stream = server.StatsStream(1, 5, 1)
+        slow, fast = asyncio.Queue(1), asyncio.Queue(10)
+        stream.subscribers.update({slow, fast})
+        stream.publish("delta", {"total_queries": 1})
+        stream.publish("delta", {"total_queries": 2})
+        # The dropped client's stream ends, so it reconnects for a fresh snapshot instead of a gap
+        frames = [frame async for frame in stream.events(slow)]
+        return stream, frames, fast.qsize()
+
+    stream, frames, fast_frames = asyncio.run(scenario())
+    assert stream.counters["dropped_clients"] == 1
+    assert fast_frames == 2
+    assert frames == []
+
+
+def test_idle_stream_sends_keepalives():
+    async def scenario():
+        stream = server.StatsStream(1, 0.01, 1)
+        queue = asyncio.Queue(1)
+        stream.subscribers.add(queue)
+        events = stream.events(queue)
+        frame = await events.__anext__()
+        await events.aclose()
+        return stream, frame
+
+    stream, frame = asyncio.run(scenario())
+    assert frame == ": keepalive\n\n"
+    assert not stream.subscribers
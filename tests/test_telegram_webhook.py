@@ -0,0 +1,70 @@
+import asyncio
+from types import SimpleNamespace
+
+from fastapi.testclient import TestClient
+
+import server
+
+SECRET = "test-webhook-secret"
+UPDATE = {
+    "update_id": 1,
+    "message": {
+        "message_id": 1,
+        "date": 0,
+        "chat": {"id": 42, "type": "private"},
+        "from": {"id": 42, "is_bot": False, "first_name": "Test"},
+        "text": "/whois example.com",
+    },
+}
+
+
+class FakeBot:
+    def __init__(self):
+        self.webhooks = []
+
+    async def set_webhook(self, **kwargs):
+        self.webhooks.append(kwargs)
+
+
+def webhook_app(monkeypatch, running=True):
+    monkeypatch.setattr(server, "TELEGRAM_WEBHOOK_SECRET", SECRET)
+    app = SimpleNamespace(bot=FakeBot(), update_queue=asyncio.Queue(), updater=None) if running else None
+    monkeypatch.setattr(server, "telegram_app", app)
+    return app
+
+
+def test_webhook_rejects_a_wrong_secret(monkeypatch):
+    app = webhook_app(monkeypatch)
+    response = TestClient(server.app).post("/telegram/webhook", json=UPDATE,
+                                           headers={"X-Telegram-Bot-Api-Secret-Token": "nope"})
+    assert response.status_code == 403
+    assert app.update_queue.empty()
+
+
+def test_webhook_queues_updates(monkeypatch):
+    app = webhook_app(monkeypatch)
+    response = TestClient(server.app).post("/telegram/webhook", json=UPDATE,
+                                           headers={"X-Telegram-Bot-Api-Secret-Token": SECRET})
+    assert response.status_code == 200
+    update = app.update_queue.get_nowait()
+    assert update.message.text == "/whois example.com"
+
+
+def test_webhook_is_unavailable_without_a_bot(monkeypatch):
+    webhook_app(monkeypatch, running=False)
+    response = TestClient(server.app).post("/telegram/webhook", json=UPDATE,
+                                           headers={"X-Telegram-Bot-Api-Secret-Token": SECRET})
+    assert response.status_code == 503
+
+
+def test_delivery_registers_the_webhook(monkeypatch):
+    app = webhook_app(monkeypatch)
+    monkeypatch.setattr(server, "TELEGRAM_MODE", "webhook")
+    monkeypatch.setattr(server, "TELEGRAM_WEBHOOK_URL", "https://bot.example.com/")
+    monkeypatch.setattr(server, "BOT_RUNNER", "embedded")
+    asyncio.run(server.start_update_delivery())
+    registered = app.bot.webhooks[0]
+    assert registered["url"] == "https://bot.example.com/telegram/webhook"
+    assert registered["secret_token"] == SECRET
+    assert registered["drop_pending_updates"] is True
+
@@ -0,0 +1,54 @@
+import asyncio
+
+import httpx
+import pytest
+
+import server
+
+
+def test_client_is_created_once_and_reused():
+    http = server.UpstreamHTTP()
+
+    async def scenario():
+        try:
+            return http.start(), http.start()
+        finally:
+            await http.close()
+
+    first, second = asyncio.run(scenario())
+    assert first is second
+    assert http.client is None
+
+
+def test_requests_are_counted(upstream):
+    http = upstream(lambda request: httpx.Response(200, json={"ok": True}))
+
+    async def scenario():
+        return await http.get("https://upstream.test/v1")
+
+    assert asyncio.run(scenario()).json() == {"ok": True}
+    assert http.counters["requests"] == 1
+    assert http.in_flight == 0
+    assert http.peak_in_flight == 1
+
+
+def test_transport_errors_are_counted(upstream):
+    def refuse(request):
+        raise httpx.ConnectError("refused", request=request)
+
+    http = upstream(refuse)
+    with pytest.raises(httpx.ConnectError):
+        asyncio.run(http.get("https://upstream.test/v1"))
+    assert http.counters["errors"] == 1
+    assert http.in_flight == 0
+
+
+def test_pool_timeouts_are_counted_separately(upstream):
+    def exhausted(request):
+        raise httpx.PoolTimeout("pool full", request=request)
+
+    http = upstream(exhausted)
+    with pytest.raises(httpx.PoolTimeout):
+        asyncio.run(http.post("https://upstream.test/v1"))
+    assert http.counters["pool_timeouts"] == 1
+    assert http.counters["errors"] == 0
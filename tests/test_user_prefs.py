@@ -0,0 +1,60 @@
+import asyncio
+
+import server
+
+
+def test_preferences_persist_across_replicas(mongo):
+    writer = server.UserPreferences(10)
+    reader = server.UserPreferences(10)
+
+    async def scenario():
+        await writer.set(42, language="en")
+        return await reader.load(42)
+
+    assert asyncio.run(scenario())["language"] == "en"
+    assert reader.language(42) == "en"
+
+
+def test_loads_are_cached(mongo):
+    prefs = server.UserPreferences(10)
+
+    async def scenario():
+        await prefs.load(42)
+        await prefs.load(42)
+
+    asyncio.run(scenario())
+    assert prefs.counters["misses"] == 1
+    assert prefs.counters["hits"] == 1
+
+
+def test_unknown_users_get_the_default_language(mongo):
+    prefs = server.UserPreferences(10)
+    asyncio.run(prefs.load(7))
+    assert prefs.language(7) == server.DEFAULT_LANGUAGE
+    assert prefs.language(8) == server.DEFAULT_LANGUAGE
+
+
+def test_cache_is_bounded(mongo):
+    prefs = server.UserPreferences(2)
+
+    async def scenario():
+        for user_id in range(3):
+            await prefs.set(user_id, language="en")
+
+    asyncio.run(scenario())
+    assert list(prefs.entries) == [1, 2]
+    assert prefs.counters["evictions"] == 1
+
+
+def test_mongo_errors_fall_back_to_defaults(monkeypatch):
+    class Broken:
+        class user_prefs:
+            @staticmethod
+            async def find_one(*args, **kwargs):
+                raise RuntimeError("mongo down")
+
+    monkeypatch.setattr(server, "db", Broken())
+    prefs = server.UserPreferences(10)
+    assert asyncio.run(prefs.load(42)) == {}
+    # Not cached, so the next update retries
+    assert 42 not in prefs.entries
@@ -0,0 +1,149 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import server
+from tests.helpers import whois_record
+
+
+class FakeBot:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.sent = []
+
+    async def send_message(self, **kwargs):
+        if self.fail:
+            raise RuntimeError("blocked by user")
+        self.sent.append(kwargs)
+
+
+def expiring_in(days: int) -> str:
+    return (datetime.now(timezone.utc) + timedelta(days=days)).strftime("%Y-%m-%dT00:00:00Z")
+
+
+def watching(monkeypatch, bot=None):
+    bot = bot or FakeBot()
+    monkeypatch.setattr(server, "telegram_app", SimpleNamespace(bot=bot))
+    monkeypatch.setattr(server, "WATCH_THRESHOLDS", [30, 7, 1])
+    return server.WatchScheduler(), bot
+
+
+def test_interval_shrinks_as_expiry_nears(monkeypatch):
+    monkeypatch.setattr(server, "WATCH_THRESHOLDS", [30, 7, 1])
+    monkeypatch.setattr(server.random, "uniform", lambda a, b: 1.0)
+    assert server.next_watch_interval(None) == 86400
+    assert server.next_watch_interval(365) == 7 * 86400
+    # Lands on the day the 30-day threshold is crossed
+    assert server.next_watch_interval(32) == 2 * 86400
+    assert server.next_watch_interval(0) == 3600
+
+
+def test_expired_domains_back_off(monkeypatch):
+    monkeypatch.setattr(server, "WATCH_EXPIRED_GRACE_DAYS", 45)
+    monkeypatch.setattr(server.random, "uniform", lambda a, b: 1.0)
+    assert server.next_watch_interval(-1) == 86400
+    assert server.next_watch_interval(-45) == 86400
+    assert server.next_watch_interval(-46) == 7 * 86400
+    assert server.next_watch_interval(-400) == 7 * 86400
+
+
+def test_watch_limit_and_shared_domain_schedule(mongo, monkeypatch):
+    monkeypatch.setattr(server, "WATCH_MAX_PER_USER", 2)
+
+    async def scenario():
+        results = [await server.add_watch(1, "a.com"), await server.add_watch(1, "a.com"),
+                   await server.add_watch(1, "b.com"), await server.add_watch(1, "c.com"),
+                   await server.add_watch(2, "a.com")]
+        shared = await mongo.watch_domains.find_one({"_id": "a.com"})
+        listed = await server.list_watches(1)
+        removed = [await server.remove_watch(1, "a.com"), await server.remove_watch(1, "a.com")]
+        still_watched = await mongo.watch_domains.find_one({"_id": "a.com"})
+        await server.remove_watch(2, "a.com")
+        gone = await mongo.watch_domains.find_one({"_id": "a.com"})
+        return results, shared, listed, removed, still_watched, gone
+
+    results, shared, listed, removed, still_watched, gone = asyncio.run(scenario())
+    assert results == ["added", "exists", "added", "limit", "added"]
+    assert shared["watchers"] == 2
+    assert [w["domain"] for w in listed] == ["a.com", "b.com"]
+    assert removed == [True, False]
+    assert still_watched["watchers"] == 1
+    assert gone is None
+
+
+def test_each_threshold_is_notified_once(mongo, monkeypatch):
+    scheduler, bot = watching(monkeypatch)
+    expiry = expiring_in(5)
+
+    async def scenario():
+        await server.add_watch(42, "example.com")
+        await scheduler.apply("example.com", whois_record("example.com", expiry_date=expiry))
+        await scheduler.apply("example.com", whois_record("example.com", expiry_date=expiry))
+        return await mongo.watchlist.find_one({"user_id": 42}), await mongo.watch_domains.find_one({"_id": "example.com"})
+
+    watch, domain = asyncio.run(scenario())
+    assert len(bot.sent) == 1
+    assert bot.sent[0]["chat_id"] == 42
+    assert watch["notified"] == {"expiry_date": expiry[:10], "thresholds": [7, 30]}
+    assert domain["expiry_date"] == expiry
+    assert server.as_utc(domain["next_check"]) > datetime.now(timezone.utc)
+
+
+def test_renewal_rearms_thresholds(mongo, monkeypatch):
+    scheduler, bot = watching(monkeypatch)
+
+    async def scenario():
+        await server.add_watch(42, "example.com")
+        await scheduler.apply("example.com", whois_record("example.com", expiry_date=expiring_in(5)))
+        # Renewed for a year: nothing crossed, nothing sent
+        await scheduler.apply("example.com", whois_record("example.com", expiry_date=expiring_in(365)))
+        await scheduler.apply("example.com", whois_record("example.com", expiry_date=expiring_in(20)))
+
+    asyncio.run(scenario())
+    assert len(bot.sent) == 2
+
+
+def test_same_date_from_another_provider_is_not_a_renewal(mongo, monkeypatch):
+    scheduler, bot = watching(monkeypatch)
+    expiry = expiring_in(5)
+
+    async def scenario():
+        await server.add_watch(42, "example.com")
+        await scheduler.apply("example.com", whois_record("example.com", expiry_date=expiry))
+        # RDAP reports the same day as a full timestamp with an offset
+        rdap = expiry[:10] + "T12:30:00+00:00"
+        await scheduler.apply("example.com", whois_record("example.com", expiry_date=rdap))
+
+    asyncio.run(scenario())
+    assert len(bot.sent) == 1
+
+
+def test_failed_notification_is_retried(mongo, monkeypatch):
+    bot = FakeBot(fail=True)
+    scheduler, _ = watching(monkeypatch, bot)
+    expiry = expiring_in(5)
+
+    async def scenario():
+        await server.add_watch(42, "example.com")
+        await scheduler.apply("example.com", whois_record("example.com", expiry_date=expiry))
+        bot.fail = False
+        await scheduler.apply("example.com", whois_record("example.com", expiry_date=expiry))
+
+    asyncio.run(scenario())
+    assert len(bot.sent) == 1
+    assert scheduler.counters["notified"] == 1
+
+
+def test_heap_only_pops_due_domains(monkeypatch):
+    monkeypatch.setattr(server, "WATCH_MAX_PER_TICK", 2)
+    scheduler = server.WatchScheduler()
+    now = datetime.now(timezone.utc)
+    for offset, domain in [(-3, "a.com"), (-2, "b.com"), (-1, "c.com"), (60, "later.com")]:
+        scheduler.heap.append((now + timedelta(seconds=offset), domain))
+        scheduler.queued.add(domain)
+    scheduler.heap.sort()
+
+    assert scheduler.due(now) == ["a.com", "b.com"]
+    assert scheduler.due(now) == ["c.com"]
+    assert scheduler.due(now) == []
+    assert scheduler.queued == {"later.com"}
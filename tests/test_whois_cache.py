@@ -0,0 +1,74 @@
+import asyncio
+
+import server
+from tests.helpers import whois_record
+
+
+def test_memory_hit_after_set(mongo):
+    cache = server.WhoisCache(10, 3600, 60)
+
+    async def scenario():
+        await cache.set("example.com", whois_record("example.com"))
+        return await cache.get("example.com")
+
+    record = asyncio.run(scenario())
+    assert record.domain == "example.com"
+    assert cache.counters["memory_hits"] == 1
+    assert cache.counters["misses"] == 0
+
+
+def test_mongo_tier_refills_memory(mongo):
+    writer = server.WhoisCache(10, 3600, 60)
+    reader = server.WhoisCache(10, 3600, 60)
+
+    async def scenario():
+        await writer.set("example.com", whois_record("example.com"))
+        first = await reader.get("example.com")
+        second = await reader.get("example.com")
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first.registrar == second.registrar == "Example Registrar"
+    assert reader.counters["mongo_hits"] == 1
+    assert reader.counters["memory_hits"] == 1
+
+
+def test_legacy_raw_documents_are_parsed(mongo):
+    cache = server.WhoisCache(10, 3600, 60)
+
+    async def scenario():
+        await mongo.whois_cache.insert_one({
+            "_id": "legacy.com",
+            "data": {"domain_name": "legacy.com", "domain_registered": "yes"},
+            "expires_at": server.datetime.now(server.timezone.utc) + server.timedelta(hours=1),
+        })
+        return await cache.get("legacy.com")
+
+    assert asyncio.run(scenario()).registered
+
+
+def test_lru_eviction(mongo):
+    cache = server.WhoisCache(2, 3600, 60, use_mongo=False)
+
+    async def scenario():
+        for domain in ("a.com", "b.com"):
+            await cache.set(domain, whois_record(domain))
+        await cache.get("a.com")
+        await cache.set("c.com", whois_record("c.com"))
+        return [await cache.get(domain) for domain in ("a.com", "b.com", "c.com")]
+
+    a, b, c = asyncio.run(scenario())
+    assert a is not None and c is not None
+    assert b is None
+    assert cache.counters["evictions"] == 1
+
+
+def test_available_domains_use_their_own_ttl(mongo):
+    cache = server.WhoisCache(10, 3600, 0, use_mongo=False)
+
+    async def scenario():
+        await cache.set("free.com", whois_record("free.com", registered=False))
+        return await cache.get("free.com")
+
+    assert asyncio.run(scenario()) is None
+    assert cache.counters["misses"] == 1
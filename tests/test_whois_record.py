@@ -0,0 +1,63 @@
+from datetime import datetime, timedelta, timezone
+
+import server
+from tests.helpers import whois_data, whois_record
+
+
+def test_parses_whoisfreaks_fields_once():
+    record = whois_record("example.com", create_date="2000-05-01 12:00:00",
+                          name_servers=["ns1.example.net"], domain_status=["clientTransferProhibited"])
+    assert record.registered
+    assert record.registrar == "Example Registrar"
+    assert record.created_at == datetime(2000, 5, 1, 12, tzinfo=timezone.utc)
+    assert record.expiry_at == datetime(2030, 1, 1, tzinfo=timezone.utc)
+    assert record.name_servers == ("ns1.example.net",)
+    assert record.statuses == ("clientTransferProhibited",)
+    assert not hasattr(record, "__dict__")
+    # WhoisFreaks' boolean success flag is not a domain status
+    assert whois_record("example.com").statuses == ()
+
+
+def test_falls_back_to_rdap_and_port43_field_names():
+    record = server.WhoisRecord.from_raw({
+        "domain_registered": "yes",
+        "registrar": {"name": "Other Registrar"},
+        "registrant": {"organization": "Example Org"},
+        "creation_date": "1999-01-02",
+        "nameservers": ["NS1.EXAMPLE.ORG"],
+        "status": "active",
+        "provider": "rdap",
+    }, "Example.ORG")
+    assert record.domain == "example.org"
+    assert record.registrar == "Other Registrar"
+    assert record.registrant == "Example Org"
+    assert record.created_at == datetime(1999, 1, 2, tzinfo=timezone.utc)
+    assert record.statuses == ("active",)
+    assert record.provider == "rdap"
+
+
+def test_days_left_counts_calendar_days():
+    expiry = (datetime.now(timezone.utc) + timedelta(days=10)).strftime("%Y-%m-%dT23:59:59Z")
+    assert whois_record("example.com", expiry_date=expiry).days_left == 10
+    assert whois_record("example.com", registered=False).days_left is None
+
+
+def test_doc_round_trip_is_compact():
+    raw = whois_data("example.com", name_servers=["ns1.example.net"], whois_server="whois.example")
+    record = server.WhoisRecord.from_raw(raw)
+    doc = record.to_doc()
+    assert set(doc) <= set(server.WhoisRecord.STORED)
+    assert "status" not in doc
+    restored = server.WhoisRecord.from_doc(doc)
+    assert all(getattr(restored, key) == getattr(record, key) for key in server.WhoisRecord.STORED)
+    assert restored.expiry_at == record.expiry_at
+    assert restored.version != record.version
+
+
+def test_api_view_keeps_vendor_field_names():
+    data = whois_record("example.com").to_api()
+    assert data["domain_name"] == "example.com"
+    assert data["domain_registered"] == "yes"
+    assert data["domain_registrar"] == {"registrar_name": "Example Registrar"}
+    assert "registrant_contact" not in data
+    assert "name_servers" not in data
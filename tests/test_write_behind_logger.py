@@ -0,0 +1,102 @@
+import asyncio
+
+import server
+
+
+class SlowDatabase:
+    """Delegates to the in-memory database, with every insert taking a while"""
+
+    def __init__(self, database, delay):
+        self.database = database
+        self.delay = delay
+
+    def __getitem__(self, name):
+        collection = self.database[name]
+        delay = self.delay
+
+        class Slow:
+            async def insert_many(self, docs, **kwargs):
+                await asyncio.sleep(delay)
+                return await collection.insert_many(docs, **kwargs)
+
+        return Slow()
+
+
+def count(mongo, collection="bot_logs"):
+    return asyncio.run(mongo[collection].count_documents({}))
+
+
+def test_flushes_in_batches_of_flush_size(mongo):
+    logger = server.WriteBehindLogger(100, 4, 60)
+
+    async def scenario():
+        logger.start()
+        for i in range(10):
+            logger.enqueue("bot_logs", {"n": i})
+        await asyncio.sleep(0.05)
+        buffered = len(logger.buffer)
+        await logger.stop()
+        return buffered
+
+    # The size trigger wrote whole batches; the time trigger (60s) never fired
+    assert asyncio.run(scenario()) < 10
+    assert count(mongo) == 10
+    assert logger.counters["written"] == 10
+
+
+def test_drop_policies_count_what_they_drop():
+    newest = server.WriteBehindLogger(2, 10, 60, drop_policy="newest")
+    oldest = server.WriteBehindLogger(2, 10, 60, drop_policy="oldest")
+    for logger in (newest, oldest):
+        for i in range(3):
+            logger.enqueue("bot_logs", {"n": i})
+        assert logger.counters["dropped"] == 1
+    assert [doc["n"] for _, doc in newest.buffer] == [0, 1]
+    assert [doc["n"] for _, doc in oldest.buffer] == [1, 2]
+
+
+def test_stop_during_an_inflight_write_loses_nothing(mongo, monkeypatch):
+    monkeypatch.setattr(server, "db", SlowDatabase(mongo, 0.05))
+    logger = server.WriteBehindLogger(100, 3, 60)
+
+    async def scenario():
+        logger.start()
+        for i in range(13):
+            logger.enqueue("bot_logs", {"n": i})
+        # Let the flusher pop its first batch and start writing it
+        await asyncio.sleep(0.01)
+        await logger.stop()
+
+    asyncio.run(scenario())
+    assert count(mongo) == 13
+    assert logger.counters["written"] == 13
+    assert logger.counters["dropped"] == logger.counters["failed"] == 0
+
+
+def test_failed_writes_are_counted(monkeypatch):
+    class Broken:
+        def __getitem__(self, name):
+            class Collection:
+                async def insert_many(self, docs, **kwargs):
+                    raise RuntimeError("mongo down")
+            return Collection()
+
+    monkeypatch.setattr(server, "db", Broken())
+    logger = server.WriteBehindLogger(100, 10, 60)
+    logger.enqueue("bot_logs", {"n": 1})
+    asyncio.run(logger.flush())
+    assert logger.counters["failed"] == 1
+    assert not logger.buffer
+
+
+def test_can_restart_after_stop(mongo):
+    logger = server.WriteBehindLogger(100, 1, 60)
+
+    async def scenario():
+        for _ in range(2):
+            logger.start()
+            logger.enqueue("bot_logs", {"n": 1})
+            await logger.stop()
+
+    asyncio.run(scenario())
+    assert count(mongo) == 2